@@ -0,0 +1,101 @@
+"""Compare the time and peak memory of the image effects against NumPy versions of them."""
+
+import argparse
+import functools
+import multiprocessing
+import random
+import resource
+import time
+
+from PIL import Image
+from PIL import ImageDraw
+
+from plumeria.util import image as effects
+
+TINT = (255, 128, 0)
+
+
+def numpy_threshold(im, level=128):
+    np = effects.np
+    pixels = np.asarray(im.convert("L"))
+    return Image.fromarray(np.where(pixels >= level, 255, 0).astype(np.uint8)).convert("RGB")
+
+
+def numpy_tint(im, color, amount=0.5):
+    np = effects.np
+    pixels = np.array(im, dtype=np.float32)
+    pixels[..., :3] += (np.array(color, dtype=np.float32) - pixels[..., :3]) * amount
+    return Image.fromarray((pixels + 0.5).astype(np.uint8), im.mode)
+
+
+def numpy_reorder_channels(im, order):
+    np = effects.np
+    pixels = np.asarray(im)
+    indexes = ["RGB".index(c) for c in order.upper()] + list(range(3, pixels.shape[2]))
+    return Image.fromarray(np.ascontiguousarray(pixels[..., indexes]), im.mode)
+
+
+# name -> (PIL version, NumPy version), where trim is the same function with NumPy turned off
+CASES = {
+    "trim": (effects.trim, effects.trim),
+    "threshold": (effects.threshold, numpy_threshold),
+    "tint": (functools.partial(effects.tint, color=TINT), functools.partial(numpy_tint, color=TINT)),
+    "reorder_channels": (functools.partial(effects.reorder_channels, order="BGR"),
+                         functools.partial(numpy_reorder_channels, order="BGR")),
+}
+
+
+def make_image(size):
+    im = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(im)
+    rng = random.Random(0)
+    for i in range(500):
+        x = rng.randrange(size // 10, size * 9 // 10)
+        y = rng.randrange(size // 10, size * 9 // 10)
+        draw.ellipse((x, y, x + size // 20, y + size // 30), fill=tuple(rng.randrange(256) for _ in range(4)))
+    return im
+
+
+def run_case(case, use_numpy, size, repeat, results):
+    f = CASES[case][use_numpy]
+    if not use_numpy:
+        effects.np = None
+    im = make_image(size)
+    im = effects.replace_background(im, (255, 255, 255)).convert("RGB")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        f(im)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    results.put((elapsed, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark plumeria.util.image")
+    parser.add_argument("--size", type=int, default=3000, help="width and height of the test image")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if effects.np is None:
+        parser.error("NumPy needs to be installed to compare against it")
+
+    print("{:<20} {:>12} {:>12} {:>14} {:>14}".format("effect", "PIL ms", "NumPy ms", "PIL peak KB", "NumPy peak KB"))
+    for case in sorted(CASES):
+        row = []
+        for use_numpy in (False, True):
+            # a fresh process for each run so that the peak memory isn't shared
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_case, args=(case, use_numpy, args.size, args.repeat, results))
+            process.start()
+            row.append(results.get())
+            process.join()
+        (pil_time, pil_peak), (np_time, np_peak) = row
+        print("{:<20} {:>12.1f} {:>12.1f} {:>14} {:>14}".format(case, pil_time * 1000, np_time * 1000,
+                                                              pil_peak, np_peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import argparse
+import asyncio
 import csv
+import hashlib
 import json
 import logging
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from subprocess import Popen, PIPE
 from urllib.parse import urlparse
 
-import requests
+import aiohttp
 
 SFX_EXTS = {'.wav', '.mp3', '.mp4', '.ogg', '.m4a', '.flac'}
 NORMALIZE_PARAMS = {
@@ -15,99 +18,190 @@ NORMALIZE_PARAMS = {
     "output_tp": "-1.5",
     "output_lra": "11",
 }
+CHUNK_SIZE = 1024 * 16
+MANIFEST_FILENAME = ".normalize_manifest.json"
 
 
-def download_sfx(args):
-    with open(args.file, newline='') as f:
-        reader = csv.reader(f)
-        first = True
-        for row in reader:
-            if first and not args.no_header:
-                first = False
-                continue
+def get_download_path(args, row):
+    group, title, url = row
+    parsed_url = urlparse(url)
+
+    # get extension
+    _, raw_ext = os.path.splitext(parsed_url.path)
+    if raw_ext.lower() in SFX_EXTS:
+        ext = raw_ext.lower()
+    else:
+        ext = ".wav"
+
+    return os.path.join(args.out_dir, "{} - {}{}".format(group, title, ext))
 
+
+async def download_file(session, semaphore, url, out_path):
+    async with semaphore:
+        logging.info("downloading to {}".format(out_path))
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                raise IOError("HTTP code is not 200; got {}".format(resp.status))
+            # only complete downloads get the real name, so a failed one is retried on the next run
+            part_path = out_path + ".part"
+            try:
+                with open(part_path, 'wb') as f:
+                    while True:
+                        chunk = await resp.content.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+            except BaseException:
+                try:
+                    os.remove(part_path)
+                except OSError:
+                    pass
+                raise
+            os.replace(part_path, out_path)
+
+
+async def download_all(args, rows):
+    semaphore = asyncio.Semaphore(args.connections)
+    with aiohttp.ClientSession() as session:
+        jobs = []
+        for row in rows:
             try:
-                group, title, url = row
-                parsed_url = urlparse(url)
-
-                # get extension
-                _, raw_ext = os.path.splitext(parsed_url.path)
-                if raw_ext.lower() in SFX_EXTS:
-                    ext = raw_ext.lower()
-                else:
-                    ext = ".wav"
-
-                out_path = os.path.join(args.out_dir, "{} - {}{}".format(group, title, ext))
-                exists = os.path.exists(out_path)
-
-                if exists and not args.overwrite:
-                    logging.info("already exists: {} (use --overwrite)".format(out_path))
-                else:
-                    logging.info("downloading to {}".format(out_path))
-                    r = requests.get(url)
-                    with open(out_path, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=1024):
-                            if chunk:
-                                f.write(chunk)
+                out_path = get_download_path(args, row)
             except Exception as e:
                 logging.exception("failed to process row")
+                continue
+
+            if os.path.exists(out_path) and not args.overwrite:
+                logging.info("already exists: {} (use --overwrite)".format(out_path))
+            else:
+                jobs.append((out_path, download_file(session, semaphore, row[2], out_path)))
+
+        results = await asyncio.gather(*[job for _, job in jobs], return_exceptions=True)
+        for (out_path, _), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logging.error("failed to download {}: {}".format(out_path, result))
+
+
+def download_sfx(args):
+    with open(args.file, newline='') as f:
+        rows = list(csv.reader(f))
+    if not args.no_header:
+        rows = rows[1:]
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(download_all(args, rows))
+
+
+def hash_file(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(65536)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logging.warning("ignoring unreadable manifest {}".format(path))
+        return {}
+
+
+def save_manifest(path, manifest):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def normalize_file(in_path, out_path):
+    """Normalize a file using two passes of the loudnorm filter, returning whether it succeeded."""
+
+    # first pass
+    p = Popen(
+        ['ffmpeg', '-i', in_path, '-af', 'loudnorm=I={output_i}:TP={output_tp}:LRA={output_lra}:print_format=json'.format(**NORMALIZE_PARAMS), '-f', 'null', '-'],
+        stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    stdout, stderr = p.communicate()
+
+    if p.returncode != 0:
+        logging.error(
+            "failed to get params for normalization:\n\n{}".format(stderr.decode('utf-8', errors='ignore')))
+        return False
+
+    r = re.search("(\\{[^{]+)$", stderr.decode('utf-8'))
+    params = json.loads(r.group(1))
+    params.update(NORMALIZE_PARAMS)
+
+    # normalize
+    p = Popen(['ffmpeg', '-y', '-i', in_path, '-af',
+               'loudnorm=I={output_i}:TP={output_tp}:LRA={output_lra}:measured_I={input_i}:measured_LRA={input_lra}:'
+               'measured_TP={input_tp}:measured_thresh={input_thresh}:offset={target_offset}:'
+               'linear=true:print_format=summary'.format(**params), '-ar', '48k', out_path],
+              stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    stdout, stderr = p.communicate()
+
+    if p.returncode != 0:
+        logging.error("failed to normalize:\n\n{}".format(stderr.decode('utf-8', errors='ignore')))
+        return False
+
+    return True
 
 
 def normalize_sfx(args):
     if not os.path.exists(args.out_dir):
         os.makedirs(args.out_dir)
 
-    for file in os.listdir(args.in_dir):
-        in_path = os.path.join(args.in_dir, file)
-
-        # is it even a file?
-        if not os.path.isfile(in_path):
-            continue
-
-        # is an audio file?
-        _, ext = os.path.splitext(file)
-        if not ext.lower() in SFX_EXTS:
-            continue
+    # the manifest remembers what each output was made from, so unchanged files can be skipped
+    manifest_path = os.path.join(args.out_dir, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
 
-        out_path = os.path.join(args.out_dir, file)
-        exists = os.path.exists(out_path)
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {}
 
-        if exists and not args.overwrite:
-            logging.info("already exists: {} (use --overwrite)".format(out_path))
-        else:
-            logging.info("normalizing to {}...".format(out_path))
+        for file in os.listdir(args.in_dir):
+            in_path = os.path.join(args.in_dir, file)
 
-            # first pass
-            p = Popen(
-                ['ffmpeg', '-i', in_path, '-af', 'loudnorm=I={output_i}:TP={output_tp}:LRA={output_lra}:print_format=json'.format(**NORMALIZE_PARAMS), '-f', 'null', '-'],
-                stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            stdout, stderr = p.communicate()
+            # is it even a file?
+            if not os.path.isfile(in_path):
+                continue
 
-            if p.returncode != 0:
-                logging.error(
-                    "failed to get params for normalization:\n\n{}".format(stderr.decode('utf-8', errors='ignore')))
+            # is an audio file?
+            _, ext = os.path.splitext(file)
+            if not ext.lower() in SFX_EXTS:
                 continue
 
-            r = re.search("(\\{[^{]+)$", stderr.decode('utf-8'))
-            params = json.loads(r.group(1))
-            params.update(NORMALIZE_PARAMS)
+            out_path = os.path.join(args.out_dir, file)
+            entry = {'hash': hash_file(in_path), 'params': NORMALIZE_PARAMS}
 
-            # normalize
-            p = Popen(['ffmpeg', '-y', '-i', in_path, '-af',
-                       'loudnorm=I={output_i}:TP={output_tp}:LRA={output_lra}:measured_I={input_i}:measured_LRA={input_lra}:'
-                       'measured_TP={input_tp}:measured_thresh={input_thresh}:offset={target_offset}:'
-                       'linear=true:print_format=summary'.format(**params), '-ar', '48k', out_path],
-                      stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            stdout, stderr = p.communicate()
+            if os.path.exists(out_path) and manifest.get(file) == entry and not args.overwrite:
+                logging.debug("unchanged: {}".format(out_path))
+            else:
+                logging.info("normalizing to {}...".format(out_path))
+                futures[executor.submit(normalize_file, in_path, out_path)] = (file, entry)
 
-            if p.returncode != 0:
-                logging.error("failed to normalize:\n\n{}".format(stderr.decode('utf-8', errors='ignore')))
-                continue
+        for future in as_completed(futures):
+            file, entry = futures[future]
+            try:
+                succeeded = future.result()
+            except Exception as e:
+                logging.exception("failed to normalize {}".format(file))
+                succeeded = False
+            if succeeded:
+                manifest[file] = entry
+                save_manifest(manifest_path, manifest)
+            else:
+                manifest.pop(file, None)
 
 
 def main():
     logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO)
-    logging.getLogger('requests').setLevel(logging.WARNING)
+    logging.getLogger('aiohttp').setLevel(logging.WARNING)
 
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers(dest='action')
@@ -117,12 +211,16 @@ def main():
     subparser.set_defaults(func=download_sfx)
     subparser.add_argument('--no-header', action='store_true')
     subparser.add_argument('--overwrite', action='store_true')
+    subparser.add_argument('--connections', type=int, default=8,
+                           help="the number of files to download at the same time")
     subparser.add_argument('file')
     subparser.add_argument('out_dir')
 
     subparser = subparsers.add_parser('normalize')
     subparser.set_defaults(func=normalize_sfx)
     subparser.add_argument('--overwrite', action='store_true')
+    subparser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                           help="the number of files to normalize at the same time")
     subparser.add_argument('in_dir')
     subparser.add_argument('out_dir')
 
@@ -1,15 +1,31 @@
 """Fetch bible passages from the English Standard Version."""
 
-from bs4 import BeautifulSoup
-from bs4 import Comment
-from bs4 import NavigableString
-
 import plumeria.util.http as http
 from plumeria.command import commands, CommandError
 from plumeria.command.parse import Text
+from plumeria.util.markup import extract, parse_xml
 from plumeria.util.ratelimit import rate_limit
 
 
+def read_verses(text):
+    """Get the number and text of each verse in a passage, or None if there is no passage."""
+    root = parse_xml(text)
+    passage = root.find(".//passage") if root is not None else None
+    if passage is None:
+        return None
+    verses = []
+    for verse_unit in passage.iterfind("content/verse-unit"):
+        num = int(verse_unit.findtext("verse-num"))
+        woc = verse_unit.find("woc")
+        if woc is not None:
+            text = "".join(woc.itertext())
+        else:
+            # only the text directly inside the verse, which leaves out the verse number and notes
+            text = (verse_unit.text or "") + "".join(child.tail or "" for child in verse_unit)
+        verses.append((num, text.strip()))
+    return verses
+
+
 @commands.create("bible", "esv", category="Search", params=[Text('verse')])
 @rate_limit()
 async def search_esv(message, verse):
@@ -28,19 +44,10 @@ async def search_esv(message, verse):
         "include-simple-entities": "true",
     })
 
-    doc = BeautifulSoup(r.text(), features="lxml")
-    if not doc.passage:
+    verses = await extract(read_verses, r.text())
+    if not verses:
         raise CommandError("Verse not found.")
-    lines = []
-    for verse_unit in doc.passage.content.find_all('verse-unit'):
-        num = int(verse_unit.find('verse-num').text)
-        woc = verse_unit.find('woc')
-        if woc:
-            text = woc.text
-        else:
-            text = "".join([str(node) for node in verse_unit.children
-                            if isinstance(node, NavigableString) and not isinstance(node, Comment)])
-        lines.append("**{}** {}".format(num, text.strip()))
+    lines = ["**{}** {}".format(num, text) for num, text in verses]
     return "\n".join(lines)
 
 
@@ -1,9 +1,100 @@
 """Commands to get statistics about the bot instance."""
 
+import asyncio
+import time
+
+from aiohttp.web import json_response
+
 from plumeria.command import commands
+from plumeria.core.webserver import app
+from plumeria.event import bus
+from plumeria.metrics import metrics
 from plumeria.transport import transports
+from plumeria.util.hyperloglog import HyperLogLog
 from plumeria.util.ratelimit import rate_limit
 
+__requires__ = ['plumeria.core.webserver']
+
+LAG_CHECK_INTERVAL = 1
+
+event_loop_lag = metrics.gauge("event_loop_lag_seconds", "How late the event loop ran a callback scheduled a second ahead")
+
+
+class BotStatistics:
+    """
+    Keeps running counts of servers, channels and members that are updated from transport
+    events, so that reading them doesn't have to walk every server.
+
+    Unique users are estimated with a :class:`HyperLogLog`, so users that have left are still counted.
+
+    """
+
+    def __init__(self):
+        self.servers = {}  # server perma ID -> [channel count, member count]
+        self.channel_count = 0
+        self.member_count = 0
+        self.users = HyperLogLog()
+
+    def _adjust(self, server, channels=0, members=0):
+        counts = self.servers.get(server.perma_id)
+        if counts:
+            counts[0] += channels
+            counts[1] += members
+            self.channel_count += channels
+            self.member_count += members
+
+    def add_server(self, server):
+        self.remove_server(server)
+        channel_count = len(server.channels)
+        member_count = 0
+        for member in server.members:
+            member_count += 1
+            self.users.add(member.id)
+        self.servers[server.perma_id] = [channel_count, member_count]
+        self.channel_count += channel_count
+        self.member_count += member_count
+
+    def remove_server(self, server):
+        counts = self.servers.pop(server.perma_id, None)
+        if counts:
+            self.channel_count -= counts[0]
+            self.member_count -= counts[1]
+
+    def add_member(self, member):
+        self._adjust(member.server, members=1)
+        self.users.add(member.id)
+
+    def remove_member(self, member):
+        self._adjust(member.server, members=-1)
+
+    def add_channel(self, channel):
+        if channel.server:
+            self._adjust(channel.server, channels=1)
+
+    def remove_channel(self, channel):
+        if channel.server:
+            self._adjust(channel.server, channels=-1)
+
+    def to_dict(self):
+        return {
+            "transports": len(transports.transports),
+            "servers": len(self.servers),
+            "channels": self.channel_count,
+            "members": self.member_count,
+            "unique_users": len(self.users),
+        }
+
+
+statistics = BotStatistics()
+
+
+async def monitor_event_loop_lag():
+    loop = asyncio.get_event_loop()
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(LAG_CHECK_INTERVAL)
+        event_loop_lag.set(max(0, time.monotonic() - start - LAG_CHECK_INTERVAL))
+
 
 @commands.create("stats", "statistics", category="Search", params=[])
 @rate_limit()
@@ -11,33 +102,56 @@ async def stats(message):
     """
     Get statistics for the bot, like the number of servers it is on.
     """
-    transport_count = len(transports.transports)
-    server_count = 0
-    channel_count = 0
-    member_count = 0
-    member_ids = set()
-
-    for transport in transports.transports.values():
-        for server in transport.servers:
-            server_count += 1
-            for channel in server.channels:
-                channel_count += 1
-            for member in server.members:
-                member_count += 1
-                member_ids.add(member.id)
-
+    counts = statistics.to_dict()
     return "Software: Plumeria (<https://github.com/sk89q/Plumeria>)\n" \
            "# transports: {}\n" \
            "# servers: {}\n" \
            "# channels: {}\n" \
-           "# seen users: {} ({} unique) [not accurate]".format(
-        transport_count,
-        server_count,
-        channel_count,
-        member_count,
-        len(member_ids),
+           "# seen users: {} (~{} unique) [not accurate]".format(
+        counts['transports'],
+        counts['servers'],
+        counts['channels'],
+        counts['members'],
+        counts['unique_users'],
     )
 
 
+@app.route('/stats.json')
+async def handle(request):
+    return json_response({
+        "statistics": statistics.to_dict(),
+        "metrics": metrics.snapshot(),
+    })
+
+
 def setup():
     commands.add(stats)
+    app.add(handle)
+
+    @bus.event('server.ready')
+    async def server_ready(server):
+        statistics.add_server(server)
+
+    @bus.event('server.unready')
+    async def server_unready(server):
+        statistics.remove_server(server)
+
+    @bus.event('server.member.join')
+    async def member_join(member):
+        statistics.add_member(member)
+
+    @bus.event('server.member.remove')
+    async def member_remove(member):
+        statistics.remove_member(member)
+
+    @bus.event('channel.create')
+    async def channel_create(channel):
+        statistics.add_channel(channel)
+
+    @bus.event('channel.delete')
+    async def channel_delete(channel):
+        statistics.remove_channel(channel)
+
+    @bus.event('init')
+    async def init():
+        asyncio.get_event_loop().create_task(monitor_event_loop_lag())
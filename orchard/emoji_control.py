@@ -1,6 +1,5 @@
 """Commands to manage emoji on a server."""
 
-import asyncio
 import io
 import re
 
@@ -9,6 +8,7 @@ from plumeria.message import Message
 from plumeria.message.image import read_image
 from plumeria.perms import have_all_perms
 from plumeria.transport.transport import ForbiddenError
+from plumeria.util.executor import executors
 
 VALID_EMOJI_NAME_RE = re.compile("^[A-Za-z0-9_]{2,20}$")
 
@@ -27,7 +27,7 @@ async def create_emoji(message: Message):
 
     Requires an input image.
     """
-    attachment = await read_image(message)
+    attachment = await read_image(message, size=(128, 128))
     if not attachment:
         raise CommandError("No image is available to process.")
 
@@ -40,7 +40,7 @@ async def create_emoji(message: Message):
         attachment.image.save(buffer, "png")
         return buffer.getvalue()
 
-    image_data = await asyncio.get_event_loop().run_in_executor(None, execute)
+    image_data = await executors.run("cpu", execute)
 
     try:
         # first delete existing emoji
@@ -1,6 +1,5 @@
 """Render charts and graphs using matplotlib."""
 
-import asyncio
 import io
 import re
 import threading
@@ -9,11 +8,12 @@ import matplotlib
 import numpy as np
 import pkg_resources
 from PIL import Image
-from PIL import ImageChops
 
 from plumeria.command import commands, CommandError
 from plumeria.message import Response, MemoryAttachment, ImageAttachment
 from plumeria.message.lists import parse_list, parse_numeric_list
+from plumeria.util.executor import executors
+from plumeria.util.image import trim
 from plumeria.util.ratelimit import rate_limit
 
 matplotlib.use('Agg')
@@ -30,15 +30,6 @@ font_path = pkg_resources.resource_filename("plumeria", 'fonts/FiraSans-Regular.
 lock = threading.RLock()
 
 
-def trim_whitespace(im):
-    bg = Image.new(im.mode, im.size, im.getpixel((0, 0)))
-    diff = ImageChops.difference(im, bg)
-    diff = ImageChops.add(diff, diff, 2.0, -100)
-    bbox = diff.getbbox()
-    if bbox:
-        return im.crop(bbox)
-
-
 def extract_data(message, pattern, normalize=False):
     title = None
     labels = []
@@ -102,7 +93,7 @@ async def pie(message):
             plt.clf()
         return buf
 
-    buf = await asyncio.get_event_loop().run_in_executor(None, execute)
+    buf = await executors.run("cpu", execute)
 
     return Response("", attachments=[MemoryAttachment(buf, "graph.png", "image/png")])
 
@@ -152,7 +143,7 @@ async def bar(message):
             plt.clf()
         return buf
 
-    buf = await asyncio.get_event_loop().run_in_executor(None, execute)
+    buf = await executors.run("cpu", execute)
 
     return Response("", attachments=[MemoryAttachment(buf, "graph.png", "image/png")])
 
@@ -189,7 +180,7 @@ async def histogram(message):
             plt.clf()
         return buf
 
-    buf = await asyncio.get_event_loop().run_in_executor(None, execute)
+    buf = await executors.run("cpu", execute)
 
     return Response("", attachments=[MemoryAttachment(buf, "graph.png", "image/png")])
 
@@ -218,10 +209,10 @@ async def latex(message):
                 raise CommandError("Render error: {}".format(str(e)))
             plt.clf()
             im = Image.open(buf)
-            im = trim_whitespace(im)
+            im = trim(im)
             return im
 
-    im = await asyncio.get_event_loop().run_in_executor(None, execute)
+    im = await executors.run("cpu", execute)
 
     return Response("", attachments=[ImageAttachment(im, "text.png")])
 
@@ -3,45 +3,78 @@
 import asyncio
 import io
 import os
-import subprocess
 import threading
 
+import cachetools
 import dot_parser
 from dot_parser import graph_definition
 from pyparsing import ParseException
 
+from plumeria import config
 from plumeria.command import commands, CommandError
 from plumeria.message import Response, MemoryAttachment
+from plumeria.util.executor import executors
 from plumeria.util.message import strip_markdown_code
 from plumeria.util.ratelimit import rate_limit
 
-lock = threading.RLock()
+render_timeout = config.create("graphviz", "timeout",
+                               type=float,
+                               fallback=10,
+                               comment="Number of seconds that Graphviz can take to draw a graph before it is stopped")
+
+max_processes = config.create("graphviz", "max_processes",
+                              type=int,
+                              fallback=2,
+                              comment="Number of Graphviz processes that can run at the same time")
+
+cache_size = config.create("graphviz", "cache_size",
+                           type=int,
+                           fallback=16,
+                           comment="Total size in MB of drawn graphs to keep for repeated requests")
+
+lock = threading.Lock()
+parser = None
+processes = None  # limits the number of Graphviz processes, created in setup()
+canonical_cache = cachetools.LRUCache(maxsize=256)  # DOT text as given -> DOT text written out by pydot
+render_cache = None  # DOT text written out by pydot -> PNG, created in setup()
+rendering = {}  # DOT text written out by pydot -> future for renders in progress
 
 
 def parse_dot_data(s):
+    global parser
     with lock:
-        dot_parser.top_graphs = []  # Clear list of existing graphs because this module is bad
-        parser = graph_definition()
-        parser.parseWithTabs()
-        tokens = parser.parseString(s)
-        return list(tokens)
+        if parser is None:
+            parser = graph_definition()
+            parser.parseWithTabs()
+        dot_parser.top_graphs = []  # the parse actions collect graphs in this module global, so clear it
+        return list(parser.parseString(s))
 
 
-def render_dot(graph, format="png"):
+async def render_dot(data, format="png"):
     program = 'dot'
     if os.name == 'nt' and not program.endswith('.exe'):
         program += '.exe'
 
-    p = subprocess.Popen(
-        [program, '-T' + format],
-        env={'SERVER_NAME': 'plumeria',
-             'GV_FILE_PATH': '/dev/null'},
-        shell=False,
-        stdin=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        stdout=subprocess.PIPE)
-
-    stdout, stderr = p.communicate(input=graph.to_string().encode('utf-8'))
+    with await processes:
+        p = await asyncio.create_subprocess_exec(
+            program, '-T' + format,
+            env={'SERVER_NAME': 'plumeria',
+                 'GV_FILE_PATH': '/dev/null'},
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE)
+
+        try:
+            stdout, stderr = await asyncio.wait_for(p.communicate(input=data), render_timeout())
+        except asyncio.TimeoutError:
+            raise CommandError("Graphviz took too long to draw the graph.")
+        finally:
+            if p.returncode is None:  # timed out or cancelled
+                try:
+                    p.kill()
+                except ProcessLookupError:
+                    pass
+                await p.wait()
 
     if p.returncode != 0:
         raise Exception("Received non-zero return code from grapviz\n\nError: {}".format(stderr.decode('utf-8')))
@@ -49,21 +82,45 @@ def render_dot(graph, format="png"):
     return stdout
 
 
+async def to_canonical(source):
+    try:
+        return canonical_cache[source]
+    except KeyError:
+        pass
+    try:
+        # Use parser as a rudimentary validator
+        graph = (await executors.run("cpu", parse_dot_data, source))[0]
+    except ParseException as e:
+        raise CommandError("Parse error: {}".format(str(e)))
+    # written out again by pydot, so formatting differences go away but quoted text is kept exactly
+    canonical = canonical_cache[source] = graph.to_string()
+    return canonical
+
+
+async def draw(canonical):
+    png = await render_dot(canonical.encode('utf-8'), format="png")
+    try:
+        render_cache[canonical] = png
+    except ValueError:  # larger than the whole cache
+        pass
+    return png
+
+
 async def handle_request(message, type):
     content = strip_markdown_code(message.content.strip())
-
-    def execute():
-        # Use parser as a rudimentary validator
-        graph = parse_dot_data(type + " G {\n" + content + "\n}")[0]
-        buf = io.BytesIO()
-        buf.write(render_dot(graph, format="png"))
-        return buf
+    canonical = await to_canonical(type + " G {\n" + content + "\n}")
 
     try:
-        buf = await asyncio.get_event_loop().run_in_executor(None, execute)
-        return Response("", attachments=[MemoryAttachment(buf, "graph.png", "image/png")])
-    except ParseException as e:
-        raise CommandError("Parse error: {}".format(str(e)))
+        png = render_cache[canonical]
+    except KeyError:
+        # identical requests that arrive while the first is still drawing share its result
+        future = rendering.get(canonical)
+        if future is None:
+            future = rendering[canonical] = asyncio.ensure_future(draw(canonical))
+            future.add_done_callback(lambda f: rendering.pop(canonical, None))
+        png = await asyncio.shield(future)
+
+    return Response("", attachments=[MemoryAttachment(io.BytesIO(png), "graph.png", "image/png")])
 
 
 @commands.create("graph", category="Graphing")
@@ -101,5 +158,14 @@ async def digraph(message):
 
 
 def setup():
+    global processes, render_cache
+
+    config.add(render_timeout)
+    config.add(max_processes)
+    config.add(cache_size)
+
+    processes = asyncio.Semaphore(max_processes())
+    render_cache = cachetools.LRUCache(maxsize=cache_size() * 1024 * 1024, getsizeof=len)
+
     commands.add(graph)
     commands.add(digraph)
@@ -1,9 +1,9 @@
-import asyncio
+import functools
 import random
 import re
+import struct
 
 import PIL
-import cachetools
 import pkg_resources
 from PIL import Image
 from PIL import ImageDraw
@@ -13,7 +13,11 @@ from plumeria.command import CommandError
 from plumeria.command import commands, channel_only
 from plumeria.command.parse import Word
 from plumeria.config.common import games_allowed_only
+from plumeria.core.game_state import game_states
 from plumeria.message import ImageAttachment, Response
+from plumeria.util.executor import executors
+
+__requires__ = ['plumeria.core.game_state']
 
 with pkg_resources.resource_stream(__name__, "assets/Scribble Scrawl.ttf") as f:
     guess_font = ImageFont.truetype(f, 18)
@@ -22,20 +26,102 @@ with pkg_resources.resource_stream(__name__, "assets/Scribble Scrawl.ttf") as f:
 with pkg_resources.resource_stream(__name__, "assets/word_list.txt") as f:
     word_list = list(filter(len, f.read().decode('utf-8').splitlines()))
 
-cache = cachetools.LRUCache(maxsize=1000)
+IMAGE_SIZE = (450, 170)
+GRAPHIC_SIZE = (1000, 150)
+TEXT_LEFT = 120
+FRAME_COLORS = 240
+INK_LEVELS = 8
+PHRASE_INK = (0, 0, 0)
+GUESSED_INK = (100, 100, 100)
+PHRASE_INK_INDEX = FRAME_COLORS
+GUESSED_INK_INDEX = FRAME_COLORS + INK_LEVELS
 
 
 def normalize(s):
     return re.sub(" +", "", s.strip()).upper()
 
 
+def ink_ramp(ink):
+    """Build palette entries that blend white into the given ink color."""
+    ramp = []
+    for level in range(INK_LEVELS):
+        alpha = level / (INK_LEVELS - 1)
+        ramp.extend(round(255 + (c - 255) * alpha) for c in ink)
+    return ramp
+
+
+@functools.lru_cache(maxsize=None)
+def get_frame(wrong_count: int) -> PIL.Image.Image:
+    """
+    Get the blank palette canvas for the given number of wrong guesses.
+
+    The gallows graphic is only thumbnailed and quantized once per state, and the
+    last palette entries are reserved for the anti-aliased text ramps so that text can
+    be composited onto a copy without quantizing the whole image again.
+
+    """
+    with pkg_resources.resource_stream(__name__, "assets/{}.png".format(wrong_count)) as f:
+        graphic = Image.open(f).convert('RGB')
+    graphic.thumbnail(GRAPHIC_SIZE, Image.ANTIALIAS)
+    im = Image.new("RGB", IMAGE_SIZE, "white")
+    im.paste(graphic, (5, 5))
+    im = im.quantize(colors=FRAME_COLORS)
+    palette = im.getpalette()[:FRAME_COLORS * 3]
+    palette.extend([0] * (FRAME_COLORS * 3 - len(palette)))
+    palette.extend(ink_ramp(PHRASE_INK))
+    palette.extend(ink_ramp(GUESSED_INK))
+    im.putpalette(palette)
+    return im
+
+
+@functools.lru_cache(maxsize=32)
+def create_text_layer(obscured: str, guessed: str):
+    """
+    Render the phrase and the guessed letters into a layer of palette indices and a mask
+    that can be pasted onto a frame from :func:`get_frame`. The text is always drawn on the
+    white part of the canvas, so the ramps only need to blend against white.
+
+    """
+    phrase = Image.new("L", IMAGE_SIZE, 0)
+    draw = ImageDraw.Draw(phrase)
+    for i, line in enumerate(obscured.split(" ")):
+        draw.text((TEXT_LEFT, 5 + i * 40), line.upper(), 255, font=guess_font)
+    guessed_letters = Image.new("L", IMAGE_SIZE, 0)
+    ImageDraw.Draw(guessed_letters).text((TEXT_LEFT, 130), "Guessed: {}".format(guessed), 255, font=guessed_font)
+
+    step = 256 // INK_LEVELS
+    layer = Image.new("L", IMAGE_SIZE, 0)
+    mask = Image.new("1", IMAGE_SIZE, 0)
+    for base, coverage in ((GUESSED_INK_INDEX, guessed_letters), (PHRASE_INK_INDEX, phrase)):
+        levels = coverage.point(lambda v: v // step)
+        inked = levels.point(lambda v: 255 if v else 0, "1")
+        layer.paste(levels.point(lambda v: base + v), (0, 0), inked)
+        mask.paste(1, (0, 0), inked)
+    # L -> P keeps the pixel values as they are, so they become the palette indices
+    return layer.convert("P"), mask
+
+
 class Game:
-    def __init__(self, phrase: str):
+    """
+    The state of a game of hangman, which can be packed into a few bytes with :meth:`pack`.
+
+    The obscured phrase isn't stored because it can be worked out from the letters guessed.
+
+    """
+
+    __slots__ = ('phrase', 'guessed', 'phrases_guessed', 'wrong_count')
+
+    def __init__(self, phrase: str, guessed="", phrases_guessed=(), wrong_count=0):
         self.phrase = normalize(phrase)
-        self.obscured = list(re.sub("[A-Z]", "_", self.phrase))
-        self.guessed = []
-        self.phrases_guessed = set()
-        self.wrong_count = 0
+        self.guessed = guessed
+        self.phrases_guessed = tuple(phrases_guessed)
+        self.wrong_count = wrong_count
+
+    @property
+    def obscured(self):
+        if self.phrase in self.phrases_guessed:
+            return self.phrase
+        return re.sub("[A-Z]", lambda m: m.group(0) if m.group(0) in self.guessed else "_", self.phrase)
 
     def guess(self, guess: str):
         guess = normalize(guess)
@@ -44,11 +130,8 @@ class Game:
         if re.match("^[A-Za-z]{1}$", guess):
             if guess in self.guessed:
                 raise CommandError("'{}' was already guessed!".format(guess))
-            self.guessed.append(guess)
+            self.guessed += guess
             if guess in self.phrase:
-                for i, l in enumerate(self.phrase):
-                    if l == guess:
-                        self.obscured[i] = l
                 return "You got **{}**!".format(guess)
             else:
                 self.wrong_count += 1
@@ -56,9 +139,8 @@ class Game:
         else:
             if guess in self.phrases_guessed:
                 raise CommandError("'{}' was already guessed!".format(guess))
-            self.phrases_guessed.add(guess)
+            self.phrases_guessed += (guess,)
             if guess == self.phrase:
-                self.obscured = list(self.phrase)
                 return "You got the phrase!"
             else:
                 self.wrong_count += 1
@@ -72,20 +154,34 @@ class Game:
     def lost(self):
         return self.wrong_count >= 6
 
+    def pack(self) -> bytes:
+        strings = [s.encode('utf-8') for s in (self.phrase, self.guessed) + self.phrases_guessed]
+        data = bytearray(struct.pack("<BB", self.wrong_count, len(strings)))
+        for s in strings:
+            data += struct.pack("<H", len(s))
+            data += s
+        return bytes(data)
+
+    @classmethod
+    def unpack(cls, data: bytes):
+        wrong_count, count = struct.unpack_from("<BB", data)
+        offset = 2
+        strings = []
+        for i in range(count):
+            length, = struct.unpack_from("<H", data, offset)
+            offset += 2
+            strings.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        return cls(strings[0], strings[1], strings[2:], wrong_count)
+
     def create_image(self) -> PIL.Image.Image:
-        with pkg_resources.resource_stream(__name__, "assets/{}.png".format(self.wrong_count)) as f:
-            graphic = Image.open(f).convert('RGB')
-        im = Image.new("RGB", (450, 170), "white")
-        graphic.thumbnail((1000, 150), Image.ANTIALIAS)
-        im.paste(graphic, (5, 5))
-        draw = ImageDraw.Draw(im)
-        for i, line in enumerate("".join(self.obscured).split(" ")):
-            draw.text((120, 5 + i * 40), line.upper(), (0, 0, 0), font=guess_font)
-        draw.text((120, 130), "Guessed: {}".format("".join(self.guessed)), (100, 100, 100), font=guessed_font)
+        layer, mask = create_text_layer(self.obscured, self.guessed)
+        im = get_frame(self.wrong_count).copy()
+        im.paste(layer, (0, 0), mask)
         return im
 
     async def create_image_async(self):
-        return await asyncio.get_event_loop().run_in_executor(None, self.create_image)
+        return await executors.run("cpu", self.create_image)
 
 
 @commands.create("hangman start", "hang start", "h start", category="Games", params=[])
@@ -102,11 +198,13 @@ async def start(message):
     """
     key = (message.transport.id, message.server.id, message.channel.id)
 
-    if key in cache:
-        game = cache[key]
-    else:
-        game = Game(random.choice(word_list))
-        cache[key] = game
+    with await game_states.lock("hangman", key):
+        state = await game_states.get("hangman", key)
+        if state:
+            game = Game.unpack(state)
+        else:
+            game = Game(random.choice(word_list))
+            await game_states.put("hangman", key, game.pack())
 
     return Response("", attachments=[ImageAttachment(await game.create_image_async(), "hangman.png")])
 
@@ -129,20 +227,24 @@ async def guess(message, guess):
     """
     key = (message.transport.id, message.server.id, message.channel.id)
 
-    try:
-        game = cache[key]
-    except KeyError:
-        raise CommandError("Say 'start' to start a game first.")
+    with await game_states.lock("hangman", key):
+        state = await game_states.get("hangman", key)
+        if not state:
+            raise CommandError("Say 'start' to start a game first.")
+        game = Game.unpack(state)
+
+        message = game.guess(guess)
 
-    message = game.guess(guess)
+        if game.won or game.lost:
+            await game_states.remove("hangman", key)
+        else:
+            await game_states.put("hangman", key, game.pack())
 
     if game.won:
-        del cache[key]
         return Response("\N{TROPHY} \N{TROPHY} WINNER WINNER CHICKEN DINNER!! \N{TROPHY} \N{TROPHY}", attachments=[
             ImageAttachment(await game.create_image_async(), "hangman.png")
         ])
     elif game.lost:
-        del cache[key]
         return Response("\N{LARGE RED CIRCLE} You all LOST! The phrase was **{}**".format(game.phrase), attachments=[
             ImageAttachment(await game.create_image_async(), "hangman.png")
         ])
@@ -1,6 +1,5 @@
 """Image manipulation and creation."""
 
-import asyncio
 from colour import Color
 import shlex
 import textwrap
@@ -9,8 +8,10 @@ import pkg_resources
 from PIL import Image, ImageFilter, ImageDraw, ImageFont
 from plumeria.command import commands, ArgumentParser, CommandError
 from plumeria.message import Response, ImageAttachment
+from plumeria.util.executor import executors
 from plumeria.util.ratelimit import rate_limit
 from plumeria.util.command import image_filter
+from plumeria.util.image import replace_background, threshold, tint, reorder_channels
 
 MARGIN = 20
 TEXT_WIDTH = 50
@@ -18,6 +19,14 @@ with pkg_resources.resource_stream("plumeria", 'fonts/FiraSans-Regular.ttf') as
     FONT = ImageFont.truetype(f, 22)
 
 
+def parse_color(s):
+    try:
+        color = Color(s)
+    except ValueError:
+        raise CommandError("Supplied text isn't a valid color.")
+    return int(color.red * 255), int(color.green * 255), int(color.blue * 255)
+
+
 @commands.create('drawtext', category='Image')
 @rate_limit(burst_size=2)
 async def drawtext(message):
@@ -54,7 +63,7 @@ async def drawtext(message):
 
         return im
 
-    im = await asyncio.get_event_loop().run_in_executor(None, execute)
+    im = await executors.run("cpu", execute)
     return Response("", [ImageAttachment(im, "text.png")])
 
 
@@ -137,18 +146,27 @@ def sharpen(message, im):
 
 
 @commands.create('bw', 'blackandwhite', 'blacknwhite', 'blackwhite', category='Image')
-@image_filter
+@image_filter(alpha=False)
 def bw(message, im):
     """
-    Applies a black and white effect. There is currently very poor dithering.
+    Applies a black and white effect. There is currently very poor dithering, so
+    a brightness level from 0 to 255 can be given to cut off at instead.
 
     Example::
 
         /drawtext Hello there! | bw
+        /drawtext Hello there! | bw --threshold 100
 
     Requires an input image.
     """
-    return im.convert('1').convert("RGB")
+    parser = ArgumentParser()
+    parser.add_argument("--threshold", "-t", type=int)
+    args = parser.parse_args(shlex.split(message.content))
+    if args.threshold is None:
+        return im.convert('1').convert("RGB")
+    if not 0 <= args.threshold <= 255:
+        raise CommandError("The threshold must be between 0 and 255.")
+    return threshold(im, args.threshold)
 
 
 @commands.create('square', category='Image')
@@ -185,16 +203,48 @@ def bg(message, im):
     Requires an input image.
     """
     args = message.content.strip()
-    if len(args):
-        try:
-            color = Color(args)
-        except ValueError:
-            raise CommandError("Supplied text isn't a valid color.")
-    else:
-        color = Color("white")
-    background = Image.new('RGBA', im.size, (int(color.red * 255), int(color.green * 255), int(color.blue * 255), 255))
-    background.paste(im, (0, 0), im)
-    return background
+    return replace_background(im, parse_color(args if len(args) else "white"))
+
+
+@commands.create('tint', 'colorize', category='Image')
+@image_filter
+def colorize(message, im):
+    """
+    Tint the image towards a color. The amount of tint is from 0 to 1 and is 0.5 by default.
+
+    Example::
+
+        /drawtext Hello there! | tint red
+        /drawtext Hello there! | tint red --amount 0.25
+
+    Requires an input image.
+    """
+    parser = ArgumentParser()
+    parser.add_argument("color")
+    parser.add_argument("--amount", "-a", type=float, default=0.5)
+    args = parser.parse_args(shlex.split(message.content))
+    if not 0 <= args.amount <= 1:
+        raise CommandError("The amount must be between 0 and 1.")
+    return tint(im, parse_color(args.color), args.amount)
+
+
+@commands.create('channels', 'swapchannels', category='Image')
+@image_filter
+def swapchannels(message, im):
+    """
+    Rearrange the red, green and blue channels of the image, given as the channel to
+    take each of red, green and blue from.
+
+    Example::
+
+        /drawtext Hello there! | channels bgr
+
+    Requires an input image.
+    """
+    try:
+        return reorder_channels(im, message.content.strip())
+    except ValueError:
+        raise CommandError("Give three channels made of R, G and B, like BGR.")
 
 
 def setup():
@@ -207,3 +257,5 @@ def setup():
     commands.add(bw)
     commands.add(square)
     commands.add(bg)
+    commands.add(colorize)
+    commands.add(swapchannels)
@@ -1,52 +1,100 @@
 """Commands to get the last message, image, or URL."""
 
-import collections
+import asyncio
 import re
 
+import cachetools
+
+from plumeria import config
 from plumeria.command import commands, CommandError, channel_only
+from plumeria.core.history import history as channel_history
 from plumeria.event import bus
 from plumeria.message import Response
 
-LINK_PATTERN = re.compile("https?://([^ ><]+)", re.I)
-IMAGE_PATTERN = re.compile("https?://([^ ><]+)\\.(?:png|jpe?g|gif)", re.I)
+__requires__ = ['plumeria.core.history']
+
+LINK_PATTERN = re.compile("https?://[^ ><]+", re.I)
+IMAGE_PATTERN = re.compile(".+\\.(?:png|jpe?g|gif)", re.I)
+
+max_channels = config.create("last", "max_channels", type=int, fallback=2000,
+                             comment="The maximum number of channels to remember the last message, image and URL for")
 
 
 class LastMessage:
+    __slots__ = ('_loaded', '_loading', 'last_text', 'last_url', 'last_image')
+
     def __init__(self):
         self._loaded = False
+        self._loading = None
         self.last_text = None
         self.last_url = None
-        self.last_image = None
+        self.last_image = None  # either a URL or an attachment
 
     @property
     def loaded(self):
         return self._loaded or (self.last_text and self.last_url and self.last_image)
 
     def read(self, message):
-        m = LINK_PATTERN.search(message.content)
-        if m:
-            self.last_url = Response(m.group(0))
-        m = IMAGE_PATTERN.search(message.content)
-        if m:
-            self.last_image = Response(m.group(0))
-        else:
+        content = message.content
+        image_found = False
+        if "://" in content:
+            for i, m in enumerate(LINK_PATTERN.finditer(content)):
+                if i == 0:
+                    self.last_url = m.group(0)
+                image = IMAGE_PATTERN.match(m.group(0))
+                if image:
+                    self.last_image = image.group(0)
+                    image_found = True
+                    break
+        if not image_found:
             for attachment in message.attachments:
                 if attachment.mime_type.startswith("image/"):
-                    self.last_image = Response("", attachments=[attachment.copy()])
-        if len(message.content.strip()) and not commands.matches_command(message.content):
-            self.last_text = Response(message.content)
+                    self.last_image = attachment
+        if len(content.strip()) and not commands.matches_command(content):
+            self.last_text = content
+
+    async def _load(self, channel):
+        try:
+            messages = await channel_history.get_recent(channel, limit=100)
+            # read the history into a separate entry so that it doesn't overwrite anything newer
+            # that was read while the history was being fetched
+            loaded = LastMessage()
+            for message in reversed(messages):
+                loaded.read(message)
+            for name in ('last_text', 'last_url', 'last_image'):
+                if getattr(self, name) is None:
+                    setattr(self, name, getattr(loaded, name))
+            self._loaded = True
+        finally:
+            self._loading = None
 
     async def load_if_unloaded(self, channel):
         if not self.loaded:
-            messages = []
-            async for message in channel.get_history(limit=100):
-                messages.insert(0, message)
-            for message in messages:
-                self.read(message)
-            self._loaded = True
+            # only fetch the history once if several commands want it at the same time
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(self._load(channel))
+            await asyncio.shield(self._loading)
+
+
+history = cachetools.LRUCache(maxsize=max_channels.fallback)  # (server ID, channel ID) -> LastMessage
+
+
+def get_last_message(channel) -> LastMessage:
+    key = (channel.server.id, channel.id)
+    try:
+        return history[key]
+    except KeyError:
+        last_data = history[key] = LastMessage()
+        return last_data
 
 
-history = collections.defaultdict(lambda: collections.defaultdict(lambda: LastMessage()))
+def to_response(value):
+    if value is None:
+        raise CommandError("No last value found.")
+    elif isinstance(value, str):
+        return Response(value)
+    else:
+        return Response("", attachments=[value.copy()])
 
 
 @commands.create('last text', 'lasttext', 'last', category='Utility')
@@ -59,14 +107,9 @@ async def last_text(message):
 
         /last
     """
-    channel = message.channel
-    last_data = history[channel.server.id][channel.id]
-    await last_data.load_if_unloaded(channel)
-    value = last_data.last_text
-    if value:
-        return value
-    else:
-        raise CommandError("No last value found.")
+    last_data = get_last_message(message.channel)
+    await last_data.load_if_unloaded(message.channel)
+    return to_response(last_data.last_text)
 
 
 @commands.create('last image', 'lastimage', category='Utility')
@@ -79,14 +122,9 @@ async def last_image(message):
 
         /last image
     """
-    channel = message.channel
-    last_data = history[channel.server.id][channel.id]
-    await last_data.load_if_unloaded(channel)
-    value = last_data.last_image
-    if value:
-        return value
-    else:
-        raise CommandError("No last value found.")
+    last_data = get_last_message(message.channel)
+    await last_data.load_if_unloaded(message.channel)
+    return to_response(last_data.last_image)
 
 
 @commands.create('last url', 'lasturl', 'last link', 'lastlink', category='Utility')
@@ -99,35 +137,34 @@ async def last_url(message):
 
         /last url
     """
-    channel = message.channel
-    last_data = history[channel.server.id][channel.id]
-    await last_data.load_if_unloaded(channel)
-    value = last_data.last_url
-    if value:
-        return value
-    else:
-        raise CommandError("No last value found.")
+    last_data = get_last_message(message.channel)
+    await last_data.load_if_unloaded(message.channel)
+    return to_response(last_data.last_url)
 
 
 def setup():
+    global history
+
+    config.add(max_channels)
+    history = cachetools.LRUCache(maxsize=max_channels())
+
     commands.add(last_text)
     commands.add(last_image)
     commands.add(last_url)
 
     @bus.event("channel.delete")
     async def on_channel_delete(channel):
-        if channel.server.id in history:
-            if channel.id in history[channel.server.id]:
-                del history[channel.server.id][channel.id]
+        if channel.server:
+            history.pop((channel.server.id, channel.id), None)
 
     @bus.event("server.remove")
     async def on_server_remove(server):
-        if server.id in history:
-            del history[server.id]
+        for key in [key for key in history.keys() if key[0] == server.id]:
+            del history[key]
 
     @bus.event("message")
     @bus.event("self_message")
     async def on_message(message):
         channel = message.channel
         if not channel.is_private:
-            history[channel.server.id][channel.id].read(message)
+            get_last_message(channel).read(message)
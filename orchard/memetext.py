@@ -5,6 +5,9 @@ import re
 import statistics
 
 import pkg_resources
+from PIL import Image
+from PIL import ImageChops
+from PIL import ImageColor
 from PIL import ImageDraw
 from PIL import ImageFont
 
@@ -14,51 +17,78 @@ from plumeria.util.command import image_filter
 IMPACT_FONT_PATH = os.path.join("fonts", "impact.ttf")
 
 
-def draw_textbox(im, left_x, top_y, box_width, text, font, border_size=2, v_align='top'):
-    draw = ImageDraw.Draw(im)
-    words = re.split(" ", text)
-    buffer = []
-    lines = []
-    widths = []
-    heights = []
-    last_fit_width = 0
+def dilate(mask, radius):
+    """
+    Grow the white areas of a mask by ``radius`` pixels in every direction, using a square
+    kernel. Each axis is done separately and the reach doubles every pass, so only a handful
+    of whole-mask operations are needed even for large radiuses.
 
-    # TODO: support user provided new line characters
+    The mask should have at least ``radius`` pixels of black around it, because the shifted
+    copies wrap around the edges.
+
+    """
+    for dx, dy in ((1, 0), (0, 1)):
+        reach = 0
+        while reach < radius:
+            step = min(reach + 1, radius - reach)
+            mask = ImageChops.lighter(mask, ImageChops.lighter(ImageChops.offset(mask, dx * step, dy * step),
+                                                               ImageChops.offset(mask, -dx * step, -dy * step)))
+            reach += step
+    return mask
 
-    i = 0
-    while i < len(words):
-        word = words[i]
-        line = " ".join(buffer + [word])
-        w, h = draw.textsize(line, font=font)
-        heights.append(h)
-        if w <= box_width or not len(buffer):
+
+def wrap_words(words, word_widths, space_width, box_width):
+    lines = []
+    buffer = []
+    buffer_width = 0
+
+    for word, width in zip(words, word_widths):
+        line_width = buffer_width + space_width + width if len(buffer) else width
+        if line_width <= box_width or not len(buffer):
             buffer.append(word)
-            last_fit_width = w
-            i += 1
+            buffer_width = line_width
         else:
             lines.append(" ".join(buffer))
-            widths.append(last_fit_width)
-            buffer = []
-            last_fit_width = 0
+            buffer = [word]
+            buffer_width = width
 
     if len(buffer):
         lines.append(" ".join(buffer))
-        widths.append(last_fit_width)
 
-    h = statistics.mean(heights)
+    return lines
+
+
+def draw_textbox(im, left_x, top_y, box_width, text, font, border_size=2, v_align='top'):
+    draw = ImageDraw.Draw(im)
+    words = re.split(" ", text)
+
+    # TODO: support user provided new line characters
+
+    # measure each word once and wrap on the summed widths, then measure the final lines for centering
+    space_width, _ = draw.textsize(" ", font=font)
+    word_widths = [draw.textsize(word, font=font)[0] for word in words]
+    lines = wrap_words(words, word_widths, space_width, box_width)
+    sizes = [draw.textsize(line, font=font) for line in lines]
+    widths = [w for w, _ in sizes]
+
+    h = statistics.mean([h for _, h in sizes])
 
     if v_align == 'bottom':
         top_y -= h * len(lines)
 
-    for x in range(-border_size, border_size + 1):
-        for y in range(-border_size, border_size + 1):
-            for i, line in enumerate(lines):
-                line_x_offset = (box_width - widths[i]) // 2
-                draw.text((left_x + line_x_offset + x, top_y + y + i * h), line, font=font, fill='black')
-
-    for i, line in enumerate(lines):
-        line_x_offset = (box_width - widths[i]) // 2
-        draw.text((left_x + line_x_offset, top_y + i * h), line, font=font, fill='white')
+    # render the text once into a mask and grow it to get the outline
+    positions = [(left_x + (box_width - widths[i]) // 2, top_y + i * h) for i in range(len(lines))]
+    mask_x = min(x for x, _ in positions) - border_size
+    mask_y = int(top_y) - border_size
+    mask_width = max(x + widths[i] for i, (x, _) in enumerate(positions)) - mask_x + border_size
+    mask_height = int(h * (len(lines) + 1)) + border_size * 2  # an extra line of room for descenders
+    text_mask = Image.new("L", (mask_width, mask_height), 0)
+    mask_draw = ImageDraw.Draw(text_mask)
+    for (x, y), line in zip(positions, lines):
+        mask_draw.text((x - mask_x, y - mask_y), line, font=font, fill=255)
+
+    im.paste(ImageColor.getcolor('black', im.mode), (mask_x, mask_y), dilate(text_mask, border_size))
+    im.paste(ImageColor.getcolor('white', im.mode), (mask_x, mask_y), text_mask)
 
 
 def render_meme_text(im, text, v_align):
@@ -2,11 +2,10 @@ import functools
 import random
 import re
 import string
-from enum import Enum
+import struct
+from enum import IntEnum
 
 import PIL
-import asyncio
-import cachetools
 import pkg_resources
 from PIL import Image
 from PIL import ImageDraw
@@ -17,10 +16,14 @@ from plumeria.command import CommandError, commands, channel_only
 from plumeria.command.parse import Word
 from plumeria.config import percent
 from plumeria.config.common import games_allowed_only
+from plumeria.core.game_state import game_states
 from plumeria.core.scoped_config import scoped_config
 from plumeria.message import ImageAttachment, Response
 from plumeria.message.lists import parse_list
 from plumeria.perms import owners_only
+from plumeria.util.executor import executors
+
+__requires__ = ['plumeria.core.game_state']
 
 bomb_chance = config.create("minesweeper", "bomb_chance", type=percent, fallback=20, scoped=True, private=False,
                             comment="The % of a cell being a bomb")
@@ -45,95 +48,131 @@ def load_tile_graphics():
     return images
 
 
-class Play(Enum):
-    UNKNOWN = 'unknown'
-    CLEAR = 'clear'
-    FLAGGED = 'flagged'
-    EXPLODED = 'exploded'
+class Play(IntEnum):
+    UNKNOWN = 0
+    CLEAR = 1
+    FLAGGED = 2
+    EXPLODED = 3
 
 
-class State(Enum):
-    IN_PLAY = 'in_play'
-    WON = 'won'
-    LOST = 'lost'
+class State(IntEnum):
+    IN_PLAY = 0
+    WON = 1
+    LOST = 2
 
 
 UNKNOWN_OR_FLAGGED = {Play.UNKNOWN, Play.FLAGGED}
 TILE_GRAPHICS = load_tile_graphics()
+CELL_SIZE = 25
+
+with pkg_resources.resource_stream("plumeria", 'fonts/FiraSans-Regular.ttf') as f:
+    cell_font = ImageFont.truetype(f, 10)
+with pkg_resources.resource_stream("plumeria", 'fonts/FiraSans-Regular.ttf') as f:
+    count_font = ImageFont.truetype(f, 15)
+
+
+def pack_bits(values, bits):
+    """Pack a sequence of small integers into bytes using the given number of bits for each."""
+    per_byte = 8 // bits
+    data = bytearray((len(values) + per_byte - 1) // per_byte)
+    for i, value in enumerate(values):
+        data[i // per_byte] |= value << (i % per_byte * bits)
+    return data
+
+
+def unpack_bits(data, bits, count):
+    per_byte = 8 // bits
+    mask = (1 << bits) - 1
+    return bytearray((data[i // per_byte] >> (i % per_byte * bits)) & mask for i in range(count))
 
 
 class Game:
-    def __init__(self, w, h, mine_fraction, r=None):
-        r = random or random.Random()
+    """
+    The state of a game of minesweeper.
+
+    The board is kept as two flat byte arrays indexed by ``y * width + x``, which are packed
+    into a bitset (for the bombs) and 2 bits per cell (for what has been played) by :meth:`pack`.
+
+    """
+
+    __slots__ = ('width', 'height', 'bomb_map', 'play', 'state', 'remaining_unknown', 'bomb_count')
+
+    def __init__(self, w, h, bomb_map: bytearray, play: bytearray, state=State.IN_PLAY):
         self.width = w
         self.height = h
-        self.bomb_map = list(map(lambda y: list(map(lambda x: r.random() <= mine_fraction, range(w))), range(h)))
-        self.play = list(map(lambda y: list(map(lambda x: Play.UNKNOWN, range(w))), range(h)))
-        self.state = State.IN_PLAY
-        self.remaining_unknown = w * h
-        self.bomb_count = 0
-
-        self.cell_size = 25
-
-        with pkg_resources.resource_stream("plumeria", 'fonts/FiraSans-Regular.ttf') as f:
-            self.cell_font = ImageFont.truetype(f, 10)
-        with pkg_resources.resource_stream("plumeria", 'fonts/FiraSans-Regular.ttf') as f:
-            self.count_font = ImageFont.truetype(f, 15)
-
-        # count bombs
-        for x in range(w):
-            for y in range(h):
-                if self.bomb_map[x][y]:
-                    self.bomb_count += 1
-                    self.remaining_unknown -= 1
-
-        if self.bomb_count == 0:
+        self.bomb_map = bomb_map
+        self.play = play
+        self.state = state
+        self.bomb_count = sum(bomb_map)
+        self.remaining_unknown = sum(1 for i, p in enumerate(play) if p in UNKNOWN_OR_FLAGGED and not bomb_map[i])
+
+    @classmethod
+    def generate(cls, w, h, mine_fraction, r=None):
+        r = r or random.Random()
+        game = cls(w, h, bytearray(r.random() <= mine_fraction for i in range(w * h)), bytearray(w * h))
+
+        if game.bomb_count == 0:
             raise CommandError("No bombs found in created game! Make sure the bomb "
                                "`minesweeper/bomb_chance` setting is not near 0%.")
 
         # start it off
         tries = 0
-        while self.remaining_unknown > 0 and tries < 20:
-            x = r.randrange(0, self.width)
-            y = r.randrange(0, self.height)
-            if not self.bomb_map[x][y] and not self._count_adjacent_bombs(x, y):
-                self.click(x, y)
+        while game.remaining_unknown > 0 and tries < 20:
+            x = r.randrange(0, game.width)
+            y = r.randrange(0, game.height)
+            if not game._is_bomb(x, y) and not game._count_adjacent_bombs(x, y):
+                game.click(x, y)
                 break
             tries += 1
 
+        return game
+
+    def pack(self) -> bytes:
+        return bytes(struct.pack("<BBB", self.width, self.height, self.state)
+                     + pack_bits(self.bomb_map, 1) + pack_bits(self.play, 2))
+
+    @classmethod
+    def unpack(cls, data: bytes):
+        w, h, state = struct.unpack_from("<BBB", data)
+        count = w * h
+        offset = 3
+        bomb_map = unpack_bits(data[offset:], 1, count)
+        offset += (count + 7) // 8
+        play = unpack_bits(data[offset:], 2, count)
+        return cls(w, h, bomb_map, play, State(state))
+
     def create_image(self, cheat=False) -> PIL.Image.Image:
-        w = self.width * self.cell_size
-        h = self.height * self.cell_size
+        w = self.width * CELL_SIZE
+        h = self.height * CELL_SIZE
         im = Image.new("RGBA", (w, h), "white")
         draw = ImageDraw.Draw(im)
         for y in range(self.height):
             for x in range(self.width):
-                cx = (x + 0.5) * self.cell_size
-                cy = (y + 0.5) * self.cell_size
-                play = self.play[x][y]
+                cx = (x + 0.5) * CELL_SIZE
+                cy = (y + 0.5) * CELL_SIZE
+                play = self._get_play(x, y)
 
                 # draw background
-                tile = TILE_GRAPHICS[play].copy().resize((self.cell_size, self.cell_size), PIL.Image.BICUBIC)
-                im.paste(tile, (x * self.cell_size, y * self.cell_size), mask=tile)
+                tile = TILE_GRAPHICS[play].copy().resize((CELL_SIZE, CELL_SIZE), PIL.Image.BICUBIC)
+                im.paste(tile, (x * CELL_SIZE, y * CELL_SIZE), mask=tile)
 
                 # location text
                 if play in UNKNOWN_OR_FLAGGED:
-                    draw.text((x * self.cell_size + 2, y * self.cell_size + 2), cell_name(x, y), (68, 68, 150),
-                              font=self.cell_font)
+                    draw.text((x * CELL_SIZE + 2, y * CELL_SIZE + 2), cell_name(x, y), (68, 68, 150),
+                              font=cell_font)
 
                 if play == Play.CLEAR:
                     count = self._count_adjacent_bombs(x, y)
                     if count:
-                        draw_centered_text(draw, cx, cy - 2, str(count), (217, 50, 50), font=self.count_font)
+                        draw_centered_text(draw, cx, cy - 2, str(count), (217, 50, 50), font=count_font)
 
-                if cheat and self.bomb_map[x][y]:
-                    draw_centered_text(draw, cx, cy - 2, "XX", (217, 50, 50), font=self.count_font)
+                if cheat and self._is_bomb(x, y):
+                    draw_centered_text(draw, cx, cy - 2, "XX", (217, 50, 50), font=count_font)
 
         return im
 
     async def create_image_async(self, *args, **kwargs):
-        return await asyncio.get_event_loop().run_in_executor(None,
-                                                              functools.partial(self.create_image, *args, **kwargs))
+        return await executors.run("cpu", functools.partial(self.create_image, *args, **kwargs))
 
     def parse_pos(self, str):
         m = POS_RE.match(str)
@@ -149,16 +188,17 @@ class Game:
     def toggle_flag(self, x, y):
         if self.state != State.IN_PLAY:
             raise AssertionError("invalid state")
-        if self.play[x][y] in (Play.UNKNOWN, Play.FLAGGED):
-            self.play[x][y] = Play.FLAGGED if self.play[x][y] == Play.UNKNOWN else Play.UNKNOWN
+        play = self._get_play(x, y)
+        if play in UNKNOWN_OR_FLAGGED:
+            self.play[y * self.width + x] = Play.FLAGGED if play == Play.UNKNOWN else Play.UNKNOWN
         else:
             raise CommandError("You can't flag that cell!")
 
     def click(self, x, y):
         if self.state != State.IN_PLAY:
             raise AssertionError("invalid state")
-        if self.play[x][y] in (Play.UNKNOWN, Play.FLAGGED):
-            if self.bomb_map[x][y]:  # bomb
+        if self._get_play(x, y) in UNKNOWN_OR_FLAGGED:
+            if self._is_bomb(x, y):  # bomb
                 self._mutate_cell(x, y, Play.EXPLODED)
                 self.state = State.LOST
             else:
@@ -171,8 +211,11 @@ class Game:
     def _in_bounds(self, x, y):
         return 0 <= x < self.width and 0 <= y < self.height
 
+    def _get_play(self, x, y):
+        return Play(self.play[y * self.width + x])
+
     def _is_bomb(self, x, y):
-        return self._in_bounds(x, y) and self.bomb_map[x][y]
+        return self._in_bounds(x, y) and bool(self.bomb_map[y * self.width + x])
 
     def _count_adjacent_bombs(self, x, y):
         return sum([
@@ -192,7 +235,7 @@ class Game:
         if (x, y) in visited:
             return
         visited.add((x, y))
-        if self.play[x][y] in UNKNOWN_OR_FLAGGED and not self.bomb_map[x][y]:
+        if self._get_play(x, y) in UNKNOWN_OR_FLAGGED and not self._is_bomb(x, y):
             self._mutate_cell(x, y, Play.CLEAR)
             if not self._count_adjacent_bombs(x, y):
                 self._clear_cell(x - 1, y, visited)
@@ -205,14 +248,24 @@ class Game:
                 self._clear_cell(x + 1, y + 1, visited)
 
     def _mutate_cell(self, x, y, new_play: Play):
-        if self.play[x][y] in UNKNOWN_OR_FLAGGED and new_play != Play.UNKNOWN:
-            self.remaining_unknown -= 1
-            self.play[x][y] = new_play
+        play = self._get_play(x, y)
+        if play in UNKNOWN_OR_FLAGGED and new_play != Play.UNKNOWN:
+            if not self._is_bomb(x, y):  # only safe cells are counted, the same as in __init__
+                self.remaining_unknown -= 1
+            self.play[y * self.width + x] = new_play
         else:
-            raise AssertionError("this shouldn't happen (is {}, wants to be {})".format(self.play[x][y], new_play))
+            raise AssertionError("this shouldn't happen (is {}, wants to be {})".format(play, new_play))
+
 
+def game_key(message):
+    return message.transport.id, message.server.id, message.channel.id
 
-cache = cachetools.LRUCache(maxsize=1000)
+
+async def load_game(key):
+    state = await game_states.get("minesweeper", key)
+    if not state:
+        raise CommandError("Say 'start' to start a game first.")
+    return Game.unpack(state)
 
 
 @commands.create("minesweeper start", "mine start", "m start", category="Games", params=[])
@@ -227,13 +280,15 @@ async def start(message):
         mine start
 
     """
-    key = (message.transport.id, message.server.id, message.channel.id)
+    key = game_key(message)
 
-    if key in cache:
-        game = cache[key]
-    else:
-        game = Game(12, 12, scoped_config.get(bomb_chance, message.channel) / 100, random.Random())
-        cache[key] = game
+    with await game_states.lock("minesweeper", key):
+        state = await game_states.get("minesweeper", key)
+        if state:
+            game = Game.unpack(state)
+        else:
+            game = Game.generate(12, 12, scoped_config.get(bomb_chance, message.channel) / 100, random.Random())
+            await game_states.put("minesweeper", key, game.pack())
 
     return Response("", attachments=[ImageAttachment(await game.create_image_async(), "minesweeper.png")])
 
@@ -254,26 +309,27 @@ async def click(message):
         mine b5 g7 a7 a1
 
     """
-    key = (message.transport.id, message.server.id, message.channel.id)
+    key = game_key(message)
 
-    try:
-        game = cache[key]  # type: Game
-    except KeyError:
-        raise CommandError("Say 'start' to start a game first.")
+    with await game_states.lock("minesweeper", key):
+        game = await load_game(key)
 
-    positions = parse_list(message.content)
-    for position in positions:
-        if game.state != State.IN_PLAY:
-            break
-        game.click(*game.parse_pos(position))
+        positions = parse_list(message.content)
+        for position in positions:
+            if game.state != State.IN_PLAY:
+                break
+            game.click(*game.parse_pos(position))
+
+        if game.state == State.IN_PLAY:
+            await game_states.put("minesweeper", key, game.pack())
+        else:
+            await game_states.remove("minesweeper", key)
 
     if game.state == State.WON:
-        del cache[key]
         return Response("\N{TROPHY} \N{TROPHY} YOU ARE WINNER! \N{TROPHY} \N{TROPHY}", attachments=[
             ImageAttachment(await game.create_image_async(), "minesweeper.png")
         ])
     elif game.state == State.LOST:
-        del cache[key]
         return Response("\N{BOMB} \N{COLLISION SYMBOL} \N{COLLISION SYMBOL} BOOOOM!!!", attachments=[
             ImageAttachment(await game.create_image_async(), "minesweeper.png")
         ])
@@ -289,18 +345,18 @@ async def flag(message):
     Toggle flags on one or more cells on minesweeper.
 
     """
-    key = (message.transport.id, message.server.id, message.channel.id)
+    key = game_key(message)
 
-    try:
-        game = cache[key]  # type: Game
-    except KeyError:
-        raise CommandError("Say 'start' to start a game first.")
+    with await game_states.lock("minesweeper", key):
+        game = await load_game(key)
+
+        positions = parse_list(message.content)
+        for position in positions:
+            if game.state != State.IN_PLAY:
+                break
+            game.toggle_flag(*game.parse_pos(position))
+        await game_states.put("minesweeper", key, game.pack())
 
-    positions = parse_list(message.content)
-    for position in positions:
-        if game.state != State.IN_PLAY:
-            break
-        game.toggle_flag(*game.parse_pos(position))
     return Response("", attachments=[ImageAttachment(await game.create_image_async(), "minesweeper.png")])
 
 
@@ -312,12 +368,7 @@ async def cheat(message):
     Bot administrator command to show where bombs are for testing.
 
     """
-    key = (message.transport.id, message.server.id, message.channel.id)
-
-    try:
-        game = cache[key]  # type: Game
-    except KeyError:
-        raise CommandError("Say 'start' to start a game first.")
+    game = await load_game(game_key(message))
 
     return Response("", attachments=[ImageAttachment(await game.create_image_async(cheat=True), "minesweeper.png")])
 
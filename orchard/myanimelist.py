@@ -1,14 +1,13 @@
 """Query anime and manga information from MyAnimeList.com."""
 
 import aiohttp
-from bs4 import BeautifulSoup
 
 from plumeria import config
 from plumeria.command import commands, CommandError
 from plumeria.plugin import PluginSetupError
 from plumeria.util import http
 from plumeria.util.http import BadStatusCodeError
-from plumeria.util.message import strip_html
+from plumeria.util.markup import extract, parse_xml, strip_html
 from plumeria.util.ratelimit import rate_limit
 
 username = config.create("myanimelist", "username", fallback="",
@@ -17,6 +16,20 @@ username = config.create("myanimelist", "username", fallback="",
 password = config.create("myanimelist", "password", fallback="",
                          comment="Account password for API requests on myanimelist.net")
 
+ANIME_FIELDS = ('image', 'type', 'title', 'score', 'episodes', 'start_date', 'end_date', 'synopsis')
+MANGA_FIELDS = ('image', 'type', 'title', 'status', 'score', 'chapters', 'start_date', 'end_date', 'synopsis')
+
+
+def read_first_entry(text, fields):
+    """Get the text of some fields of the first entry in search results, or None if there are no entries."""
+    root = parse_xml(text)
+    entry = root.find("entry") if root is not None else None
+    if entry is None:
+        return None
+    values = {field: (entry.findtext(field) or "") for field in fields}
+    values['synopsis'] = strip_html(values['synopsis'])
+    return values
+
 
 @commands.create("anime", category="Search")
 @rate_limit()
@@ -41,25 +54,23 @@ async def anime(message):
         if e.http_code in (204, 404):
             raise CommandError("No anime results for '{query}'.".format(query=query))
         raise
-    doc = BeautifulSoup(r.text(), features="lxml")
-    entries = doc.anime.find_all("entry", recursive=False)
-    if not len(entries):
+    entry = await extract(read_first_entry, r.text(), ANIME_FIELDS)
+    if entry is None:
         raise CommandError("No results found.")
-    entry = entries[0]
     return "{image}\n\n" \
            "**{name}** ({type})\n\n" \
            "**Score:** {score}\n" \
            "**Episodes:** {ep_count}\n" \
            "**Air Dates:** {start}-{end}\n\n" \
            "{synopsis}\n".format(
-        image=entry.image.text,
-        type=entry.type.text,
-        name=entry.title.text,
-        score=entry.score.text,
-        ep_count=entry.episodes.text,
-        start=entry.start_date.text,
-        end=entry.end_date.text,
-        synopsis=strip_html(entry.synopsis.text),
+        image=entry['image'],
+        type=entry['type'],
+        name=entry['title'],
+        score=entry['score'],
+        ep_count=entry['episodes'],
+        start=entry['start_date'],
+        end=entry['end_date'],
+        synopsis=entry['synopsis'],
     )
 
 
@@ -86,11 +97,9 @@ async def manga(message):
         if e.http_code in (204, 404):
             raise CommandError("No manga results for '{query}'.".format(query=query))
         raise
-    doc = BeautifulSoup(r.text(), features="lxml")
-    entries = doc.manga.find_all("entry", recursive=False)
-    if not len(entries):
+    entry = await extract(read_first_entry, r.text(), MANGA_FIELDS)
+    if entry is None:
         raise CommandError("No results found.")
-    entry = entries[0]
     return "{image}\n\n" \
            "**{name}** ({type})\n\n" \
            "**Status:** {status}\n" \
@@ -98,15 +107,15 @@ async def manga(message):
            "**Chapters:** {chapters}\n" \
            "**Run Dates:** {start}-{end}\n\n" \
            "{synopsis}\n".format(
-        image=entry.image.text,
-        type=entry.type.text,
-        name=entry.title.text,
-        status=entry.status.text,
-        score=entry.score.text,
-        chapters=entry.chapters.text,
-        start=entry.start_date.text,
-        end=entry.end_date.text,
-        synopsis=strip_html(entry.synopsis.text),
+        image=entry['image'],
+        type=entry['type'],
+        name=entry['title'],
+        status=entry['status'],
+        score=entry['score'],
+        chapters=entry['chapters'],
+        start=entry['start_date'],
+        end=entry['end_date'],
+        synopsis=entry['synopsis'],
     )
 
 
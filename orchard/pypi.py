@@ -1,9 +1,9 @@
 """Query the Python package repository for packages."""
 
-import asyncio
 import xmlrpc.client as xmlrpclib
 
 from plumeria.command import commands, CommandError
+from plumeria.util.executor import executors
 from plumeria.util.ratelimit import rate_limit
 
 client = xmlrpclib.ServerProxy('https://pypi.python.org/pypi')
@@ -32,7 +32,7 @@ async def pypi(message):
     def execute():
         return client.search({'name': q})
 
-    data = await asyncio.get_event_loop().run_in_executor(None, execute)
+    data = await executors.run("blocking_io", execute)
     if len(data):
         return "\n".join(map(lambda e:
                              "\u2022 **{name}** ({version}) - {desc} <https://pypi.python.org/pypi/{name}>".format(
@@ -1,11 +1,11 @@
 """Generate QR codes."""
 
-import asyncio
 
 import qrcode
 from PIL import Image
 from plumeria.command import commands, CommandError
 from plumeria.message import Response, ImageAttachment
+from plumeria.util.executor import executors
 from plumeria.util.ratelimit import rate_limit
 
 
@@ -28,7 +28,7 @@ async def qr(message):
         new.paste(old)
         return new
 
-    im = await asyncio.get_event_loop().run_in_executor(None, execute)
+    im = await executors.run("cpu", execute)
     return Response("", [ImageAttachment(im, "qr.png")])
 
 
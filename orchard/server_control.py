@@ -1,6 +1,5 @@
 """Commands to modify server settings."""
 
-import asyncio
 import io
 
 from plumeria.command import commands, CommandError, channel_only
@@ -8,6 +7,7 @@ from plumeria.message import Message
 from plumeria.message.image import read_image
 from plumeria.perms import have_all_perms
 from plumeria.transport.transport import ForbiddenError
+from plumeria.util.executor import executors
 
 
 @commands.create('icon set', 'iconset', 'set icon', 'seticon', category='Management')
@@ -35,7 +35,7 @@ async def set_icon(message: Message):
         attachment.image.save(buffer, "png")
         return buffer.getvalue()
 
-    image_data = await asyncio.get_event_loop().run_in_executor(None, execute)
+    image_data = await executors.run("cpu", execute)
 
     try:
         await message.server.update(icon=image_data)
@@ -1,6 +1,5 @@
 """Create .vtf spray files for games that use Valve's Source engine."""
 
-import asyncio
 import io
 import logging
 import math
@@ -16,6 +15,7 @@ from plumeria.command import commands, CommandError
 from plumeria.message import Response, MemoryAttachment
 from plumeria.message.image import read_image
 from plumeria.plugin import PluginSetupError
+from plumeria.util.executor import executors
 from plumeria.util.ratelimit import rate_limit
 
 VTFCMD_PATH = os.path.join("bin", "VTFCmd.exe")
@@ -50,7 +50,7 @@ async def make_spray(message):
     if not os.path.exists(VTFCMD_PATH):
         raise IOError("Cannot find VTFCmd (tried {})".format(VTFCMD_PATH))
 
-    attachment = await read_image(message)
+    attachment = await read_image(message, size=(512, 512))
     if not attachment:
         raise CommandError("No image is available to process.")
 
@@ -126,7 +126,7 @@ async def make_spray(message):
         finally:
             shutil.rmtree(temp_dir)
 
-    output = await asyncio.get_event_loop().run_in_executor(None, execute)
+    output = await executors.run("subprocess", execute)
     return Response("", [MemoryAttachment(output, "spray.vtf", "application/octet-stream")])
 
 
@@ -2,11 +2,11 @@ import re
 from collections import namedtuple
 
 import aiohttp
-from bs4 import BeautifulSoup
 from valve.steam.id import SteamID as BrokenSteamID, UNIVERSE_INDIVIDUAL, TYPE_INDIVIDUAL, TYPE_CLAN, \
     community32_regex, community64_regex, letter_type_map, type_url_path_map, urlparse
 from plumeria.command import CommandError
 from plumeria.util.http import APIError, DefaultClientSession
+from plumeria.util.markup import extract, parse_xml
 
 COMMUNITY_URL_ID_PATTERN = re.compile("https?://(?:www\\.)?steamcommunity\\.com/profiles/([0-9]+)(?:/[^ ]*)?", re.I)
 COMMUNITY_URL_NAME_PATTERN = re.compile("https?://(?:www\\.)?steamcommunity\\.com/id/([A-Za-z0-9_\\-]+)(?:/[^ ]*)?",
@@ -58,6 +58,24 @@ class SteamID(BrokenSteamID):
         return "STEAM_{}:1:{}".format(self.type, (self.account_number * 2) + self.instance)
 
 
+def read_profile(text):
+    """Read a profile from the XML version of a Steam community page."""
+    root = parse_xml(text)
+    if root is None:
+        raise APIError("Empty response")
+    if root.tag == "response":
+        raise APIError((root.findtext("error") or "Unknown error").strip())
+    name = (root.findtext("steamID") or "").strip() or None
+    return SteamProfile(
+        SteamID.from_64(root.findtext("steamID64").strip()),
+        name,
+        root.findtext("onlineState"),
+        root.findtext("privacyState"),
+        root.findtext("avatarFull"),
+        root.findtext("vacBanned") == "1",
+    )
+
+
 class SteamCommunity:
     async def steam_profile(self, s, id64=False):
         with DefaultClientSession() as session:
@@ -69,19 +87,7 @@ class SteamCommunity:
                 async with session.get(url, params={"xml": "1"}) as resp:
                     if resp.status != 200:
                         raise APIError("HTTP code is not 200; got {}".format(resp.status))
-                    soup = BeautifulSoup(await resp.text(), "html.parser")
-                    if soup.response and soup.response.error:
-                        raise APIError(str(soup.response.error.contents[0]))
-                    name = str(soup.profile.steamid.contents[0]).strip()
-                    if name == "": name = None
-                    return SteamProfile(
-                        SteamID.from_64(str(soup.profile.steamid64.contents[0])),
-                        name,
-                        str(soup.profile.onlinestate.contents[0]) if soup.profile.onlinestate else None,
-                        str(soup.profile.privacystate.contents[0]) if soup.profile.privacystate else None,
-                        str(soup.profile.avatarfull.contents[0]) if soup.profile.avatarfull else None,
-                        str(soup.profile.vacbanned.contents[0]) == "1" if soup.profile.vacbanned else False,
-                    )
+                    return await extract(read_profile, await resp.text())
             except aiohttp.errors.ClientConnectionError as e:
                 raise APIError("Connection error")
 
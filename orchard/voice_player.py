@@ -3,6 +3,7 @@ import functools
 import logging
 import re
 
+import cachetools
 import youtube_dl
 from youtube_dl import DownloadError
 
@@ -11,6 +12,8 @@ from plumeria.command import CommandError
 from plumeria.command import commands, channel_only
 from plumeria.command.parse import Text
 from plumeria.core.voice_queue import queue_map, QueueEntry, EntryMeta
+from plumeria.metrics import metrics
+from plumeria.util.executor import executors
 from plumeria.util.voice import get_voice_client
 
 __requires__ = ['plumeria.core.voice_queue']
@@ -21,6 +24,70 @@ LINK_PATTERN = re.compile("((https?)://[^\s/$.?#<>].[^\s<>]*)", re.I)
 
 source_address = config.create("voice_player", "source_address", fallback="",
                                comment="Source address for youtube_dl")
+ytdl_workers = config.create("voice_player", "ytdl_workers", type=int, fallback=2,
+                             comment="The number of threads to use to look up media with youtube_dl")
+ytdl_queue = config.create("voice_player", "ytdl_queue", type=int, fallback=20,
+                           comment="How many media lookups can be waiting before more are turned away, or 0 for no "
+                                   "limit")
+info_cache_ttl = config.create("voice_player", "info_cache_ttl", type=int, fallback=600,
+                               comment="The number of seconds to remember looked up media for (keep this short "
+                                       "because the stream URLs expire)")
+
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+
+
+class InfoResolver:
+    """
+    Looks up media information with youtube_dl on its own ``ytdl`` executor, so that slow lookups
+    don't tie up the threads used by other commands, and remembers the results for a short while
+    so the lookup done when queuing can be reused when the entry is played.
+
+    """
+
+    def __init__(self):
+        self.cache = None
+        self.pending = {}
+
+    def configure(self, ttl):
+        self.cache = cachetools.TTLCache(maxsize=500, ttl=ttl)
+
+    def create_options(self):
+        return {
+            'format': 'webm[abr>0]/bestaudio/best',
+            'prefer_ffmpeg': True,
+            'source_address': source_address(),
+            'noplaylist': True,
+        }
+
+    async def extract_info(self, url):
+        try:
+            info = self.cache[url]
+            cache_hits.inc()
+            return info
+        except KeyError:
+            cache_misses.inc()
+
+        # share the lookup with anyone else that wants the same URL right now
+        if url not in self.pending:
+            ydl = youtube_dl.YoutubeDL(self.create_options())
+            func = functools.partial(ydl.extract_info, url, download=False)
+            self.pending[url] = asyncio.ensure_future(executors.run("ytdl", func))
+
+        try:
+            info = await asyncio.shield(self.pending[url])
+        finally:
+            self.pending.pop(url, None)
+
+        if 'entries' in info:
+            info = info['entries'][0]
+        self.cache[url] = info
+        return info
+
+
+executors.register("ytdl", ytdl_workers, ytdl_queue)
+resolver = InfoResolver()
+cache_hits = metrics.counter("voice_info_cache_hits", "Number of media lookups answered from the cache")
+cache_misses = metrics.counter("voice_info_cache_misses", "Number of media lookups that had to run youtube_dl")
 
 
 @commands.create('join voice', category='Player', params=[])
@@ -56,16 +123,8 @@ async def play(message, url):
     url = m.group(1)
 
     # check to see if we can play this URL
-    opts = {
-        'format': 'webm[abr>0]/bestaudio/best',
-        'prefer_ffmpeg': True,
-        'source_address': source_address(),
-        'noplaylist': True,
-    }
-    ydl = youtube_dl.YoutubeDL(opts)
-    func = functools.partial(ydl.extract_info, url, download=False)
     try:
-        info = await asyncio.get_event_loop().run_in_executor(None, func)
+        info = await resolver.extract_info(url)
 
         # get metadata
         is_twitch = 'twitch' in url
@@ -83,10 +142,15 @@ async def play(message, url):
     voice_client = await get_voice_client(message.author)
     queue = queue_map.get(voice_client.channel)
 
-    # queue that stuff up
+    # queue that stuff up (the player may be created well before the entry is played)
     async def factory(entry: QueueEntry):
-        return await voice_client.create_ytdl_player(url, ytdl_options=opts, after=entry.on_end,
-                                                     options=['-af', 'loudnorm=I=-16:TP=-1.5:LRA=11'])
+        download_url = (await resolver.extract_info(url))['url']
+        player = voice_client.create_ffmpeg_player(download_url, after=entry.on_end,
+                                                   before_options=FFMPEG_BEFORE_OPTIONS,
+                                                   options=['-af', 'loudnorm=I=-16:TP=-1.5:LRA=11'])
+        player.url = url
+        player.download_url = download_url
+        return player
 
     meta = EntryMeta(title=title, description=description, url=url)
     entry = await queue.add(factory, channel=voice_client.channel, meta=meta)
@@ -102,5 +166,9 @@ async def play(message, url):
 
 def setup():
     config.add(source_address)
+    config.add(ytdl_workers)
+    config.add(ytdl_queue)
+    config.add(info_cache_ttl)
+    resolver.configure(info_cache_ttl())
     commands.add(join)
     commands.add(play)
@@ -1,7 +1,10 @@
+import collections
 import logging
 import os
 import random
 import re
+import time
+from typing import List
 
 from plumeria.command import commands, channel_only, CommandError
 from plumeria.command.parse import Text
@@ -24,33 +27,83 @@ def get_words(name):
     return set(WORD_SPLIT_RE.split(STRIP_RE.sub('', name.lower()).strip()))
 
 
+class SfxCatalog:
+    """
+    Keeps an index of sound effects by the words in their names so that lookups don't
+    have to go through the whole folder.
+
+    The folder is only listed again when its modification time changes (or every so often,
+    in case the file system's timestamps are too coarse), and then only new and removed
+    files are indexed.
+
+    """
+
+    FULL_REFRESH_INTERVAL = 60
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.listed_at = 0
+        self.files = {}
+        self.index = collections.defaultdict(set)
+        self.names = []
+
+    def refresh(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self.mtime and time.monotonic() - self.listed_at < self.FULL_REFRESH_INTERVAL:
+            return
+        self.mtime = mtime
+        self.listed_at = time.monotonic()
+
+        current = set()
+        for filename in os.listdir(self.path):
+            name, ext = os.path.splitext(filename)
+            if ext.lower() in SFX_EXTS:
+                current.add(filename)
+
+        changed = False
+        for filename in self.files.keys() - current:
+            for word in self.files.pop(filename):
+                self.index[word].discard(filename)
+                if not self.index[word]:
+                    del self.index[word]
+            changed = True
+        for filename in current - self.files.keys():
+            words = get_words(os.path.splitext(filename)[0])
+            self.files[filename] = words
+            for word in words:
+                self.index[word].add(filename)
+            changed = True
+
+        if changed:
+            names = [{'name': os.path.splitext(filename)[0], 'triggers': words}
+                     for filename, words in self.files.items()]
+            names.sort(key=lambda e: e['name'])
+            self.names = names
+
+    def find(self, expected) -> List[str]:
+        self.refresh()
+        matches = sorted((self.index.get(word, set()) for word in get_words(expected)), key=len)
+        return sorted(set.intersection(*matches)) if matches else []
+
+
+catalog = SfxCatalog(SFX_PATH)
+
+
 def get_sfx_names():
-    names = []
-    for filename in os.listdir(SFX_PATH):
-        name, ext = os.path.splitext(filename)
-        if ext.lower() in SFX_EXTS:
-            names.append({
-                'name': name,
-                'triggers': get_words(name),
-            })
-    names.sort(key=lambda e: e['name'])
-    return names
+    try:
+        catalog.refresh()
+    except FileNotFoundError:
+        return []
+    return catalog.names
 
 
 def find_sfx(expected):
     try:
-        expected_words = get_words(expected)
-        choices = []
-        for filename in os.listdir(SFX_PATH):
-            name, ext = os.path.splitext(filename)
-            if ext.lower() in SFX_EXTS:
-                words = get_words(name)
-                common = words.intersection(expected_words)
-                if len(common) == len(expected_words):
-                    choices.append(os.path.abspath(os.path.join(SFX_PATH, filename)))
+        choices = catalog.find(expected)
         if not len(choices):
             raise CommandError("Couldn't find the effect '{}'.".format(expected))
-        return random.choice(choices)
+        return os.path.abspath(os.path.join(SFX_PATH, random.choice(choices)))
     except FileNotFoundError:
         raise CommandError("There isn't even a sound effect folder.")
 
@@ -2,13 +2,23 @@
 
 import random
 
-from bs4 import BeautifulSoup
-
 from plumeria.command import commands, CommandError
 from plumeria.util import http
+from plumeria.util.markup import extract, has_class, parse_html
 from plumeria.util.ratelimit import rate_limit
 
 
+def read_thumbs(text):
+    """Get the image URL and page link of each wallpaper in a page of search results."""
+    results = []
+    for thumb in parse_html(text).xpath("//figure" + has_class("thumb")):
+        image = thumb.find(".//img")
+        links = thumb.xpath(".//a" + has_class("preview"))
+        if image is not None and links:
+            results.append((image.get("data-src"), links[0].get("href")))
+    return results
+
+
 @commands.create("wallhaven", "wallbase", category="Search")
 @rate_limit()
 async def wallhaven(message):
@@ -30,14 +40,7 @@ async def wallhaven(message):
         ('order', 'desc')
     ])
 
-    results = []
-    soup = BeautifulSoup(r.text(), "html.parser")
-    for thumb in soup.find_all("figure", class_="thumb"):
-        image = thumb.find("img")
-        if image:
-            image_url = image['data-src']
-            link = thumb.find("a", class_="preview")['href']
-            results.append((image_url, link))
+    results = await extract(read_thumbs, r.text())
     if len(results):
         choice = random.choice(results)
         return "{}\nGet it here: <{}>".format(*choice)
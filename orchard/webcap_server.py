@@ -1,17 +1,19 @@
 """Server to render HTML and webpages for the main webcap plugin."""
 
-import asyncio
+import atexit
 import io
 import logging
 import os
 import random
 import re
 import string
+import threading
 from hmac import compare_digest
 from json import JSONDecodeError
 
+import cachetools
+import psutil
 from PIL import Image
-from PIL import ImageChops
 from aiohttp.web import json_response, Response
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException
@@ -19,8 +21,11 @@ from selenium.common.exceptions import TimeoutException
 from plumeria import config
 from plumeria.plugin import PluginSetupError
 from plumeria.core.webserver import app
+from plumeria.util.executor import executors, ExecutorFullError
+from plumeria.util.image import trim
 
 VALID_URL_REGEX = re.compile("^(?:https?://|data:)", re.IGNORECASE)
+PHANTOMJS_PATH = 'node_modules/phantomjs/lib/phantom/bin/phantomjs'
 
 logger = logging.getLogger(__name__)
 
@@ -40,16 +45,133 @@ page_load_timeout = config.create("webcap_server", "page_load_timeout",
                                   fallback=10,
                                   comment="Number of seconds before timing out page load")
 
+browser_count = config.create("webcap_server", "browsers",
+                              type=int,
+                              fallback=2,
+                              comment="Number of browsers to keep running, which is the number of pages that can be "
+                                      "rendered at the same time")
 
-def trim(im):
-    bg = Image.new(im.mode, im.size, im.getpixel((0, 0)))
-    diff = ImageChops.difference(im, bg)
-    diff = ImageChops.add(diff, diff, 2.0, -100)
-    bbox = diff.getbbox()
-    if bbox:
-        return im.crop(bbox)
-    else:
-        return im
+queue_size = config.create("webcap_server", "queue_size",
+                           type=int,
+                           fallback=10,
+                           comment="Number of render requests that can wait for a browser before new requests are "
+                                   "turned away")
+
+max_renders = config.create("webcap_server", "max_renders",
+                            type=int,
+                            fallback=50,
+                            comment="Number of pages a browser renders before it is restarted")
+
+max_memory = config.create("webcap_server", "max_memory",
+                           type=int,
+                           fallback=500,
+                           comment="Memory use in MB above which a browser is restarted after a render")
+
+cache_ttl = config.create("webcap_server", "cache_ttl",
+                          type=int,
+                          fallback=60,
+                          comment="Number of seconds to cache screenshots of a page for")
+
+
+class Browser:
+    __slots__ = ('driver', 'renders')
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.renders = 0
+
+
+class BrowserPool:
+    """
+    Keeps a number of browsers running so that each render doesn't have to start one.
+
+    Every browser belongs to one of the threads of the ``webcap`` executor, so a render gets a
+    browser by running on that executor, and renders wait in FIFO order when all the browsers are
+    busy.
+    Browsers are restarted after a number of renders, when they use too much memory, or after
+    an error.
+
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.browsers = set()
+        self.lock = threading.Lock()
+        self.max_renders = 0
+        self.max_memory = 0
+
+    def configure(self, max_renders, max_memory):
+        self.max_renders = max_renders
+        self.max_memory = max_memory * 1024 * 1024
+
+    def _get_browser(self) -> Browser:
+        browser = getattr(self.local, 'browser', None)
+        if browser is None:
+            browser = self.local.browser = Browser(webdriver.PhantomJS(executable_path=PHANTOMJS_PATH))
+            with self.lock:
+                self.browsers.add(browser)
+        return browser
+
+    def _recycle(self, browser: Browser):
+        self.local.browser = None
+        with self.lock:
+            self.browsers.discard(browser)
+        try:
+            browser.driver.quit()
+        except Exception:
+            logger.warning("Failed to quit browser", exc_info=True)
+
+    def _memory_used(self, browser: Browser):
+        try:
+            return psutil.Process(browser.driver.service.process.pid).memory_info().rss
+        except (AttributeError, psutil.Error):
+            return 0
+
+    def _screenshot(self, url, width, timeout):
+        browser = self._get_browser()
+        try:
+            browser.driver.set_window_size(width, 768)
+            browser.driver.set_page_load_timeout(timeout)
+            browser.driver.get(url)
+            png = browser.driver.get_screenshot_as_png()
+            browser.driver.get("about:blank")
+        except Exception:
+            self._recycle(browser)
+            raise
+        browser.renders += 1
+        if browser.renders >= self.max_renders or self._memory_used(browser) > self.max_memory:
+            self._recycle(browser)
+        return png
+
+    async def screenshot(self, url, width, timeout) -> bytes:
+        """
+        Take a screenshot of a page.
+
+        Raises
+        ------
+        :class:`ExecutorFullError`
+            Thrown if too many screenshots are already waiting for a browser
+        :class:`TimeoutException`
+            Thrown if the page took too long to load
+
+        """
+        return await executors.run("webcap", self._screenshot, url, width, timeout)
+
+    def close(self):
+        with self.lock:
+            browsers = list(self.browsers)
+            self.browsers.clear()
+        for browser in browsers:
+            try:
+                browser.driver.quit()
+            except Exception:
+                pass
+
+
+# a thread for each browser, and room for the renders that are waiting for one
+executors.register("webcap", browser_count, lambda: browser_count() + queue_size())
+pool = BrowserPool()
+screenshot_cache = cachetools.TTLCache(maxsize=100, ttl=60)
 
 
 @app.route('/webcap-server/render/', methods=['POST'])
@@ -83,28 +205,31 @@ async def handle(request):
     except ValueError:
         return json_response(status=400, data={'error': 'max_height is not a valid number'})
 
-    def execute():
-        logger.info("Requesting {} via Selenium/PhantomJS...".format(url))
+    key = (url, width, max_height, trim_image)
+    try:
+        return Response(body=screenshot_cache[key], content_type="image/png")
+    except KeyError:
+        pass
 
-        try:
-            driver = webdriver.PhantomJS(executable_path='node_modules/phantomjs/lib/phantom/bin/phantomjs')
-            driver.set_window_size(width, 768)
-            driver.set_page_load_timeout(page_load_timeout())
-            driver.get(url)
-            data = io.BytesIO()
-            data.write(driver.get_screenshot_as_png())
-        except TimeoutException:
-            logger.warn("Request for {} timed out".format(url), exc_info=True)
-            return json_response(status=400, data={'error': 'timeout'})
-        except Exception:
-            logger.warn("Request for {} encountered an error".format(url), exc_info=True)
-            return json_response(status=500, data={'error': 'a rendering error occurred'})
+    logger.info("Requesting {} via Selenium/PhantomJS...".format(url))
 
+    try:
+        png = await pool.screenshot(url, width, page_load_timeout())
+    except ExecutorFullError:
+        return json_response(status=503, headers={'Retry-After': '5'}, data={'error': 'too many pending requests'})
+    except TimeoutException:
+        logger.warn("Request for {} timed out".format(url), exc_info=True)
+        return json_response(status=400, data={'error': 'timeout'})
+    except Exception:
+        logger.warn("Request for {} encountered an error".format(url), exc_info=True)
+        return json_response(status=500, data={'error': 'a rendering error occurred'})
+
+    def execute():
         try:
-            im = Image.open(data)
+            im = Image.open(io.BytesIO(png))
         except OSError:
             logger.warn("Request for {} resulted in an image file that could not be opened".format(url), exc_info=True)
-            return json_response(status=500, data={'error': 'failed to read rendered image'})
+            return None
 
         w, h = im.size
         im = im.crop((0, 0, min(w, width), min(h, max_height)))
@@ -112,16 +237,31 @@ async def handle(request):
             im = trim(im)
         buffer = io.BytesIO()
         im.save(buffer, "png")
-        return Response(body=buffer.getvalue(), content_type="image/png")
+        return buffer.getvalue()
 
-    return await asyncio.get_event_loop().run_in_executor(None, execute)
+    data = await executors.run("cpu", execute)
+    if data is None:
+        return json_response(status=500, data={'error': 'failed to read rendered image'})
+    screenshot_cache[key] = data
+    return Response(body=data, content_type="image/png")
 
 
 def setup():
+    global screenshot_cache
+
     config.add(api_key)
     config.add(page_load_timeout)
+    config.add(browser_count)
+    config.add(queue_size)
+    config.add(max_renders)
+    config.add(max_memory)
+    config.add(cache_ttl)
 
     if not api_key():
         raise PluginSetupError("This plugin requires an API key to be chosen.")
 
+    pool.configure(max_renders(), max_memory())
+    atexit.register(pool.close)
+    screenshot_cache = cachetools.TTLCache(maxsize=100, ttl=cache_ttl())
+
     app.add(handle)
@@ -1,12 +1,11 @@
 """Ask WolframAlpha questions."""
 
-from bs4 import BeautifulSoup
-
 from plumeria import config
 from plumeria.command import commands, CommandError
 from plumeria.plugin import PluginSetupError
 from plumeria.util import http
 from plumeria.util.format import escape_markdown
+from plumeria.util.markup import extract, iter_elements
 from plumeria.util.ratelimit import rate_limit
 
 api_key = config.create("wolfram", "key",
@@ -14,6 +13,22 @@ api_key = config.create("wolfram", "key",
                         comment="An API key from http://products.wolframalpha.com/api/")
 
 
+def read_pods(text):
+    """Get the title and text lines of each top level pod in a response."""
+    pods = []
+    for pod in iter_elements(text, "pod"):
+        parent = pod.getparent()
+        if parent is None or parent.getparent() is not None:  # only pods directly under <queryresult>
+            continue
+        lines = []
+        for node in pod.iter("plaintext"):
+            line = ' '.join(s.strip() for s in node.itertext() if s.strip())
+            if len(line):
+                lines.append(line)
+        pods.append((pod.get("id", ""), pod.get("title", ""), lines))
+    return pods
+
+
 @commands.create("wolfram", category="Search")
 @rate_limit()
 async def wolfram(message):
@@ -40,16 +55,13 @@ async def wolfram(message):
         ('input', q),
         ('appid', api_key()),
     ])
-    doc = BeautifulSoup(r.text(), features="lxml")
-    pods = doc.queryresult.find_all("pod", recursive=False)
+    pods = await extract(read_pods, r.text())
     if len(pods):
         lines = []
-        for pod in pods:
-            if pod.get("id", "") != "Input":
-                for node in pod.find_all("plaintext"):
-                    line = (' '.join(node.stripped_strings)).strip()
-                    if len(line):
-                        lines.append("**{}:** {}".format(pod['title'], escape_markdown(line)))
+        for id, title, pod_lines in pods:
+            if id != "Input":
+                for line in pod_lines:
+                    lines.append("**{}:** {}".format(title, escape_markdown(line)))
         if len(lines):
             return "\n".join(lines[:4])
         else:
@@ -11,6 +11,8 @@ import plumeria.core
 from plumeria import config
 from plumeria.event import bus
 from plumeria.plugin import PluginFinder, PluginLoader
+from plumeria.util.executor import executors
+from plumeria.util.profile import StartupProfiler
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +34,12 @@ def main():
     parser.add_argument("--config", type=str, default="config.ini")
     parser.add_argument("--use-proactor", action='store_true', default=False,
                         help="use the proactor event loop if on Windows")
+    parser.add_argument("--profile-startup", action='store_true', default=False,
+                        help="report the import time, setup time and memory use of each plugin")
+    parser.add_argument("--profile-trace", type=str, default=None,
+                        help="also write the startup profile to this file in the Chrome trace format")
+    parser.add_argument("--profile-threshold", type=float, default=0.5,
+                        help="warn about plugins that take longer than this many seconds to load")
     args = parser.parse_args()
 
     if args.colors:
@@ -65,6 +73,7 @@ def main():
     sys.path.insert(0, plugins_dir)
 
     config.load()  # load list of plugins from config
+    loop.set_default_executor(executors.get("default"))
     finder = PluginFinder()
     finder.search_package("plumeria.core", plumeria.core.__path__)
     try:
@@ -76,8 +85,14 @@ def main():
     finder.from_config(config)
     config.save()  # save list of plugins
 
-    loader = PluginLoader(config)
+    profiler = StartupProfiler() if args.profile_startup or args.profile_trace else None
+    loader = PluginLoader(config, profiler=profiler)
     loader.load(finder.modules)
+    if profiler:
+        logger.info("Startup profile:\n" + profiler.report(threshold=args.profile_threshold))
+        if args.profile_trace:
+            profiler.write_trace(args.profile_trace)
+            logger.info("Wrote startup trace to {}".format(args.profile_trace))
     config.load()  # write new settings to config
     config.save()  # save final config
 
@@ -2,11 +2,13 @@ import argparse
 import logging
 from functools import wraps
 
+from plumeria import config
 from plumeria.command.exception import *
 from plumeria.command.manager import Command, Mapping, CommandManager, Context, CommandError
 from plumeria.command.parse import Parser
 from plumeria.event import bus
 from plumeria.message import Response
+from plumeria.metrics import metrics
 from plumeria.transaction import tx_log
 from plumeria.util.ratelimit import MessageTokenBucket, RateLimitExceeded
 
@@ -22,6 +24,22 @@ class ArgumentParser(argparse.ArgumentParser):
 
 commands = CommandManager(('+', '@', ';', '.', '!', '/'))
 global_tokens = MessageTokenBucket(20, 12, 8, 6, fill_rate=0.25)
+commands_executed = metrics.counter("commands_executed", "Number of commands run by users")
+
+max_cost = config.create("commands", "max_cost", type=float, fallback=10,
+                         comment="The total cost that a command, including everything it pipes to and any aliases "
+                                 "it uses, can add up to")
+max_depth = config.create("commands", "max_alias_depth", type=int, fallback=5,
+                          comment="How deeply aliases can call other aliases")
+timeout = config.create("commands", "timeout", type=float, fallback=60,
+                        comment="The number of seconds that a command can run for before it is stopped")
+time_cost = config.create("commands", "time_cost", type=float, fallback=0.5,
+                          comment="The cost added for each second that a command spends running, which counts "
+                                  "towards max_cost")
+config.add(max_cost)
+config.add(max_depth)
+config.add(timeout)
+config.add(time_cost)
 
 
 @bus.event("message")
@@ -33,7 +51,9 @@ async def on_message(message):
             logger.warning(str(e))
             return
 
-        response = await commands.execute(message, Context(), direct=True)
+        commands_executed.inc()
+        context = Context(max_cost=max_cost(), max_depth=max_depth(), timeout=timeout(), time_cost=time_cost())
+        response = await commands.execute(message, context, direct=True)
         if response:
             if not len(response.content) and not len(response.attachments) and not response.embed:
                 response = Response("\N{WARNING SIGN} Command returned empty text as a response.")
@@ -1,7 +1,7 @@
 """A collection of command-related exceptions."""
 
 __all__ = ('CommandError', 'ArgumentError', 'MissingArgumentError', 'UnusedArgumentsError', 'AuthorizationError',
-           'ComplexityError')
+           'ComplexityError', 'DeadlineExceededError')
 
 
 class CommandError(Exception):
@@ -26,3 +26,7 @@ class AuthorizationError(Exception):
 
 class ComplexityError(Exception):
     """Raised if a command is too complex to complete completely."""
+
+
+class DeadlineExceededError(ComplexityError):
+    """Raised if a command has run for longer than it is allowed to."""
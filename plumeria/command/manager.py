@@ -1,14 +1,18 @@
 """Classes to keep track of and dispatch commands."""
 
+import asyncio
 import inspect
 import logging
 import re
+import time
 from io import StringIO
 from typing import Dict, List, Sequence, Optional, Callable
 
 from plumeria.command.exception import *
 from plumeria.command.parse import Parser
-from plumeria.message import ProxyMessage, Response
+from plumeria.message import ProxyMessage, Response, ImageAttachment
+from plumeria.metrics import metrics
+from plumeria.util.executor import ExecutorFullError
 from plumeria.util.ratelimit import RateLimitExceeded
 
 __all__ = ('Command', 'CommandManager', 'split_piped', 'interpolate')
@@ -18,6 +22,11 @@ COMMAND_TOKENS_PATTERN = re.compile("[ \\r\\n\\t]")
 
 logger = logging.getLogger(__name__)
 
+command_seconds = metrics.histogram("command_seconds", "Time that each command took to run, for every stage of "
+                                                       "a chain of piped commands", labels=("command",))
+chain_seconds = metrics.histogram("command_chain_seconds", "Time that whole commands took, including every stage "
+                                                           "and aliases")
+
 
 def split_piped(s: str) -> List[str]:
     """
@@ -142,11 +151,14 @@ class Command:
         A long help version of the command, in restructuredText
     params : Optional[List[Parameter]]
         A list of parameters to use to parse arguments that are to be passed to the executor
+    name : Optional[str]
+        The first alias of the command, which is set once it is added to a manager
 
     """
 
     def __init__(self, executor, cost=1.0, category=None, description=None, help=None, params=None):
         self.executor = executor
+        self.name = None
         self.cost = cost
         self.category = category
         if description:
@@ -199,10 +211,12 @@ class Mapping:
 
 class Context:
     """
-    A context exists during the execution of a command or command chain. A context is currently
-    used to sum up the cost of executing the current command.
+    A context exists during the execution of a command or command chain, including any aliases
+    that it expands into. It keeps track of the cost of executing the command, how deeply
+    aliases have been nested and when the command has to finish by.
 
-    Instances of this class are created by the :class:`CommandManager`.
+    Instances of this class are created by whatever starts executing a command and are passed
+    on to anything it calls, such as aliases, so that the limits apply to the whole command.
 
     Attributes
     ----------
@@ -210,12 +224,24 @@ class Context:
         How much cost has been used up
     max_cost : float
         The maximum total cost of the command
+    depth : int
+        How many aliases deep the current command is
+    max_depth : int
+        The maximum depth that aliases can be nested
+    deadline : Optional[float]
+        The event loop time that the command has to finish by, or None
+    time_cost : float
+        How much cost each second that a command spends running uses up
 
     """
 
-    def __init__(self, max_cost=10):
+    def __init__(self, max_cost=10, max_depth=5, timeout=None, time_cost=0):
         self.total = 0
         self.max_cost = max_cost
+        self.depth = 0
+        self.max_depth = max_depth
+        self.deadline = asyncio.get_event_loop().time() + timeout if timeout else None
+        self.time_cost = time_cost
 
     def consume(self, cost: float):
         """
@@ -236,6 +262,64 @@ class Context:
             raise ComplexityError("{} + {} > {}".format(self.total, cost, self.max_cost))
         self.total += cost
 
+    def consume_time(self, seconds: float):
+        """
+        Add the cost of time spent running a command. This never raises an error because the time
+        has already been spent, but the next call to :meth:`consume` may.
+
+        Parameters
+        ----------
+        seconds : float
+            How long the command ran for
+
+        """
+        self.total += seconds * self.time_cost
+
+    def remaining(self) -> Optional[float]:
+        """
+        Get how much time the command has left.
+
+        Returns
+        -------
+        Optional[float]
+            The number of seconds left, or None if there is no deadline
+
+        Raises
+        ------
+        DeadlineExceededError
+            Raised if the deadline has already passed
+
+        """
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - asyncio.get_event_loop().time()
+        if remaining <= 0:
+            raise DeadlineExceededError()
+        return remaining
+
+    def nested(self) -> 'NestedContext':
+        """
+        Get a context manager to use while running a command inside another, such as the command
+        of an alias.
+
+        .. code-block: python
+
+            with context.nested():
+                await commands.execute(message, context, expect_prefix=False)
+
+        Returns
+        -------
+        NestedContext
+            The context manager
+
+        Raises
+        ------
+        ComplexityError
+            Raised when entered if commands are already nested as deeply as allowed
+
+        """
+        return NestedContext(self)
+
     def __str__(self):
         return str(self.__dict__)
 
@@ -243,6 +327,20 @@ class Context:
         return repr(self.__dict__)
 
 
+class NestedContext:
+    def __init__(self, context: Context):
+        self.context = context
+
+    def __enter__(self):
+        if self.context.depth >= self.context.max_depth:
+            raise ComplexityError("depth {} >= {}".format(self.context.depth, self.context.max_depth))
+        self.context.depth += 1
+        return self.context
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.context.depth -= 1
+
+
 class PrefixTree:
     """A simple trie to store the command hierarchy."""
 
@@ -266,6 +364,41 @@ class CommandManager:
         self.enumerators = []
         self.prefixes = prefixes
         self.parser = Parser()
+        self.version = 0
+        self.server_versions = {}
+
+    def get_mappings_version(self, server_id: Optional[str] = None):
+        """
+        Get a value that changes whenever the result of :meth:`get_mappings` for the server may
+        have changed, so that anything built from the mappings can be cached.
+
+        Parameters
+        ----------
+        server_id : Optional[str]
+            The server ID
+
+        Returns
+        -------
+        Hashable
+            The version
+
+        """
+        return self.version, self.server_versions.get(server_id, 0)
+
+    def invalidate_mappings(self, server_id: Optional[str] = None):
+        """
+        Mark the mappings as changed. Enumerators must call this when the mappings they return change.
+
+        Parameters
+        ----------
+        server_id : Optional[str]
+            The server ID whose mappings changed, or None if the mappings of every server changed
+
+        """
+        if server_id is None:
+            self.version += 1
+        else:
+            self.server_versions[server_id] = self.server_versions.get(server_id, 0) + 1
 
     async def get_mappings(self, server_id: Optional[str] = None) -> Sequence[Mapping]:
         """
@@ -300,6 +433,7 @@ class CommandManager:
             The supplied callable
 
         """
+        replaced = set()
         for alias in f.command_aliases:
             root = self.commands
             alias_lower = alias.lower()
@@ -310,13 +444,66 @@ class CommandManager:
                     root.children[prefix] = PrefixTree()
                 root = root.children[prefix]
             if root.content:
-                raise Exception("{} is already registered to {} -- cannot register to {}"
-                                .format(alias.lower(), root.content.executor, f))
+                if getattr(root.content, "placeholder", False):
+                    replaced.add(root.content)
+                else:
+                    raise Exception("{} is already registered to {} -- cannot register to {}"
+                                    .format(alias.lower(), root.content.executor, f))
             root.content = f.command
+        if replaced:
+            self.mappings = [mapping for mapping in self.mappings if mapping.command not in replaced]
+        if f.command.name is None:
+            f.command.name = f.command_aliases[0].lower()
         command_mapping = Mapping(f.command_aliases, f.command)
         self.mappings.append(command_mapping)
+        self.invalidate_mappings()
         return f
 
+    def add_placeholder(self, aliases: Sequence[str], command: Command):
+        """
+        Add a command that stands in for one that hasn't been loaded yet. It is replaced
+        when a command with the same aliases is added with :meth:`add`.
+
+        Parameters
+        ----------
+        aliases : Sequence[str]
+            The aliases of the command
+        command : :class:`Command`
+            The command, whose executor should load the real command and run it
+
+        """
+        command.placeholder = True
+
+        def f():
+            pass
+
+        f.command = command
+        f.command_aliases = aliases
+        self.add(f)
+
+    def get_command(self, alias: str) -> Optional[Command]:
+        """
+        Get the command registered to an alias.
+
+        Parameters
+        ----------
+        alias : str
+            The alias
+
+        Returns
+        -------
+        Optional[:class:`Command`]
+            The command, or None if there isn't one
+
+        """
+        root = self.commands
+        for name in alias.lower().split(" "):
+            if name in root.children:
+                root = root.children[name]
+            else:
+                return None
+        return root.content
+
     def create(self, *aliases: Sequence[str], **kwargs):
         """
         A decorator to create a new command. Command aliases are case-insensitive.
@@ -365,8 +552,13 @@ class CommandManager:
         return decorator
 
     def enumerator(self, f: Callable) -> Callable:
-        """Adds a new enumerator. Enumerators are used to fill out the help page."""
+        """
+        Adds a new enumerator. Enumerators are used to fill out the help page, and they must call
+        :meth:`invalidate_mappings` when the mappings that they return change.
+
+        """
         self.enumerators.append(f)
+        self.invalidate_mappings()
         return f
 
     def intercept(self, f: Callable) -> Callable:
@@ -442,6 +634,7 @@ class CommandManager:
         if root.content:
             command = root.content
             message.content = content
+            context.remaining()
             context.consume(command.cost)
 
             # parse parameters into arguments
@@ -450,7 +643,14 @@ class CommandManager:
             else:
                 args = {}
 
-            result = await command.executor(message, **args)
+            loop = asyncio.get_event_loop()
+            started = loop.time()
+            try:
+                result = await command.executor(message, **args)
+            finally:
+                elapsed = loop.time() - started
+                context.consume_time(elapsed)
+                command_seconds.labels(command.name).observe(elapsed)
             if result is None:
                 return Response()
             elif isinstance(result, Response):
@@ -490,12 +690,46 @@ class CommandManager:
         if not expect_prefix:
             return await self._execute_unprefixed(message, context)
 
+    async def _execute_chain(self, message, context: Context, direct: bool):
+        """Internal function to execute a chain of piped commands without handling any errors."""
+        input = None
+        for i, command in enumerate(split_piped(message.content)):
+            message = ProxyMessage(message)
+            if input:
+                command = command + " " + input.content
+                message.attachments = input.attachments
+                message.registers = input.registers
+                message.stack = input.stack
+            command = interpolate(command, message.registers)
+            message.content = command
+            message.direct = direct
+            input = await self._execute_prefixed(message, context, expect_prefix=False)
+            if input:  # if there is no command, it will be None
+                if not input.registers:
+                    input.registers = message.registers
+                if not input.stack:
+                    input.stack = message.stack
+            else:
+                if i != 0:
+                    raise CommandError("Command not found: `{}`".format(command))
+                else:
+                    break
+        # consecutive image filters only queue up their work, so run it all in one go here
+        if input:
+            for attachment in input.attachments:
+                if isinstance(attachment, ImageAttachment):
+                    await attachment.render()
+        return input
+
     async def execute(self, message, context, expect_prefix=True, direct=False):
         """
         Executes a command. The command may or may not have prefixes and there may actually be several
         commands being piped together.
 
-        All non-command error exceptions are wrapped by a :class:`CommandError`.
+        All non-command error exceptions are wrapped by a :class:`CommandError`. Errors are reported to
+        the user here unless the command is running inside another command (see :meth:`Context.nested`),
+        in which case they are raised so that the outermost command reports them once. The outermost
+        command is also cancelled if it runs past the deadline of the context.
 
         Parameters
         ----------
@@ -531,30 +765,15 @@ class CommandManager:
             if not found:
                 return
 
+        if context.depth:
+            # running inside another command, such as an alias, which handles the errors
+            return await self._execute_chain(message, context, direct)
+
+        started = time.perf_counter()
         try:
-            input = None
-            for i, command in enumerate(split_piped(message.content)):
-                message = ProxyMessage(message)
-                if input:
-                    command = command + " " + input.content
-                    message.attachments = input.attachments
-                    message.registers = input.registers
-                    message.stack = input.stack
-                command = interpolate(command, message.registers)
-                message.content = command
-                message.direct = direct
-                input = await self._execute_prefixed(message, context, expect_prefix=False)
-                if input:  # if there is no command, it will be None
-                    if not input.registers:
-                        input.registers = message.registers
-                    if not input.stack:
-                        input.stack = message.stack
-                else:
-                    if i != 0:
-                        raise CommandError("Command not found: `{}`".format(command))
-                    else:
-                        break
-            return input
+            return await asyncio.wait_for(self._execute_chain(message, context, direct), context.remaining())
+        except (asyncio.TimeoutError, DeadlineExceededError) as e:
+            await message.respond("\N{WARNING SIGN} Your command took too long and was stopped.")
         except AuthorizationError as e:
             err = str(e)
             if len(err):
@@ -567,6 +786,10 @@ class CommandManager:
             await message.respond("\N{WARNING SIGN} {}".format(str(e)))
         except RateLimitExceeded as e:
             await message.respond("\N{WARNING SIGN} Your command is hitting a rate limit. Try again later.")
+        except ExecutorFullError as e:
+            await message.respond("\N{WARNING SIGN} The bot is too busy to run that right now. Try again later.")
         except Exception as e:
             logger.warning("Command raised an exception for '{}'".format(message.content), exc_info=True)
             await message.respond("\N{WARNING SIGN} An unexpected error occurred.")
+        finally:
+            chain_seconds.observe(time.perf_counter() - started)
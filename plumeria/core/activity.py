@@ -1,27 +1,69 @@
 """Keeps track of who has spoken on a channel recently."""
 
 import asyncio
-from datetime import datetime, timedelta
+import heapq
+import itertools
+import time
+import weakref
+from datetime import datetime
 
 import cachetools
 
+from plumeria.core.history import history
 from plumeria.event import bus
 from plumeria.message import Message
 from plumeria.transport import Channel
 
+__requires__ = ['plumeria.core.history']
+
 
 class ActivityTracker:
-    """Keeps track of who has spoken recently in a channel."""
+    """
+    Keeps track of who has spoken recently in a channel.
+
+    Entries are kept in a heap ordered by when they were last seen, so expiring old entries and
+    enforcing the size limit only has to look at the front of it even when history that is older
+    than the current entries is fetched. Each channel has an index of its users so that looking up
+    a channel doesn't scan every other channel.
+
+    """
 
     def __init__(self, max_size=2000, ttl=60 * 30, fetch_limit=100):
+        self.max_size = max_size
         self.ttl = ttl
-        self.cache = cachetools.TTLCache(maxsize=max_size, ttl=ttl)
+        self.entries = {}  # (channel key, user ID) -> (last seen, user)
+        self.expiry = []  # heap of (last seen, tie breaker, key), with stale items left in until they reach the front
+        self.counter = itertools.count()
+        self.channels = {}  # channel key -> set of user IDs
         self.fetched_history = cachetools.LRUCache(maxsize=300)
         self.fetch_limit = fetch_limit
-        self.fetch_lock = asyncio.Lock()
-
-    def _is_loggable(self, dt):
-        return dt > datetime.now() - timedelta(seconds=self.ttl)
+        self.fetch_locks = weakref.WeakValueDictionary()
+
+    def _channel_key(self, channel: Channel):
+        return channel.transport.id, channel.server.id if channel.server else None, channel.id
+
+    def _remove(self, key):
+        del self.entries[key]
+        channel_key, user_id = key
+        users = self.channels[channel_key]
+        users.discard(user_id)
+        if not users:
+            del self.channels[channel_key]
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.expiry:
+            last_seen, _, key = self.expiry[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == last_seen:
+                if last_seen > cutoff and len(self.entries) <= self.max_size:
+                    break
+                self._remove(key)
+            heapq.heappop(self.expiry)
+
+    def _compact(self):
+        self.expiry = [(last_seen, next(self.counter), key) for key, (last_seen, user) in self.entries.items()]
+        heapq.heapify(self.expiry)
 
     def log(self, message: Message):
         if message.author == message.channel.transport.user:
@@ -30,25 +72,44 @@ class ActivityTracker:
         if not message.channel.multiple_participants:
             return
 
-        if not self._is_loggable(message.timestamp):
+        age = max(0, (datetime.now() - message.timestamp).total_seconds())
+        if age >= self.ttl:
             return
 
-        server_id = message.channel.server.id if message.channel.server else None
-        key = (message.channel.transport.id, server_id, message.channel.id, message.author.id)
-        self.cache[key] = message.author
-
-    async def get_recent_users(self, channel: Channel):
-        expected_key = (channel.transport.id, channel.server.id if channel.server else None, channel.id)
+        last_seen = time.monotonic() - age
+        channel_key = self._channel_key(message.channel)
+        key = (channel_key, message.author.id)
+        existing = self.entries.get(key)
+        if existing and existing[0] >= last_seen:
+            return
 
-        if expected_key not in self.fetched_history:
-            with await self.fetch_lock:
-                async for message in channel.get_history(limit=self.fetch_limit):
-                    self.log(message)
-                self.fetched_history[expected_key] = True
+        self.entries[key] = (last_seen, message.author)
+        heapq.heappush(self.expiry, (last_seen, next(self.counter), key))
+        if len(self.expiry) > 2 * max(len(self.entries), 100):
+            self._compact()
+        self.channels.setdefault(channel_key, set()).add(message.author.id)
+        self._expire()
 
+    async def get_recent_users(self, channel: Channel):
+        channel_key = self._channel_key(channel)
+
+        if channel_key not in self.fetched_history:
+            lock = self.fetch_locks.get(channel_key)
+            if lock is None:
+                lock = self.fetch_locks[channel_key] = asyncio.Lock()
+            with await lock:
+                if channel_key not in self.fetched_history:
+                    messages = await history.get_recent(channel, limit=self.fetch_limit)
+                    for message in reversed(messages):
+                        self.log(message)
+                    self.fetched_history[channel_key] = True
+
+        self._expire()
+        cutoff = time.monotonic() - self.ttl
         results = []
-        for key, user in self.cache.items():
-            if tuple(key[:3]) == expected_key:
+        for user_id in self.channels.get(channel_key, ()):
+            last_seen, user = self.entries[(channel_key, user_id)]
+            if last_seen > cutoff:
                 results.append(user)
 
         return results
@@ -3,7 +3,7 @@
 import io
 import json
 
-from plumeria.command import commands, Context, CommandError, channel_only
+from plumeria.command import commands, CommandError, channel_only
 from plumeria.event import bus
 from plumeria.message import ProxyMessage, Message, Response, MemoryAttachment
 from plumeria.perms import server_admins_only
@@ -118,14 +118,16 @@ async def setup():
             return []
 
     @commands.intercept
-    async def alias_listener(original, alias, depth):
+    async def alias_listener(original, alias, context):
         if not original.channel.is_private:  # public channels only
             alias = aliases.get(original.channel.server, alias)
             if alias:
                 message = ProxyMessage(original)
                 message.content = alias.command
                 message.registers['input'] = original
-                return await commands.execute(message, Context(), expect_prefix=False)
+                # the alias shares the cost, depth and deadline of the command that called it
+                with context.nested():
+                    return await commands.execute(message, context, expect_prefix=False)
         return False
 
     commands.add(alias)
@@ -2,7 +2,7 @@ import asyncio
 import logging
 from typing import Sequence
 
-from plumeria.command import Command, Mapping
+from plumeria.command import Command, Mapping, commands
 from plumeria.core.storage import pool, migrations
 from plumeria.transport import Server
 from plumeria.util.collections import tree
@@ -40,9 +40,11 @@ class AliasManager:
 
     def _put_alias(self, alias: Alias):
         self.aliases[alias.transport.lower()][alias.server.lower()][alias.alias.lower()] = alias
+        commands.invalidate_mappings(alias.server)
 
     def _delete_alias(self, alias: Alias):
         del self.aliases[alias.transport.lower()][alias.server.lower()][alias.alias.lower()]
+        commands.invalidate_mappings(alias.server)
 
     def get(self, server: Server, name: str) -> Alias:
         """Get a particular alias. Aliases for the server must have been previously loaded."""
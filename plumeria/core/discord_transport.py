@@ -5,6 +5,7 @@ import inspect
 import logging
 import os.path
 import re
+from collections import defaultdict
 from enum import Enum
 from typing import Sequence, Optional
 
@@ -115,10 +116,93 @@ class DiscordWrapper:
         return self.delegate.__eq__(other)
 
 
+class MemberIndex:
+    """
+    Indexes the members of servers by user ID and by lowercase name so that a user can be
+    found without scanning every member. Only servers added with :meth:`add_server` are indexed.
+
+    """
+
+    def __init__(self):
+        self.servers = {}  # server ID -> {user ID: (lowercase name, member)}
+        self.ids = defaultdict(dict)  # user ID -> {server ID: member}
+        self.names = defaultdict(dict)  # lowercase name -> {(server ID, user ID): member}
+
+    def is_indexed(self, server_id):
+        return server_id in self.servers
+
+    def add_server(self, server: _Server):
+        self.remove_server(server)
+        self.servers[server.id] = {}
+        for member in server.members:
+            self.add(member)
+
+    def remove_server(self, server: _Server):
+        members = self.servers.pop(server.id, None)
+        if members:
+            for user_id, (name, member) in members.items():
+                self._unindex(server.id, user_id, name)
+
+    def add(self, member: _Member):
+        members = self.servers.get(member.server.id)
+        if members is None:
+            return
+        self.remove(member)
+        name = member.name.lower()
+        members[member.id] = (name, member)
+        self.ids[member.id][member.server.id] = member
+        self.names[name][(member.server.id, member.id)] = member
+
+    def remove(self, member: _Member):
+        members = self.servers.get(member.server.id)
+        if members and member.id in members:
+            # the member object may have already been renamed, so use the name it was indexed under
+            name, _ = members.pop(member.id)
+            self._unindex(member.server.id, member.id, name)
+
+    def _unindex(self, server_id, user_id, name):
+        servers = self.ids[user_id]
+        servers.pop(server_id, None)
+        if not servers:
+            del self.ids[user_id]
+        members = self.names[name]
+        members.pop((server_id, user_id), None)
+        if not members:
+            del self.names[name]
+
+    def find(self, name_id, discrim=None, server_id=None):
+        """
+        Find members by user ID or case-insensitive name.
+
+        Parameters
+        ----------
+        name_id : str
+            The user ID or name
+        discrim : Optional[str]
+            The discriminator that the user must have, if any
+        server_id : Optional[str]
+            The server to search, or None to search every indexed server
+
+        Returns
+        -------
+        Iterable[:class:`discord.Member`]
+            The matching members, with matches by ID first
+
+        """
+        for members in (self.ids.get(name_id, {}).values(), self.names.get(name_id.lower(), {}).values()):
+            for member in members:
+                if server_id is not None and member.server.id != server_id:
+                    continue
+                if discrim and discrim != str(member.discriminator):
+                    continue
+                yield member
+
+
 class DiscordTransport(DiscordWrapper, Transport):
     def __init__(self, delegate):
         super().__init__(delegate, self)
         self.id = 'discord'
+        self.member_index = MemberIndex()
 
     def resolve_user(self, q, hint: Optional[Sequence[User]] = None, domain: Optional[Sequence[User]] = None):
         m = MENTION_RE.search(q)
@@ -133,6 +217,19 @@ class DiscordTransport(DiscordWrapper, Transport):
                     if name_id == str(user.id) or name_id.lower() == user.name.lower():
                         return user
 
+            # use the index when the search covers whole servers that have been indexed
+            if isinstance(domain, ChannelMembers) and domain.channel.server \
+                    and self.member_index.is_indexed(domain.channel.server.id):
+                for member in self.member_index.find(name_id, discrim, domain.channel.server.id):
+                    user = self._wrap(member)
+                    if user in domain:
+                        return user
+                return None
+            elif not domain and all(self.member_index.is_indexed(server.id) for server in self.delegate.servers):
+                for member in self.member_index.find(name_id, discrim):
+                    return self._wrap(member)
+                return None
+
             if not domain:
                 domain = self.get_all_members()
 
@@ -174,13 +271,7 @@ class DiscordChannel(DiscordWrapper, Channel):
 
     @property
     def members(self):
-        if self.is_private:
-            for user in self.recipients:
-                yield user
-        else:
-            for member in self.server.members:
-                if self.permissions_for(member).read_messages:
-                    yield member
+        return ChannelMembers(self)
 
     def get_history(self, limit=100):
         logs = self.transport.logs_from(self.delegate, limit=limit)
@@ -198,6 +289,28 @@ class DiscordChannel(DiscordWrapper, Channel):
         return HistoryWrapper()
 
 
+class ChannelMembers:
+    """The members that can read a channel, which can be iterated or checked for a user."""
+
+    def __init__(self, channel: DiscordChannel):
+        self.channel = channel
+
+    def __iter__(self):
+        if self.channel.is_private:
+            for user in self.channel.recipients:
+                yield user
+        else:
+            for member in self.channel.server.members:
+                if self.channel.permissions_for(member).read_messages:
+                    yield member
+
+    def __contains__(self, user):
+        if self.channel.is_private:
+            return user in self.channel.recipients
+        else:
+            return self.channel.permissions_for(user).read_messages
+
+
 class DiscordServer(DiscordWrapper, Server):
     async def create_custom_emoji(self, name, image):
         try:
@@ -256,6 +369,8 @@ def setup():
 
     @client.event
     async def on_ready():
+        for server in client.servers:
+            transport.member_index.add_server(server)
         logger.info("Discord logged in as {} ({})".format(client.user.name, client.user.id))
         await bus.post("transport.ready", transport)
         for server in transport.servers:
@@ -271,18 +386,30 @@ def setup():
 
     @client.event
     async def on_member_join(member):
+        transport.member_index.add(member)
         await bus.post("server.member.join", _wrap(member, transport))
 
     @client.event
     async def on_member_update(before, after):
+        transport.member_index.add(after)
         await bus.post("server.member.update", _wrap(before, transport), _wrap(after, transport))
 
+    @client.event
+    async def on_member_remove(member):
+        transport.member_index.remove(member)
+        await bus.post("server.member.remove", _wrap(member, transport))
+
+    @client.event
+    async def on_channel_create(channel):
+        await bus.post("channel.create", _wrap(channel, transport))
+
     @client.event
     async def on_channel_delete(channel):
         await bus.post("channel.delete", _wrap(channel, transport))
 
     @client.event
     async def on_server_join(server):
+        transport.member_index.add_server(server)
         wrapped = _wrap(server, transport)
         await bus.post("server.join", wrapped)
         await bus.post("server.ready", wrapped)
@@ -293,16 +420,19 @@ def setup():
 
     @client.event
     async def on_server_remove(server):
+        transport.member_index.remove_server(server)
         wrapped = _wrap(server, transport)
         await bus.post("server.unready", wrapped)
         await bus.post("server.remove", wrapped)
 
     @client.event
     async def on_server_available(server):
+        transport.member_index.add_server(server)
         await bus.post("server.available", _wrap(server, transport))
 
     @client.event
     async def on_server_unavailable(server):
+        transport.member_index.remove_server(server)
         await bus.post("server.unavailable", _wrap(server, transport))
 
     @client.event
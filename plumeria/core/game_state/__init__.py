@@ -0,0 +1,40 @@
+"""Keep the state of channel games like hangman and minesweeper across messages, and optionally restarts."""
+
+import logging
+
+from plumeria import config
+from plumeria.config import boolstr
+from plumeria.core.game_state.manager import GameStateManager
+from plumeria.core.game_state.storage import DatabaseGameStates
+
+logger = logging.getLogger(__name__)
+
+memory_budget = config.create("game_state", "memory_budget", type=int, fallback=4 * 1024 * 1024,
+                              comment="The approximate number of bytes of game states to keep in memory")
+ttl = config.create("game_state", "ttl", type=int, fallback=60 * 60 * 24,
+                    comment="The number of seconds that an untouched game is kept around")
+use_database = config.create("game_state", "database", type=boolstr, fallback="false",
+                             comment="Whether to also save game states to the database so that games survive "
+                                     "restarts, which needs the plumeria.core.storage plugin")
+
+# the configuration is loaded before plugins are imported, so the database is only a dependency if it is used
+if use_database():
+    __requires__ = ['plumeria.core.storage']
+
+game_states = GameStateManager()
+
+
+async def setup():
+    config.add(memory_budget)
+    config.add(ttl)
+    config.add(use_database)
+
+    game_states.memory.max_bytes = memory_budget()
+    game_states.ttl = ttl()
+
+    if use_database():
+        from plumeria.core.storage import pool, migrations
+
+        provider = DatabaseGameStates(pool, migrations)
+        await provider.initialize()
+        game_states.provider = provider
@@ -0,0 +1,168 @@
+"""Keep the compact state of channel games in memory with an optional persistent backing store."""
+
+import asyncio
+import sys
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+GameKey = Tuple[str, str, str]
+
+# rough size of an OrderedDict node plus the entry object, which we can't measure directly
+ENTRY_OVERHEAD = 200
+
+
+class GameStateProvider:
+    """
+    Persistent storage for game states. The default provider stores nothing, so states only
+    live in memory until they are evicted or the bot restarts.
+
+    """
+
+    async def get(self, game: str, key: GameKey) -> Tuple[bytes, float]:
+        raise KeyError()
+
+    async def put(self, game: str, key: GameKey, state: bytes, expires_at: float):
+        pass
+
+    async def remove(self, game: str, key: GameKey):
+        pass
+
+
+class Entry:
+    __slots__ = ('state', 'expires_at', 'size')
+
+    def __init__(self, state: bytes, expires_at: float, size: int):
+        self.state = state
+        self.expires_at = expires_at
+        self.size = size
+
+
+class MemoryGameStore:
+    """
+    A LRU store of packed game states that is bounded by the number of bytes held
+    rather than by the number of games.
+
+    Attributes
+    ----------
+    max_bytes : int
+        The approximate number of bytes the store may hold before evicting games
+    size : int
+        The approximate number of bytes currently held
+
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key) -> Optional[Entry]:
+        try:
+            entry = self.entries[key]
+        except KeyError:
+            return None
+        if entry.expires_at <= time.time():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, state: bytes, expires_at: float):
+        self.remove(key)
+        size = sys.getsizeof(state) + sum(sys.getsizeof(part) for part in key) + ENTRY_OVERHEAD
+        self.entries[key] = Entry(state, expires_at, size)
+        self.size += size
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry.size
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class GameStateManager:
+    """
+    Stores packed game states for each channel.
+
+    Games are kept in a memory-bounded store and written through to the provider, so games
+    that are evicted from memory (or lost on restart) are read back from the provider if one
+    has been set up. Games that haven't been touched for ``ttl`` seconds expire.
+
+    Commands that read a game, change it and save it again should hold :meth:`lock` for the
+    whole time, because :meth:`get` may wait on the provider and let another command for the
+    same channel read the old state in the meantime.
+
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024, ttl=60 * 60 * 24):
+        self.provider = GameStateProvider()
+        self.memory = MemoryGameStore(max_bytes)
+        self.ttl = ttl
+        self.locks = weakref.WeakValueDictionary()
+
+    def lock(self, game: str, key: GameKey) -> asyncio.Lock:
+        """
+        Get the lock for a game, which is kept for as long as something is using it.
+
+        Parameters
+        ----------
+        game : str
+            The name of the game (i.e. 'hangman')
+        key : Tuple[str, str, str]
+            The transport, server and channel IDs
+
+        Returns
+        -------
+        :class:`asyncio.Lock`
+            The lock, to be used with ``with await``
+
+        """
+        lock = self.locks.get((game,) + key)
+        if lock is None:
+            lock = self.locks[(game,) + key] = asyncio.Lock()
+        return lock
+
+    async def get(self, game: str, key: GameKey) -> Optional[bytes]:
+        """
+        Get the packed state of a game.
+
+        Parameters
+        ----------
+        game : str
+            The name of the game (i.e. 'hangman')
+        key : Tuple[str, str, str]
+            The transport, server and channel IDs
+
+        Returns
+        -------
+        Optional[bytes]
+            The packed state, or None if there is no game going on
+
+        """
+        entry = self.memory.get((game,) + key)
+        if entry:
+            return entry.state
+        try:
+            state, expires_at = await self.provider.get(game, key)
+        except KeyError:
+            return None
+        self.memory.put((game,) + key, state, expires_at)
+        return state
+
+    async def put(self, game: str, key: GameKey, state: bytes):
+        """Save the packed state of a game, which also resets its expiration time."""
+        expires_at = time.time() + self.ttl
+        self.memory.put((game,) + key, state, expires_at)
+        await self.provider.put(game, key, state, expires_at)
+
+    async def remove(self, game: str, key: GameKey):
+        """Remove the game, if it exists."""
+        self.memory.remove((game,) + key)
+        await self.provider.remove(game, key)
@@ -0,0 +1,18 @@
+CREATE TABLE game_states (
+  id         INT           NOT NULL AUTO_INCREMENT,
+  game       VARCHAR(50)   NOT NULL,
+  transport  VARCHAR(100)  NOT NULL,
+  server     VARCHAR(100)  NOT NULL,
+  channel    VARCHAR(100)  NOT NULL,
+  state      VARBINARY(4096) NOT NULL,
+  expires_at BIGINT        NOT NULL,
+  PRIMARY KEY (id)
+)
+  CHARACTER SET utf8mb4
+  COLLATE utf8mb4_unicode_ci;
+
+CREATE INDEX idx_game_states_expires_at
+  ON game_states (expires_at);
+
+ALTER TABLE game_states
+  ADD CONSTRAINT ux_game_states_keys UNIQUE (game, transport, server, channel);
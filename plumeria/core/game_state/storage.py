@@ -0,0 +1,59 @@
+"""Store game states into the database."""
+
+import logging
+import time
+from typing import Tuple
+
+from plumeria.core.game_state.manager import GameStateProvider, GameKey
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseGameStates(GameStateProvider):
+    def __init__(self, pool, migrations):
+        self.pool = pool
+        self.migrations = migrations
+
+    async def initialize(self):
+        await self.migrations.migrate("game_state", __name__)
+        await self.purge_expired()
+
+    async def purge_expired(self):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "DELETE FROM game_states "
+                    "WHERE expires_at <= %s",
+                    (int(time.time()),))
+
+    async def get(self, game: str, key: GameKey) -> Tuple[bytes, float]:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT state, expires_at "
+                    "FROM game_states "
+                    "WHERE game = %s AND transport = %s AND server = %s AND channel = %s AND expires_at > %s",
+                    (game,) + key + (int(time.time()),))
+                row = await cur.fetchone()
+                if row:
+                    return bytes(row[0]), row[1]
+                else:
+                    raise KeyError()
+
+    async def put(self, game: str, key: GameKey, state: bytes, expires_at: float):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "REPLACE INTO game_states "
+                    "(game, transport, server, channel, state, expires_at) "
+                    "VALUES "
+                    "(%s, %s, %s, %s, %s, %s)",
+                    (game,) + key + (state, int(expires_at)))
+
+    async def remove(self, game: str, key: GameKey):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "DELETE FROM game_states "
+                    "WHERE game = %s AND transport = %s AND server = %s AND channel = %s",
+                    (game,) + key)
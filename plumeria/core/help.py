@@ -1,12 +1,19 @@
 """Adds a help webpage and query functions for commands."""
 
 import collections
+import hashlib
 
 import io
 
+import cachetools
+from aiohttp import web
+
 from plumeria.command import commands
 from plumeria.message import Response, MemoryAttachment
 from plumeria.core.webserver import app, render_template
+from plumeria.util.executor import executors
+
+page_cache = cachetools.LRUCache(maxsize=100)  # server ID -> (mappings version, ETag, page)
 
 
 @commands.create('help', 'commands', category='Utility')
@@ -44,11 +51,7 @@ async def dump_commands(message):
     ])
 
 
-@app.route('/help/{server}')
-async def handle(request):
-    server_id = request.match_info['server']
-    if server_id == "private":
-        server_id = None
+async def render_help_page(server_id):
     categories = set()
     by_category = collections.defaultdict(lambda: [])
     mappings = sorted(await commands.get_mappings(server_id), key=lambda m: m.command.category or "")
@@ -56,7 +59,34 @@ async def handle(request):
         categories.add(mapping.command.category)
         by_category[mapping.command.category].append(mapping)
     categories = sorted(categories)
-    return render_template("help.html", commands=mappings, by_category=by_category, categories=categories)
+
+    def execute():
+        return render_template("help.html", commands=mappings, by_category=by_category, categories=categories)
+
+    return await executors.run("cpu", execute)
+
+
+async def get_help_page(server_id):
+    """Get the rendered help page and its ETag, which is only rendered again if the commands have changed."""
+    version = commands.get_mappings_version(server_id)
+    cached = page_cache.get(server_id)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+    page = (await render_help_page(server_id)).encode('utf-8')
+    etag = '"{}"'.format(hashlib.sha1(page).hexdigest())
+    page_cache[server_id] = (version, etag, page)
+    return etag, page
+
+
+@app.route('/help/{server}')
+async def handle(request):
+    server_id = request.match_info['server']
+    if server_id == "private":
+        server_id = None
+    etag, page = await get_help_page(server_id)
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={"ETag": etag})
+    return web.Response(headers={"Content-Type": "text/html", "ETag": etag}, body=page)
 
 
 def setup():
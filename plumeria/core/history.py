@@ -0,0 +1,152 @@
+"""Keeps the recent messages of channels so that plugins don't each have to fetch them."""
+
+import asyncio
+import collections
+import itertools
+from typing import List
+
+import cachetools
+
+from plumeria import config
+from plumeria.event import bus
+from plumeria.message import Message
+from plumeria.transport import Channel
+
+history_size = config.create("history", "size", type=int, fallback=100,
+                             comment="The number of recent messages to keep for each channel")
+
+max_channels = config.create("history", "max_channels", type=int, fallback=500,
+                             comment="The maximum number of channels to keep recent messages for")
+
+
+class ChannelHistory:
+    __slots__ = ('messages', 'complete', 'loading')
+
+    def __init__(self, size):
+        self.messages = collections.deque(maxlen=size)  # oldest first
+        self.complete = False
+        self.loading = None
+
+
+class HistoryService:
+    """
+    Keeps a buffer of the most recent messages in each channel, which is filled from the channel's
+    history the first time it's needed and then kept current from new messages.
+
+    """
+
+    def __init__(self, size=100, max_channels=500):
+        self.size = size
+        self.channels = cachetools.LRUCache(maxsize=max_channels)
+
+    def configure(self, size, max_channels):
+        self.size = size
+        self.channels = cachetools.LRUCache(maxsize=max_channels)
+
+    def _key(self, channel: Channel):
+        return channel.transport.id, channel.id
+
+    def _get(self, channel: Channel) -> ChannelHistory:
+        key = self._key(channel)
+        try:
+            return self.channels[key]
+        except KeyError:
+            entry = self.channels[key] = ChannelHistory(self.size)
+            return entry
+
+    def add(self, message: Message):
+        self._get(message.channel).messages.append(message)
+
+    def replace(self, message: Message):
+        entry = self.channels.get(self._key(message.channel))
+        if entry:
+            for i, existing in enumerate(entry.messages):
+                if existing.id == message.id:
+                    entry.messages[i] = message
+                    break
+
+    def remove(self, message: Message):
+        entry = self.channels.get(self._key(message.channel))
+        if entry:
+            for existing in entry.messages:
+                if existing.id == message.id:
+                    entry.messages.remove(existing)
+                    break
+
+    def remove_channel(self, channel: Channel):
+        self.channels.pop(self._key(channel), None)
+
+    async def _load(self, channel: Channel, entry: ChannelHistory):
+        try:
+            fetched = []
+            async for message in channel.get_history(limit=self.size):
+                fetched.append(message)
+            # keep the messages that came in while the history was being fetched
+            fetched_ids = set(message.id for message in fetched)
+            live = [message for message in entry.messages if message.id not in fetched_ids]
+            entry.messages.clear()
+            entry.messages.extend(reversed(fetched))
+            entry.messages.extend(live)
+            entry.complete = True
+        finally:
+            entry.loading = None
+
+    async def get_recent(self, channel: Channel, limit=100) -> List[Message]:
+        """
+        Get the most recent messages in a channel.
+
+        The channel's history is only fetched the first time, and requests for the same channel
+        that come in while it's being fetched wait for the same fetch.
+
+        Parameters
+        ----------
+        channel : :class:`Channel`
+            The channel
+        limit : int
+            The maximum number of messages to return
+
+        Returns
+        -------
+        List[:class:`Message`]
+            The messages, newest first
+
+        """
+        if limit > self.size:  # more than is kept, so there's no point keeping it
+            messages = []
+            async for message in channel.get_history(limit=limit):
+                messages.append(message)
+            return messages
+
+        entry = self._get(channel)
+        if not entry.complete:
+            if entry.loading is None:
+                entry.loading = asyncio.ensure_future(self._load(channel, entry))
+            await asyncio.shield(entry.loading)
+        return list(itertools.islice(reversed(entry.messages), limit))
+
+
+history = HistoryService()
+
+
+def setup():
+    config.add(history_size)
+    config.add(max_channels)
+
+    history.configure(history_size(), max_channels())
+
+    @bus.event("message")
+    @bus.event("self_message")
+    async def on_message(message):
+        history.add(message)
+
+    @bus.event("message.edit")
+    async def on_message_edit(before, after):
+        history.replace(after)
+
+    @bus.event("message.delete")
+    async def on_message_delete(message):
+        history.remove(message)
+
+    @bus.event("channel.delete")
+    async def on_channel_delete(channel):
+        history.remove_channel(channel)
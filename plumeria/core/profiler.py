@@ -0,0 +1,122 @@
+"""Find out what the bot is spending its time on while it is running."""
+
+import asyncio
+import io
+from hmac import compare_digest
+
+from aiohttp.web import Response, json_response
+
+from plumeria import config
+from plumeria.command import commands, CommandError, timeout as command_timeout
+from plumeria.command.parse import Float
+from plumeria.core.webserver import app
+from plumeria.event import bus
+from plumeria.message import Response as MessageResponse, MemoryAttachment
+from plumeria.perms import owners_only
+from plumeria.util.executor import executors
+from plumeria.util.profile import SamplingProfiler, LoopWatchdog
+
+__requires__ = ['plumeria.core.webserver']
+
+api_key = config.create("profiler", "key", fallback="",
+                        comment="A secret key to send in the X-Profiler-Key header to use /profiler/sample on the "
+                                "web server. The page is disabled if no key is set.")
+max_duration = config.create("profiler", "max_duration", type=float, fallback=30,
+                             comment="The maximum number of seconds that the profiler can be run for at once")
+sample_interval = config.create("profiler", "sample_interval", type=float, fallback=0.01,
+                                comment="The number of seconds between each sample taken by the profiler")
+slow_callback_threshold = config.create("profiler", "slow_callback_threshold", type=float, fallback=0.25,
+                                        comment="Log the stack of the event loop when it is blocked for longer than "
+                                                "this many seconds, or 0 to disable")
+
+lock = asyncio.Lock()
+
+
+async def sample(seconds: float) -> SamplingProfiler:
+    """
+    Run the sampling profiler for a while.
+
+    Parameters
+    ----------
+    seconds : float
+        How long to sample for, which is limited to the configured maximum
+
+    Returns
+    -------
+    :class:`SamplingProfiler`
+        The stopped profiler
+
+    Raises
+    ------
+    CommandError
+        Raised if the profiler is already running
+
+    """
+    if lock.locked():
+        raise CommandError("The profiler is already running.")
+    with await lock:
+        profiler = SamplingProfiler(interval=sample_interval())
+        profiler.start()
+        try:
+            await asyncio.sleep(min(seconds, max_duration()))
+        finally:
+            await executors.run("blocking_io", profiler.stop)
+        return profiler
+
+
+@commands.create('profile', category='Utility', params=[Float('seconds', fallback=10)])
+@owners_only
+async def profile(message, seconds):
+    """
+    Samples what every thread of the bot is doing for a number of seconds (10 by default) and
+    uploads the stacks in the collapsed format, which can be opened with speedscope or turned
+    into a flame graph with flamegraph.pl. The time is cut short to finish well before the
+    command would time out, if commands have a timeout.
+
+    Example::
+
+        /profile 30
+    """
+    if command_timeout():
+        # leave time to build and upload the result before the command deadline stops it
+        seconds = min(seconds, command_timeout() * 0.75)
+    profiler = await sample(seconds)
+    return MessageResponse("Took {} samples.".format(profiler.samples), attachments=[
+        MemoryAttachment(io.BytesIO(profiler.collapsed().encode('utf-8')), 'profile.folded', 'text/plain'),
+    ])
+
+
+@app.route('/profiler/sample')
+async def handle(request):
+    key = api_key()
+    if not key or not compare_digest(request.headers.get("X-Profiler-Key", ""), key):
+        return json_response(status=401, data={'error': 'bad API key'})
+
+    try:
+        seconds = float(request.GET.get("seconds", "10"))
+        if seconds <= 0:
+            raise ValueError("seconds out of bounds")
+    except ValueError:
+        return json_response(status=400, data={'error': 'seconds is not a valid number'})
+
+    try:
+        profiler = await sample(seconds)
+    except CommandError:
+        return json_response(status=409, data={'error': 'the profiler is already running'})
+
+    return Response(body=profiler.collapsed().encode('utf-8'), content_type="text/plain")
+
+
+def setup():
+    config.add(api_key)
+    config.add(max_duration)
+    config.add(sample_interval)
+    config.add(slow_callback_threshold)
+
+    commands.add(profile)
+    app.add(handle)
+
+    @bus.event('init')
+    async def init():
+        if slow_callback_threshold() > 0:
+            LoopWatchdog(asyncio.get_event_loop(), slow_callback_threshold()).start()
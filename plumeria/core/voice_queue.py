@@ -9,6 +9,7 @@ from sortedcontainers import SortedListWithKey
 from plumeria import config
 from plumeria.command import CommandError
 from plumeria.core.scoped_config import scoped_config
+from plumeria.metrics import metrics
 from plumeria.transport import Channel
 from plumeria.transport import Server
 
@@ -20,6 +21,9 @@ queue_size = config.create("voice_queue", "queue_size", type=int, fallback=10, s
                            comment="The number of entries that can be queued")
 queue_max = config.create("voice_queue", "queue_max", type=int, fallback=20,
                           comment="The maximum queue size that will be allowed")
+preload_count = config.create("voice_queue", "preload_count", type=int, fallback=1,
+                              comment="The number of upcoming entries to prepare ahead of time so that there is "
+                                      "less of a gap between entries")
 
 
 class EntryMeta:
@@ -45,21 +49,49 @@ class QueueEntry:
         self.priority = priority
         self.factory = factory
         self._player = None
-        self._attempted_factory = False
+        self._player_future = None
         self._started = False
         self.active = True
         self.meta = meta
 
     async def _get_player(self):
         if self._player is None:
-            self._player = await self.factory(self)
-            self._player.volume = self.queue.volume
+            # the player may already be in the process of being prepared
+            if self._player_future is None:
+                self._player_future = asyncio.ensure_future(self.factory(self))
+            player = await asyncio.shield(self._player_future)
+            if self._player is None:
+                self._player = player
+                self._player.volume = self.queue.volume
         return self._player
 
+    async def _prepare(self):
+        """Create the player ahead of time so that it is ready to go once the entry reaches the top."""
+        try:
+            await self._get_player()
+        except Exception as e:
+            log.debug("Failed to prepare player for {}".format(self.meta), exc_info=True)
+            return
+        if not self.active:  # removed from the queue while it was being prepared
+            self._release()
+
+    def _release(self):
+        """Clean up a prepared player that will never be started."""
+        self.active = False
+        if self._started or self._player is None:
+            return
+        process = getattr(self._player, 'process', None)
+        if process is not None:
+            try:
+                process.kill()
+            except Exception as e:
+                log.debug("Failed to kill unused player process", exc_info=True)
+
     async def _start(self) -> bool:
         if not self.active:
             return False
         try:
+            self._update_volume()
             if self._started:
                 (await self._get_player()).resume()
             else:
@@ -104,6 +136,7 @@ class Queue:
     def __init__(self):
         self.queue = SortedListWithKey(key=lambda item: item.priority, load=100)
         self.active = None
+        self.prepared = []
         self.loop = asyncio.get_event_loop()
         self._volume = 1
 
@@ -195,6 +228,23 @@ class Queue:
             except IndexError:
                 break  # no more entries!!
 
+        self._prepare_upcoming()
+
+    def _prepare_upcoming(self):
+        prepared = []
+        for entry in self.prepared:
+            if entry in self.queue:
+                prepared.append(entry)
+            else:
+                entry._release()
+
+        for entry in self.queue.islice(0, 1 + max(0, preload_count())):
+            if entry._player_future is None:
+                asyncio.ensure_future(entry._prepare())
+                prepared.append(entry)
+
+        self.prepared = prepared
+
     def handle_end(self, entry: QueueEntry):
         asyncio.run_coroutine_threadsafe(self._handle_end(entry), self.loop)
 
@@ -242,9 +292,12 @@ class QueueMap:
 
 
 queue_map = QueueMap()
+metrics.gauge("voice_queue_entries", "Number of entries in all voice queues",
+              lambda: sum(len(queue.queue) for queue in queue_map.map.values()))
 
 
 def setup():
     config.add(volume_default)
     config.add(queue_size)
     config.add(queue_max)
+    config.add(preload_count)
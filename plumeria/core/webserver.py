@@ -3,7 +3,7 @@
 import asyncio
 import os.path
 import sys
-from functools import wraps
+from functools import wraps, lru_cache
 
 from aiohttp import web
 from docutils.core import publish_parts
@@ -11,6 +11,7 @@ from jinja2 import Environment, PackageLoader
 
 from plumeria import config
 from plumeria.event import bus
+from plumeria.metrics import metrics
 
 webserver_host = config.create("webserver", "host",
                                fallback="localhost",
@@ -85,7 +86,14 @@ env = Environment(loader=PackageLoader('plumeria', 'templates'),
                   autoescape=True,
                   extensions=['jinja2.ext.autoescape'])
 
-env.filters['rst2html'] = lambda s: publish_parts(s, writer_name='html')['html_body']
+
+@lru_cache(maxsize=4096)
+def rst2html(s):
+    # docutils is slow and the same help text gets rendered on every help page
+    return publish_parts(s, writer_name='html')['html_body']
+
+
+env.filters['rst2html'] = rst2html
 
 
 app = Application()
@@ -95,11 +103,25 @@ def render_template(name, **params):
     return env.get_template(name).render(params)
 
 
+@app.route('/metrics')
+async def prometheus_metrics(request):
+    return web.Response(headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+                        body=metrics.to_prometheus().encode('utf-8'))
+
+
+@app.route('/metrics.json')
+async def json_metrics(request):
+    return web.json_response(metrics.snapshot())
+
+
 def setup():
     config.add(webserver_host)
     config.add(webserver_port)
     config.add(public_address)
 
+    app.add(prometheus_metrics)
+    app.add(json_metrics)
+
     @bus.event("init")
     async def init():
         await app.run(host=webserver_host(), port=webserver_port())
@@ -1,8 +1,14 @@
 import collections
 import logging
+import time
+
+from plumeria.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+handler_seconds = metrics.histogram("event_handler_seconds", "Time that event handlers took",
+                                    labels=("event", "handler"))
+
 __all__ = ('EventBus',)
 
 
@@ -29,6 +35,20 @@ class EventBus:
         """
         self.subscribers[event].add(handler)
 
+    def unsubscribe(self, event: str, handler: collections.Callable):
+        """
+        Remove a function as a handler of an event.
+
+        Parameters
+        ----------
+        event : str
+            The event name
+        handler : Callable
+            The function to remove
+
+        """
+        self.subscribers[event].discard(handler)
+
     def event(self, event):
         """
         Decorator to register events.
@@ -69,11 +89,15 @@ class EventBus:
 
         """
 
-        for handler in self.subscribers[event]:
+        for handler in list(self.subscribers[event]):  # handlers may subscribe others, i.e. by loading a plugin
+            started = time.perf_counter()
             try:
                 await handler(*args, **kwargs)
             except Exception:
                 logger.warning("Error thrown in event handler for event '{}'".format(event), exc_info=True)
+            finally:
+                name = "{}.{}".format(getattr(handler, "__module__", "?"), getattr(handler, "__qualname__", "?"))
+                handler_seconds.labels(event, name).observe(time.perf_counter() - started)
 
 
 bus = EventBus()
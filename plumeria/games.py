@@ -1,7 +1,8 @@
 import collections
-import asyncio
 from valve.source.a2s import ServerQuerier
 
+from plumeria.util.executor import executors
+
 ServerResponse = collections.namedtuple("ServerResponse", "info players")
 Player = collections.namedtuple("Player", "name duration score")
 
@@ -16,4 +17,4 @@ async def steam_query(address, timeout=2.):
                 players.append(Player(player.get("name"), player.get("duration"), player.get("score")))
         return ServerResponse(server_info, players)
 
-    return await asyncio.get_event_loop().run_in_executor(None, query)
+    return await executors.run("blocking_io", query)
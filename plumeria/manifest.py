@@ -0,0 +1,194 @@
+"""Cache what plugins register so that they can be loaded only once they are needed."""
+
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+from typing import Dict, List, Optional
+
+from plumeria.command import commands
+from plumeria.event import bus
+
+__all__ = ('PluginManifest', 'Registrations')
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def _module_files(path: str) -> List[str]:
+    spec = importlib.util.find_spec(path)
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        return []
+    if spec.submodule_search_locations:  # a package, so include every file in it
+        files = []
+        for location in spec.submodule_search_locations:
+            for root, dirs, names in os.walk(location):
+                dirs[:] = [d for d in dirs if d != '__pycache__']
+                files.extend(os.path.join(root, name) for name in names if name.endswith(".py"))
+        return sorted(files)
+    return [spec.origin]
+
+
+def _mtime(files):
+    return max((os.stat(file).st_mtime_ns for file in files), default=0)
+
+
+def _hash(files):
+    digest = hashlib.sha1()
+    for file in files:
+        with open(file, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _route_count():
+    # only look at the web server if it has already been imported by something else
+    webserver = sys.modules.get('plumeria.core.webserver')
+    return len(webserver.app.app.router.routes()) if webserver else 0
+
+
+class Registrations:
+    """
+    Records what a plugin registers while it is set up by comparing the registries before
+    and after.
+
+    """
+
+    def __init__(self):
+        self.mappings = set(commands.mappings)
+        self.subscribers = {event: set(handlers) for event, handlers in bus.subscribers.items()}
+        self.interceptors = len(commands.interceptors)
+        self.enumerators = len(commands.enumerators)
+        self.routes = _route_count()
+
+    def exclude(self, since: 'Registrations'):
+        """
+        Leave out everything registered after ``since`` was created, such as what a dependency
+        registered while it was loaded along with the plugin.
+
+        Parameters
+        ----------
+        since : Registrations
+            A snapshot taken before the registrations to leave out
+
+        """
+        self.mappings.update(mapping for mapping in commands.mappings if mapping not in since.mappings)
+        for event, handlers in bus.subscribers.items():
+            self.subscribers.setdefault(event, set()).update(handlers - since.subscribers.get(event, set()))
+        self.interceptors += len(commands.interceptors) - since.interceptors
+        self.enumerators += len(commands.enumerators) - since.enumerators
+        self.routes += _route_count() - since.routes
+
+    def to_entry(self) -> Dict:
+        """
+        Build a manifest entry for what has been registered since this was created.
+
+        Returns
+        -------
+        Dict
+            The entry, where ``lazy`` says whether the plugin can be loaded lazily
+
+        """
+        new_commands = []
+        for mapping in commands.mappings:
+            if mapping not in self.mappings:
+                command = mapping.command
+                new_commands.append({
+                    "aliases": list(mapping.aliases),
+                    "cost": command.cost,
+                    "category": command.category,
+                    "description": command.description,
+                    "help": command.help,
+                    "server_admins_only": command.server_admins_only,
+                    "owners_only": command.owners_only,
+                })
+
+        events = []
+        for event, handlers in bus.subscribers.items():
+            if handlers - self.subscribers.get(event, set()):
+                events.append(event)
+
+        # anything registered that can't be stood in for means that the plugin has to be loaded up front
+        other = len(commands.interceptors) != self.interceptors \
+                or len(commands.enumerators) != self.enumerators \
+                or _route_count() != self.routes
+
+        return {
+            "lazy": bool(new_commands) and not other,
+            "commands": new_commands,
+            "events": sorted(events),
+        }
+
+
+class PluginManifest:
+    """
+    A file that stores the commands and events that each plugin registers, along with the
+    modification time and hash of the plugin's files so that stale entries are ignored.
+
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data["plugins"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError):
+            logger.warning("The plugin manifest at {} could not be read and will be rebuilt".format(self.path),
+                           exc_info=True)
+
+    def save(self):
+        if not self.dirty:
+            return
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "plugins": self.entries}, f, indent=2, sort_keys=True)
+        self.dirty = False
+
+    def get(self, path: str) -> Optional[Dict]:
+        """
+        Get the entry for a plugin if its files haven't changed since it was stored.
+
+        Parameters
+        ----------
+        path : str
+            The module path of the plugin
+
+        Returns
+        -------
+        Optional[Dict]
+            The entry, or None if there is no current entry
+
+        """
+        entry = self.entries.get(path)
+        if not entry:
+            return None
+        files = _module_files(path)
+        if not files:
+            return None
+        mtime = _mtime(files)
+        if entry["mtime"] == mtime:
+            return entry
+        if entry["hash"] == _hash(files):  # touched but not changed
+            entry["mtime"] = mtime
+            self.dirty = True
+            return entry
+        return None
+
+    def put(self, path: str, entry: Dict):
+        files = _module_files(path)
+        if not files:
+            return
+        entry = dict(entry, mtime=_mtime(files), hash=_hash(files))
+        if self.entries.get(path) != entry:
+            self.entries[path] = entry
+            self.dirty = True
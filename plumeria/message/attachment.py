@@ -1,14 +1,17 @@
 """Classes representing attachments added on messages and responses."""
 
-import asyncio
-
 import io
 from typing import Awaitable
 
 from PIL import Image
 
+from plumeria.metrics import metrics
+from plumeria.util.executor import executors
 from plumeria.util.http import DefaultClientSession
 
+megapixels_processed = metrics.counter("image_megapixels_processed", "Megapixels of images that image filters "
+                                                                     "were run on")
+
 
 class Attachment:
     """
@@ -90,15 +93,57 @@ class URLAttachment:
 
 
 class ImageAttachment(Attachment):
-    """A PIL Image attachment."""
+    """
+    A PIL Image attachment.
+
+    Operations can be queued up on the image with :meth:`apply` so that several of them
+    (i.e. a chain of piped image filters) run together in one job on the executor. The
+    operations are run by :meth:`render`, or when the image is read.
+
+    """
 
     def __init__(self, image: Image, filename):
         self.image = image
+        self.operations = []
         self.filename = filename + ".png"
         self.mime_type = 'image/png'
 
+    def apply(self, operation):
+        """
+        Queue an operation to run on the image later.
+
+        Parameters
+        ----------
+        operation : Callable[[PIL.Image.Image], PIL.Image.Image]
+            A function that is given the image and returns the new image
+
+        """
+        self.operations.append(operation)
+
+    def _render(self):
+        operations, self.operations = self.operations, []
+        for operation in operations:
+            megapixels_processed.inc(self.image.size[0] * self.image.size[1] / 1e6)
+            self.image = operation(self.image)
+        return self.image
+
+    async def render(self) -> Awaitable[Image.Image]:
+        """
+        Run any queued operations.
+
+        Returns
+        -------
+        Awaitable[PIL.Image.Image]
+            The image after all operations have been applied
+
+        """
+        if len(self.operations):
+            await executors.run("cpu", self._render)
+        return self.image
+
     async def read(self):
         def execute():
+            self._render()
             out = io.BytesIO()
             if self.mime_type == 'image/jpeg':
                 self.image.save(out, 'jpeg')
@@ -106,7 +151,9 @@ class ImageAttachment(Attachment):
                 self.image.save(out, 'png')
             return out.getvalue()
 
-        return await asyncio.get_event_loop().run_in_executor(None, execute)
+        return await executors.run("cpu", execute)
 
     def copy(self):
-        return ImageAttachment(self.image.copy(), self.filename)
+        attachment = ImageAttachment(self.image.copy(), self.filename)
+        attachment.operations = list(self.operations)
+        return attachment
@@ -1,9 +1,8 @@
 """Utilities to fetch images from a message."""
 
-import asyncio
 import io
 import re
-from typing import Awaitable
+from typing import Awaitable, Optional, Tuple
 
 import PIL
 import aiohttp
@@ -13,28 +12,102 @@ from aiounfurl.views import fetch_all
 from plumeria.command import CommandError
 from plumeria.message import ImageAttachment, logger
 from plumeria.message import Message
+from plumeria.metrics import metrics
 from plumeria.service import locator
-from plumeria.util.http import DefaultClientSession
+from plumeria.util.executor import executors
+from plumeria.util.http import DefaultClientSession, bytes_downloaded
 
-CHUNK_SIZE = 1024
+CHUNK_SIZE = 1024 * 16
 MAX_SIZE = 1024 * 1024 * 6
 MAX_LENGTH = 4000
+HEADER_PROBE_SIZE = 1024 * 256
 IMAGE_LINK_PATTERN = re.compile("((https?)://[^\s/$.?#<>].[^\s<>]*)", re.I)
 
+megapixels_decoded = metrics.counter("image_megapixels_decoded", "Megapixels of images decoded from files")
+
+
+def check_dimensions(size: Tuple[int, int]):
+    width, height = size
+    if width > MAX_LENGTH or height > MAX_LENGTH:
+        raise CommandError("Image file is too big in dimensions.")
+
+
+def probe_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read the dimensions of an image from the start of its file, which only needs the header.
+
+    Returns
+    -------
+    Optional[Tuple[int, int]]
+        The width and height, or None if not enough of the file is available to tell
 
-async def fetch_image(url: str) -> Awaitable[PIL.Image.Image]:
+    """
+    try:
+        return Image.open(io.BytesIO(data)).size
+    except Exception:  # a truncated header fails in many different ways depending on the format
+        return None
+
+
+def decode_image(fp, size: Optional[Tuple[int, int]] = None, alpha=True) -> PIL.Image.Image:
+    """
+    Decode an image file, rejecting images that are too big.
+
+    Parameters
+    ----------
+    fp
+        A file object with the image
+    size : Optional[Tuple[int, int]]
+        If the image will be shrunk anyway, the smallest size that is needed, so that formats like
+        JPEG can be decoded at a reduced scale (the image may still be bigger than this)
+    alpha : bool
+        Whether the image should always be converted to RGBA, or can be left as RGB
+
+    Returns
+    -------
+    PIL.Image.Image
+        A PIL image
+
+    Raises
+    ------
+    :class:`CommandError`
+        Thrown if the image is too big in dimensions
+
+    """
+    im = Image.open(fp)
+    check_dimensions(im.size)
+    if size:
+        im.draft(im.mode, size)
+    if alpha:
+        if im.mode != "RGBA":
+            im = im.convert("RGBA")
+    elif im.mode not in ("RGB", "RGBA"):
+        im = im.convert("RGBA")
+    else:
+        im.load()
+    megapixels_decoded.inc(im.size[0] * im.size[1] / 1e6)
+    return im
+
+
+async def fetch_image(url: str, size: Optional[Tuple[int, int]] = None, alpha=True) -> Awaitable[ImageAttachment]:
     """
     Fetch the image from the given URL.
 
+    The dimensions of the image are checked as soon as its header has been downloaded, so
+    that images that are too big are rejected without downloading the rest.
+
     Parameters
     ----------
     url : str
         URL of the image
+    size : Optional[Tuple[int, int]]
+        The smallest size that is needed (see :func:`decode_image`)
+    alpha : bool
+        Whether the image needs an alpha channel (see :func:`decode_image`)
 
     Returns
     -------
-    Awaitable[PIL.Image.Image]
-        A PIL image
+    Awaitable[ImageAttachment]
+        An image attachment
 
     Raises
     ------
@@ -57,24 +130,27 @@ async def fetch_image(url: str) -> Awaitable[PIL.Image.Image]:
                     pass
 
                 buffer = io.BytesIO()
+                probing = True
                 while True:
                     chunk = await resp.content.read(CHUNK_SIZE)
                     if not chunk:
                         break
                     buffer.write(chunk)
+                    bytes_downloaded.inc(len(chunk))
                     if len(buffer.getbuffer()) > MAX_SIZE:
                         raise CommandError("Image file has too big of a file size.")
 
-        def execute():
-            im = Image.open(buffer)
-            width, height = im.size
-            if width > MAX_LENGTH or height > MAX_LENGTH:
-                raise CommandError("Image file is too big in dimensions.")
-            if im.format.upper() != "RGBA":
-                im = im.convert("RGBA")
-            return im
+                    # stop downloading early if the header says the image is too big
+                    if probing:
+                        dimensions = probe_dimensions(buffer.getvalue())
+                        if dimensions:
+                            check_dimensions(dimensions)
+                            probing = False
+                        elif len(buffer.getbuffer()) > HEADER_PROBE_SIZE:
+                            probing = False
 
-        im = await asyncio.get_event_loop().run_in_executor(None, execute)
+        buffer.seek(0)
+        im = await executors.run("cpu", decode_image, buffer, size, alpha)
 
         return ImageAttachment(im, url)
 
@@ -95,7 +171,8 @@ async def unfurl_image_url(url: str) -> Awaitable[str]:
         raise CommandError("Couldn't extract an image from the URL '{}'".format(url))
 
 
-async def read_image(message: Message) -> Awaitable[PIL.Image.Image]:
+async def read_image(message: Message, render=True, size: Optional[Tuple[int, int]] = None,
+                     alpha=True) -> Awaitable[ImageAttachment]:
     """
     Fetch the first image from the given message.
 
@@ -103,11 +180,17 @@ async def read_image(message: Message) -> Awaitable[PIL.Image.Image]:
     ----------
     message : :class:`plumeria.transport.Message`
         The message
+    render : bool
+        Whether to run operations that have been queued on the image (see :meth:`ImageAttachment.apply`)
+    size : Optional[Tuple[int, int]]
+        The smallest size that is needed if a new image has to be decoded (see :func:`decode_image`)
+    alpha : bool
+        Whether a newly decoded image needs an alpha channel (see :func:`decode_image`)
 
     Returns
     -------
-    Awaitable[PIL.Image.Image]
-        A PIL image
+    Awaitable[ImageAttachment]
+        An image attachment
 
     Raises
     ------
@@ -120,11 +203,12 @@ async def read_image(message: Message) -> Awaitable[PIL.Image.Image]:
     for attachment in message.attachments:
         try:
             if isinstance(attachment, ImageAttachment):
+                if render:
+                    await attachment.render()
                 return attachment
             elif attachment.mime_type.startswith("image/"):
-                im = Image.open(io.BytesIO(await attachment.read()))
-                if im.format.upper() != "RGBA":
-                    im = im.convert("RGBA")
+                buffer = io.BytesIO(await attachment.read())
+                im = await executors.run("cpu", decode_image, buffer, size, alpha)
                 return ImageAttachment(im, attachment.filename)
         except IOError as e:
             raise CommandError("Failed to read image from message.")
@@ -143,8 +227,8 @@ async def read_image(message: Message) -> Awaitable[PIL.Image.Image]:
             # hack to modify message because the URL appears in arguments
             message.content = message.content.replace(m.group(1), "", 1)
             try:
-                return await fetch_image(url)
+                return await fetch_image(url, size, alpha)
             except OSError as e:
-                return await fetch_image(await unfurl_image_url(url))
+                return await fetch_image(await unfurl_image_url(url), size, alpha)
 
     return None
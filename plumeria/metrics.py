@@ -0,0 +1,311 @@
+"""Runtime metrics that plugins update and that monitoring can read."""
+
+import collections
+import math
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+__all__ = ('Counter', 'Gauge', 'Histogram', 'MetricRegistry', 'metrics')
+
+ZERO_BUCKET = float('-inf')
+
+
+class Counter:
+    """
+    A count that only goes up, which also keeps a short history so that the recent rate per
+    second can be read.
+
+    """
+
+    def __init__(self, name: str, description: str, window=60):
+        self.name = name
+        self.description = description
+        self.window = window
+        self.value = 0
+        self.samples = collections.deque()  # (second, value at the start of that second)
+        self.lock = threading.Lock()  # some counters are increased from executor threads
+
+    def inc(self, amount=1):
+        now = int(time.monotonic())
+        with self.lock:
+            if not self.samples or self.samples[-1][0] != now:
+                self.samples.append((now, self.value))
+                while self.samples[0][0] < now - self.window:
+                    self.samples.popleft()
+            self.value += amount
+
+    def rate(self) -> float:
+        """Get the average number of increments per second over the window."""
+        now = time.monotonic()
+        for second, value in self.samples:
+            if second >= now - self.window:
+                return (self.value - value) / max(1.0, now - second)
+        return 0.0
+
+
+class Gauge:
+    """A value that can go up and down, which is either set directly or read from a function when needed."""
+
+    def __init__(self, name: str, description: str, func: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.description = description
+        self.func = func
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        if self.func:
+            return self.func()
+        return self._value
+
+
+class Histogram:
+    """
+    Records the distribution of values, like how long something took, so that percentiles can be
+    read.
+
+    Like an HDR histogram, buckets get wider as values get bigger so that every percentile is
+    within about 6% of the real value for any range of values, while only a few hundred counts
+    are stored. Values can be observed from any thread.
+
+    A histogram with labels has a child histogram for every combination of label values, which
+    are what should be observed.
+
+    """
+
+    SUB_BUCKETS = 16  # buckets for every power of two, which sets the precision
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def labels(self, *values) -> 'Histogram':
+        """
+        Get the histogram for some label values, creating it if needed.
+
+        Parameters
+        ----------
+        *values
+            A value for each label, in order
+
+        Returns
+        -------
+        :class:`Histogram`
+            The histogram to observe values with
+
+        """
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError("expected values for {}".format(self.label_names))
+            with self.lock:
+                child = self.children.setdefault(values, Histogram(self.name, self.description))
+        return child
+
+    def observe(self, value: float):
+        """
+        Record a value.
+
+        Parameters
+        ----------
+        value : float
+            The value, like a number of seconds
+
+        """
+        if value > 0:
+            mantissa, exponent = math.frexp(value)
+            index = exponent * self.SUB_BUCKETS + int((mantissa * 2 - 1) * self.SUB_BUCKETS)
+        else:
+            index = ZERO_BUCKET
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def _upper_bound(self, index):
+        if index == ZERO_BUCKET:
+            return 0.0
+        exponent, sub_bucket = divmod(index, self.SUB_BUCKETS)
+        return math.ldexp(0.5 + 0.5 * (sub_bucket + 1) / self.SUB_BUCKETS, exponent)
+
+    def percentile(self, quantile: float) -> float:
+        """
+        Estimate a percentile of the values.
+
+        Parameters
+        ----------
+        quantile : float
+            The percentile as a number between 0 and 1, such as 0.99
+
+        Returns
+        -------
+        float
+            The estimate, which is never more than the largest value, or 0 if there are no values
+
+        """
+        with self.lock:
+            counts = sorted(self.counts.items())
+            target = quantile * self.count
+        seen = 0
+        for index, count in counts:
+            seen += count
+            if seen >= target:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Get the count, sum, maximum and some percentiles of the values."""
+        values = collections.OrderedDict([("count", self.count), ("sum", self.sum), ("max", self.max)])
+        for quantile in self.QUANTILES:
+            values["p{:g}".format(quantile * 100)] = self.percentile(quantile)
+        return values
+
+    @property
+    def value(self):
+        if self.label_names:
+            return collections.OrderedDict((",".join(map(str, labels)), child.summary())
+                                           for labels, child in sorted(self.children.items()))
+        return self.summary()
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class MetricRegistry:
+    """Keeps track of all the metrics by name."""
+
+    def __init__(self):
+        self.metrics = collections.OrderedDict()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError("metric '{}' already exists as a {}".format(name, type(metric).__name__))
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        """
+        Get a counter, creating it if it doesn't exist yet.
+
+        Parameters
+        ----------
+        name : str
+            The name of the counter, like ``commands_executed``
+        description : str
+            A short description of what is counted
+
+        Returns
+        -------
+        :class:`Counter`
+            The counter
+
+        """
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+        """
+        Get a gauge, creating it if it doesn't exist yet.
+
+        Parameters
+        ----------
+        name : str
+            The name of the gauge, like ``event_loop_lag_seconds``
+        description : str
+            A short description of the value
+        func : Optional[Callable[[], float]]
+            A function to call to get the current value, if the gauge isn't set directly
+
+        Returns
+        -------
+        :class:`Gauge`
+            The gauge
+
+        """
+        gauge = self._get_or_create(Gauge, name, description)
+        if func:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = ()) -> Histogram:
+        """
+        Get a histogram, creating it if it doesn't exist yet.
+
+        Parameters
+        ----------
+        name : str
+            The name of the histogram, like ``command_seconds``
+        description : str
+            A short description of what is measured
+        labels : Sequence[str]
+            The names of the labels to split the values up by, like ``('command',)``
+
+        Returns
+        -------
+        :class:`Histogram`
+            The histogram
+
+        """
+        return self._get_or_create(Histogram, name, description, labels)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Get the current value of every metric, plus the rate per second of every counter."""
+        values = collections.OrderedDict()
+        for name, metric in self.metrics.items():
+            values[name] = metric.value
+            if isinstance(metric, Counter):
+                values[name + "_per_second"] = metric.rate()
+        return values
+
+    def to_prometheus(self) -> str:
+        """
+        Get every metric in the Prometheus text format. Histograms are written as summaries with
+        a few quantiles because their buckets vary.
+
+        Returns
+        -------
+        str
+            The metrics
+
+        """
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append("# HELP {} {}".format(name, metric.description))
+            if isinstance(metric, Histogram):
+                lines.append("# TYPE {} summary".format(name))
+                if metric.label_names:
+                    children = sorted(metric.children.items())
+                else:
+                    children = [((), metric)]
+                for values, child in children:
+                    labels = ['{}="{}"'.format(label, _escape_label(value))
+                              for label, value in zip(metric.label_names, values)]
+                    for quantile in child.QUANTILES:
+                        lines.append("{}{{{}}} {!r}".format(name, ",".join(labels + ['quantile="{}"'.format(quantile)]),
+                                                            child.percentile(quantile)))
+                    suffix = "{{{}}}".format(",".join(labels)) if labels else ""
+                    lines.append("{}_sum{} {!r}".format(name, suffix, child.sum))
+                    lines.append("{}_count{} {}".format(name, suffix, child.count))
+            else:
+                lines.append("# TYPE {} {}".format(name, "counter" if isinstance(metric, Counter) else "gauge"))
+                lines.append("{} {!r}".format(name, metric.value))
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricRegistry()
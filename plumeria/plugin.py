@@ -3,10 +3,17 @@ import importlib
 import inspect
 import logging
 import pkgutil
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
 from enum import Enum
 
 from plumeria import config
+from plumeria.command import commands, Command, CommandError
 from plumeria.config import boolstr, ManagedConfig
+from plumeria.event import bus
+from plumeria.manifest import PluginManifest, Registrations
+from plumeria.util.profile import StartupProfiler
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +21,16 @@ enable_new = config.create("plugin_loader", "enable-new-plugins", type=boolstr,
                            comment="Set true to automatically enable new detected plugins")
 config.add(enable_new)
 
+lazy_plugins = config.create("plugin_loader", "lazy", type=boolstr, fallback="false",
+                             comment="Set true to only import plugins when one of their commands or events is first "
+                                     "used. What each plugin registers is saved to a manifest the first time it is "
+                                     "loaded, so plugins are loaded normally until they have an entry.")
+config.add(lazy_plugins)
+
+manifest_path = config.create("plugin_loader", "manifest", fallback="plugin_manifest.json",
+                              comment="The file to keep the plugin manifest in if lazy loading is enabled")
+config.add(manifest_path)
+
 
 class PluginSetupError(Exception):
     """Raised when a plugin can't be enabled."""
@@ -39,8 +56,7 @@ class CircularDependencyError(PluginLoadError):
     """Raised when plugins require each other in a loop."""
 
     def __init__(self, path, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.path = path
+        super().__init__(path, *args, **kwargs)
 
 
 class PluginFinder:
@@ -86,18 +102,24 @@ class State(Enum):
     LOADING = 'loading'
     LOADED = 'loaded'
     FAILED = 'failed'
+    LAZY = 'lazy'
 
 
 class Plugin:
     def __init__(self, path):
         self.path = path
         self.state = State.PENDING
+        self.stubs = []  # (event, handler) pairs that load the plugin when a lazy plugin's event fires
 
 
 class PluginLoader:
-    def __init__(self, config):
+    def __init__(self, config, profiler=None):
         self.config = config
+        self.profiler = profiler  # type: StartupProfiler
         self.plugins = {}
+        self.manifest = None  # type: PluginManifest
+        self.lazy_lock = asyncio.Lock()
+        self.timings = defaultdict(float)
 
     def load(self, paths):
         paths_to_load = []
@@ -110,15 +132,204 @@ class PluginLoader:
                     self.plugins[path] = Plugin(path)
                     paths_to_load.append(path)
 
-        for path in paths_to_load:
-            try:
-                self._load(path)
-            except IndexError:
+        if lazy_plugins():
+            self.manifest = PluginManifest(manifest_path())
+            self.manifest.load()
+            for path in list(paths_to_load):
+                entry = self.manifest.get(path)
+                if entry and entry["lazy"]:
+                    self._defer(self.plugins[path], entry)
+                    paths_to_load.remove(path)
+
+        started = time.perf_counter()
+        for wave in self._plan(paths_to_load):
+            if self.manifest or self.profiler:
+                # what a plugin registers and the memory it uses are found by comparing before and
+                # after its setup, so setups can't overlap while either is being measured
+                for path in wave:
+                    self._load_wave([path])
+            else:
+                self._load_wave(wave)
+        self._log_timings(time.perf_counter() - started)
+
+        if self.manifest:
+            self.manifest.save()
+
+    def _plan(self, paths):
+        """
+        Group plugins into waves so that every plugin in a wave only requires plugins from
+        earlier waves.
+
+        Plugins that can't be imported or that require each other in a loop are still put into a
+        wave so that the error is reported when they are loaded.
+
+        Parameters
+        ----------
+        paths : Sequence[str]
+            The module paths of the plugins to load
+
+        Returns
+        -------
+        List[List[str]]
+            The waves in the order that they should be loaded
+
+        """
+        levels = {}
+        visiting = set()
+
+        def level(path):
+            if path in levels:
+                return levels[path]
+            plugin = self.plugins.get(path)
+            if plugin is None or plugin.state == State.LOADED or path in visiting:
+                return -1
+            visiting.add(path)
+            with self._measure(path, 'import'):
+                try:
+                    requires = getattr(importlib.import_module(path), "__requires__", ())
+                except Exception:
+                    requires = ()
+            levels[path] = 1 + max((level(dep) for dep in requires), default=-1)
+            visiting.discard(path)
+            return levels[path]
+
+        for path in paths:
+            level(path)
+
+        waves = defaultdict(list)
+        for path, value in levels.items():
+            waves[value].append(path)
+        return [waves[value] for value in sorted(waves)]
+
+    def _load_wave(self, paths):
+        """Load plugins that don't require each other, running their async setups concurrently."""
+        loop = asyncio.get_event_loop()
+        pending = [(path, self._load_steps(path), None, None) for path in paths]
+
+        while pending:
+            waiting = []
+            for path, steps, value, error in pending:
+                with self._measure(path, 'setup'):
+                    try:
+                        coro = steps.throw(error) if error else steps.send(value)
+                    except StopIteration:
+                        continue
+                    except (PluginLoadError, PluginSetupError):
+                        continue  # already logged
+                waiting.append((path, steps, self._timed(path, coro)))
+
+            if not waiting:
                 break
+
+            results = loop.run_until_complete(asyncio.gather(*(coro for _, _, coro in waiting),
+                                                             return_exceptions=True))
+            pending = []
+            for (path, steps, _), result in zip(waiting, results):
+                if isinstance(result, Exception):
+                    pending.append((path, steps, None, result))
+                else:
+                    pending.append((path, steps, result, None))
+
+    async def _timed(self, path, coro):
+        with self._measure(path, 'setup'):
+            return await coro
+
+    @contextmanager
+    def _measure(self, path, phase):
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                if self.profiler:
+                    stack.enter_context(self.profiler.measure(path, phase))
+                yield
+        finally:
+            self.timings[path] += time.perf_counter() - started
+
+    def _log_timings(self, elapsed):
+        if not self.timings or self.profiler:  # the profiler has its own, more detailed report
+            return
+        lines = ["{:>8.3f}s  {}".format(duration, path)
+                 for path, duration in sorted(self.timings.items(), key=lambda item: -item[1])]
+        logger.info("Loaded {} plugins in {:.3f}s ({:.3f}s spent in setup):\n{}"
+                    .format(len(self.timings), elapsed, sum(self.timings.values()), "\n".join(lines)))
+
+    def _defer(self, plugin: Plugin, entry):
+        """Register stand-ins for the commands and events of a plugin that load it when they are used."""
+        plugin.state = State.LAZY
+        for info in entry["commands"]:
+            commands.add_placeholder(info["aliases"], self._create_placeholder(plugin.path, info))
+        for event in entry["events"]:
+            handler = self._create_event_stub(plugin.path, event)
+            bus.subscribe(event, handler)
+            plugin.stubs.append((event, handler))
+
+    def _create_placeholder(self, path, info):
+        alias = info["aliases"][0]
+
+        async def executor(message):
+            try:
+                await self.load_async(path)
             except (PluginLoadError, PluginSetupError):
-                continue  # already logged
+                raise CommandError("The plugin for this command failed to load.")
+            command = commands.get_command(alias)
+            if command is None or getattr(command, "placeholder", False):
+                raise CommandError("The plugin for this command no longer provides it.")
+            if command.params:
+                args = commands.parser.parse(message.content, command.params)
+            else:
+                args = {}
+            return await command.executor(message, **args)
+
+        # only used for the help page, as the loaded command does its own checks
+        if info["server_admins_only"]:
+            executor.server_admins_only = True
+        if info["owners_only"]:
+            executor.owners_only = True
+
+        return Command(executor, cost=info["cost"], category=info["category"], description=info["description"],
+                       help=info["help"])
+
+    def _create_event_stub(self, path, event):
+        async def handler(*args, **kwargs):
+            before = set(bus.subscribers[event])
+            await self.load_async(path)
+            # the plugin's handlers were not subscribed when this event was posted
+            for new_handler in bus.subscribers[event] - before:
+                await new_handler(*args, **kwargs)
+
+        return handler
+
+    async def load_async(self, path: str):
+        """
+        Load a plugin while the event loop is running, which is how lazy plugins are loaded.
 
-    def _load(self, path: str):
+        Parameters
+        ----------
+        path : str
+            The module path of the plugin
+
+        """
+        with await self.lazy_lock:
+            steps = self._load_steps(path)
+            value, error = None, None
+            while True:
+                try:
+                    coro = steps.throw(error) if error else steps.send(value)
+                except StopIteration:
+                    break
+                try:
+                    value, error = await coro, None
+                except Exception as e:
+                    value, error = None, e
+            if self.manifest:
+                self.manifest.save()
+
+    def _load_steps(self, path: str):
+        """
+        Load a plugin, yielding the coroutine of any async setup() so that the caller can run it,
+        whether or not the event loop is running.
+
+        """
         try:
             plugin = self.plugins[path]
         except KeyError:
@@ -131,9 +342,15 @@ class PluginLoader:
         elif plugin.state == State.LOADED:
             return
 
+        for event, handler in plugin.stubs:
+            bus.unsubscribe(event, handler)
+        plugin.stubs = []
+
         plugin.state = State.LOADING
         logger.info("Loading {}...".format(plugin.path))
 
+        registrations = Registrations() if self.manifest else None
+
         try:
             module = importlib.import_module(path)
         except Exception as e:
@@ -145,11 +362,14 @@ class PluginLoader:
             # load dependencies
             if hasattr(module, "__requires__"):
                 for dep_path in module.__requires__:
-                    self._load(dep_path)
+                    before_dep = Registrations() if registrations else None
+                    yield from self._load_steps(dep_path)
+                    if registrations:
+                        registrations.exclude(before_dep)
 
             if hasattr(module, "setup"):
                 if inspect.iscoroutinefunction(module.setup):
-                    asyncio.get_event_loop().run_until_complete(module.setup())
+                    yield module.setup()
                 else:
                     module.setup()
             else:
@@ -159,6 +379,9 @@ class PluginLoader:
                                        "may be why you are getting this message.")
             plugin.state = State.LOADED
 
+            if registrations:
+                self.manifest.put(path, registrations.to_entry())
+
         except PluginDisabledError as e:
             plugin.state = State.FAILED
             logger.error("Failed to load '{path}' because it needs the plugin '{dep}' to be enabled"
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from ..core import activity
+from ..core.activity import ActivityTracker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def make_channel():
+    transport = SimpleNamespace(id="test", user=SimpleNamespace(id="bot"))
+    return SimpleNamespace(id="channel", server=SimpleNamespace(id="server"), transport=transport,
+                           multiple_participants=True)
+
+
+def message(channel, user_id, age):
+    return SimpleNamespace(channel=channel, author=SimpleNamespace(id=user_id),
+                           timestamp=datetime.now() - timedelta(seconds=age))
+
+
+def recent_user_ids(tracker, channel):
+    tracker.fetched_history[tracker._channel_key(channel)] = True
+    users = asyncio.get_event_loop().run_until_complete(tracker.get_recent_users(channel))
+    return {user.id for user in users}
+
+
+def test_backfilled_and_live_messages(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(activity, "time", clock)
+    channel = make_channel()
+    tracker = ActivityTracker(max_size=3, ttl=100)
+
+    tracker.log(message(channel, "a", 0))
+    tracker.log(message(channel, "b", 0))
+    # fetched history arrives after live messages and is older than them
+    tracker.log(message(channel, "c", 90))
+    tracker.log(message(channel, "d", 50))
+
+    # the size limit drops the user that was seen longest ago, not the newest
+    assert recent_user_ids(tracker, channel) == {"a", "b", "d"}
+
+    clock.now += 60
+    assert recent_user_ids(tracker, channel) == {"a", "b"}
+    assert len(tracker.entries) == 2
+
+    clock.now += 50
+    assert recent_user_ids(tracker, channel) == set()
+    assert not tracker.entries and not tracker.channels
+
+
+def test_seen_again_keeps_latest(monkeypatch):
+    monkeypatch.setattr(activity, "time", Clock())
+    channel = make_channel()
+    tracker = ActivityTracker(max_size=2, ttl=100)
+
+    for i in range(500):
+        tracker.log(message(channel, "a", 0))
+    tracker.log(message(channel, "a", 80))  # older history doesn't replace a newer entry
+    tracker.log(message(channel, "b", 10))
+    tracker.log(message(channel, "c", 20))
+
+    assert recent_user_ids(tracker, channel) == {"a", "b"}
+    assert len(tracker.expiry) <= 2 * 100 + 1
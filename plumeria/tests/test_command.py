@@ -0,0 +1,107 @@
+import asyncio
+
+from ..command.exception import CommandError
+from ..command.manager import CommandManager, Context
+from ..message import ProxyMessage, Response
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+        self.attachments = []
+        self.registers = {}
+        self.stack = []
+        self.responses = []
+
+    async def respond(self, content):
+        self.responses.append(content)
+
+
+def make_manager(aliases):
+    manager = CommandManager(("/",))
+
+    @manager.create("echo", cost=2)
+    async def echo(message):
+        return Response(message.content)
+
+    @manager.create("sleep", cost=0)
+    async def sleep(message):
+        await asyncio.sleep(float(message.content))
+        return Response("woke up")
+
+    @manager.create("fail")
+    async def fail(message):
+        raise CommandError("failed on purpose")
+
+    # works the same way as the listener of the alias plugin
+    @manager.intercept
+    async def alias_listener(original, alias, context):
+        if alias in aliases:
+            message = ProxyMessage(original)
+            message.content = aliases[alias]
+            with context.nested():
+                return await manager.execute(message, context, expect_prefix=False)
+        return False
+
+    manager.add(echo)
+    manager.add(sleep)
+    manager.add(fail)
+    return manager
+
+
+def run(manager, content, context):
+    message = FakeMessage(content)
+    response = asyncio.get_event_loop().run_until_complete(manager.execute(message, context))
+    return response, message.responses
+
+
+def test_alias_runs_command():
+    manager = make_manager({"hi": "echo hello"})
+    context = Context()
+    response, errors = run(manager, "/hi", context)
+    assert response.content == "hello"
+    assert errors == []
+    assert context.depth == 0
+
+
+def test_alias_depth_limit():
+    manager = make_manager({"loop": "loop"})
+    response, errors = run(manager, "/loop", Context(max_cost=100, max_depth=3))
+    assert response is None
+    assert errors == ["\N{WARNING SIGN} Your command was too complex to handle. Calm down."]
+
+
+def test_aliases_share_cost():
+    manager = make_manager({"twice": "echo a | echo", "four": "twice | twice"})
+    context = Context(max_cost=10)
+    response, errors = run(manager, "/twice", context)
+    assert response.content == "a"
+    assert context.total == 4
+
+    # each echo costs 2, so running four of them through nested aliases is still limited
+    response, errors = run(manager, "/four", Context(max_cost=6))
+    assert response is None
+    assert errors == ["\N{WARNING SIGN} Your command was too complex to handle. Calm down."]
+
+
+def test_deadline_cancels_alias():
+    manager = make_manager({"nap": "sleep 5"})
+    context = Context(timeout=0.1)
+    started = asyncio.get_event_loop().time()
+    response, errors = run(manager, "/nap", context)
+    assert asyncio.get_event_loop().time() - started < 1
+    assert response is None
+    assert errors == ["\N{WARNING SIGN} Your command took too long and was stopped."]
+
+
+def test_nested_error_reported_once():
+    manager = make_manager({"outer": "inner", "inner": "fail"})
+    context = Context()
+    response, errors = run(manager, "/outer", context)
+    assert response is None
+    assert errors == ["\N{WARNING SIGN} failed on purpose"]
+    assert context.depth == 0
+
+
+def test_context_repr():
+    assert repr(Context(max_cost=3)) == repr(Context(max_cost=3).__dict__)
@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+
+from ..util.executor import InstrumentedExecutor, ExecutorFullError
+
+
+def test_queue_limit():
+    executor = InstrumentedExecutor("test", max_workers=1, queue_size=2)
+    release = threading.Event()
+    futures = [executor.submit(release.wait) for _ in range(2)]
+    assert executor.pending == 2
+    with pytest.raises(ExecutorFullError):
+        executor.submit(release.wait)
+    release.set()
+    for future in futures:
+        future.result()
+    executor.shutdown()  # done callbacks can run just after result() returns
+    assert executor.pending == 0
+
+
+def test_cancelled_jobs_are_released():
+    executor = InstrumentedExecutor("test", max_workers=1, queue_size=2)
+    release = threading.Event()
+    running = executor.submit(release.wait)
+    queued = executor.submit(release.wait)
+    assert executor.pending == 2
+    assert queued.cancel()
+    assert executor.pending == 1
+    release.set()
+    running.result()
+    executor.shutdown()
+    assert executor.pending == 0
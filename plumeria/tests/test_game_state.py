@@ -0,0 +1,147 @@
+import asyncio
+import random
+
+import pytest
+from ..core.game_state.manager import MemoryGameStore, GameStateManager, GameStateProvider
+
+
+def test_memory_store_evicts_to_budget():
+    store = MemoryGameStore(max_bytes=2000)
+    for i in range(100):
+        store.put(("hangman", "t", "s", str(i)), b"x" * 100, float("inf"))
+    assert store.size <= 2000
+    assert store.get(("hangman", "t", "s", "99")).state == b"x" * 100
+    assert store.get(("hangman", "t", "s", "0")) is None
+
+
+def test_memory_store_expires():
+    store = MemoryGameStore(max_bytes=2000)
+    store.put(("hangman", "t", "s", "c"), b"x", 0)
+    assert store.get(("hangman", "t", "s", "c")) is None
+    assert store.size == 0
+
+
+class DictProvider(GameStateProvider):
+    def __init__(self):
+        self.states = {}
+
+    async def get(self, game, key):
+        return self.states[(game,) + key]
+
+    async def put(self, game, key, state, expires_at):
+        self.states[(game,) + key] = (state, expires_at)
+
+    async def remove(self, game, key):
+        self.states.pop((game,) + key, None)
+
+
+@pytest.mark.asyncio
+async def test_manager_reads_evicted_from_provider():
+    manager = GameStateManager(max_bytes=1)
+    manager.provider = DictProvider()
+    await manager.put("hangman", ("t", "s", "1"), b"first")
+    await manager.put("hangman", ("t", "s", "2"), b"second")
+    assert await manager.get("hangman", ("t", "s", "1")) == b"first"
+    await manager.remove("hangman", ("t", "s", "1"))
+    assert await manager.get("hangman", ("t", "s", "1")) is None
+
+
+class SlowProvider(DictProvider):
+    async def get(self, game, key):
+        state = await super().get(game, key)
+        await asyncio.sleep(0.01)
+        return state
+
+
+@pytest.mark.asyncio
+async def test_manager_lock_serializes_updates():
+    manager = GameStateManager()
+    manager.provider = SlowProvider()
+    key = ("t", "s", "c")
+    await manager.put("hangman", key, b"")
+    manager.memory.remove(("hangman",) + key)  # as if evicted, so reading it waits on the provider
+
+    async def append(letter):
+        with await manager.lock("hangman", key):
+            state = await manager.get("hangman", key)
+            await manager.put("hangman", key, state + letter)
+
+    await asyncio.gather(append(b"a"), append(b"b"), append(b"c"))
+    assert sorted(await manager.get("hangman", key)) == sorted(b"abc")
+    assert manager.lock("hangman", key) is not manager.lock("minesweeper", key)
+
+
+def hangman_slots(game):
+    return game.phrase, game.guessed, game.phrases_guessed, game.wrong_count
+
+
+def test_hangman_pack_round_trip():
+    hangman = pytest.importorskip("orchard.hangman")
+    fresh = hangman.Game("café crème")
+    in_progress = hangman.Game("hello world")
+    in_progress.guess("e")
+    in_progress.guess("z")
+    in_progress.guess("hello there")
+    won = hangman.Game("hello world")
+    won.guess("l")
+    won.guess("hello world")
+    lost = hangman.Game("hello world")
+    for letter in "abcfgi":
+        lost.guess(letter)
+
+    assert won.won and lost.lost
+    for game in (fresh, in_progress, won, lost):
+        unpacked = hangman.Game.unpack(game.pack())
+        assert hangman_slots(unpacked) == hangman_slots(game)
+        assert unpacked.obscured == game.obscured
+    assert hangman.Game.unpack(in_progress.pack()).phrases_guessed == ("HELLOTHERE",)
+
+
+@pytest.mark.parametrize("bits", [1, 2])
+def test_minesweeper_pack_bits(bits):
+    minesweeper = pytest.importorskip("orchard.minesweeper")
+    for count in range(18):
+        values = bytearray(i * 7 % (1 << bits) for i in range(count))
+        data = minesweeper.pack_bits(values, bits)
+        assert len(data) == (count * bits + 7) // 8
+        assert minesweeper.unpack_bits(data, bits, count) == values
+
+
+def minesweeper_slots(game):
+    return (game.width, game.height, game.bomb_map, game.play, game.state, game.remaining_unknown,
+            game.bomb_count)
+
+
+@pytest.mark.parametrize("width, height", [(3, 3), (5, 7), (12, 12), (1, 5)])
+def test_minesweeper_pack_round_trip(width, height):
+    minesweeper = pytest.importorskip("orchard.minesweeper")
+    rng = random.Random(width * 100 + height)
+    bomb_map = bytearray(rng.random() < 0.2 for i in range(width * height))
+    bomb_map[0] = 1
+    bomb_map[-1] = 0
+    bombs = [i for i, bomb in enumerate(bomb_map) if bomb]
+    safe = [i for i, bomb in enumerate(bomb_map) if not bomb]
+
+    def new_game():
+        return minesweeper.Game(width, height, bytearray(bomb_map), bytearray(width * height))
+
+    fresh = new_game()
+    in_progress = new_game()
+    in_progress.toggle_flag(bombs[0] % width, bombs[0] // width)
+    in_progress.click(safe[-1] % width, safe[-1] // width)
+    won = new_game()
+    for i in safe:
+        if won.state == minesweeper.State.IN_PLAY and won.play[i] == minesweeper.Play.UNKNOWN:
+            won.click(i % width, i // width)
+    lost = new_game()
+    lost.click(bombs[0] % width, bombs[0] // width)
+
+    assert won.state == minesweeper.State.WON
+    assert lost.state == minesweeper.State.LOST
+    for game in (fresh, in_progress, won, lost):
+        unpacked = minesweeper.Game.unpack(game.pack())
+        assert minesweeper_slots(unpacked) == minesweeper_slots(game)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,20 @@
+from ..util.hyperloglog import HyperLogLog
+
+
+def test_empty():
+    assert len(HyperLogLog()) == 0
+
+
+def test_duplicates_not_counted():
+    counter = HyperLogLog()
+    for i in range(100):
+        counter.add("user1")
+        counter.add("user2")
+    assert len(counter) == 2
+
+
+def test_estimate():
+    counter = HyperLogLog()
+    for i in range(20000):
+        counter.add(i)
+    assert 19000 < len(counter) < 21000
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+from PIL import Image
+from PIL import ImageDraw
+
+from ..util import image as effects
+
+pytest.importorskip("numpy")
+
+
+def random_color(rng, mode):
+    color = tuple(rng.randrange(256) for _ in range(len(mode)))
+    return color[0] if mode == "L" else color
+
+
+def random_image(rng, mode):
+    im = Image.new(mode, (rng.randrange(1, 300), rng.randrange(1, 600)), random_color(rng, mode))
+    draw = ImageDraw.Draw(im)
+    for i in range(rng.randrange(4)):
+        x, y = rng.randrange(im.width), rng.randrange(im.height)
+        draw.rectangle((x, y, x + rng.randrange(20), y + rng.randrange(20)), fill=random_color(rng, mode))
+    return im
+
+
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA"])
+def test_content_box_matches_pil(mode):
+    rng = random.Random(mode)
+    for i in range(100):
+        im = random_image(rng, mode)
+        for fuzz in (0, 50, 100):
+            assert effects.find_content_box(im, fuzz) == effects._find_content_box_pil(im, fuzz)
+
+
+@pytest.mark.parametrize("mode, color", [("L", 30), ("RGB", (1, 2, 3)), ("RGBA", (1, 2, 3, 0))])
+def test_blank_image(mode, color):
+    im = Image.new(mode, (40, 30), color)
+    assert effects.find_content_box(im) is None
+    assert effects._find_content_box_pil(im, 100) is None
+    assert effects.trim(im) is im
+
+
+def test_trim_rgba_ignores_color():
+    im = Image.new("RGBA", (40, 30), (0, 0, 0, 0))
+    im.paste((255, 255, 255, 0), (0, 0, 10, 10))  # invisible, so not content
+    im.paste((255, 0, 0, 255), (20, 5, 30, 15))
+    assert effects.trim(im).size == (10, 10)
+    assert effects.find_content_box(im) == effects._find_content_box_pil(im, 100) == (20, 5, 30, 15)
+
+
+def test_threshold():
+    im = Image.new("L", (2, 1))
+    im.putdata([99, 100])
+    result = effects.threshold(im, 100)
+    assert result.getpixel((0, 0)) == (0, 0, 0)
+    assert result.getpixel((1, 0)) == (255, 255, 255)
+
+
+def test_tint_keeps_alpha():
+    im = Image.new("RGBA", (1, 1), (0, 100, 200, 50))
+    assert effects.tint(im, (200, 100, 0), 0.5).getpixel((0, 0)) == (100, 100, 100, 50)
+
+
+def test_reorder_channels():
+    im = Image.new("RGBA", (1, 1), (1, 2, 3, 4))
+    assert effects.reorder_channels(im, "bgr").getpixel((0, 0)) == (3, 2, 1, 4)
+    with pytest.raises(ValueError):
+        effects.reorder_channels(im, "rg")
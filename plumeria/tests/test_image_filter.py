@@ -0,0 +1,151 @@
+import pytest
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageOps
+
+from ..command.exception import CommandError
+from ..command.manager import CommandManager, Context
+from ..message import ImageAttachment, Response
+from ..message.image import read_image
+from ..util.command import image_filter
+from ..util.executor import executors
+
+
+class FakeMessage:
+    def __init__(self, content, attachments):
+        self.content = content
+        self.attachments = attachments
+        self.registers = {}
+        self.stack = []
+        self.responses = []
+
+    async def respond(self, content):
+        self.responses.append(content)
+
+
+def make_image():
+    im = Image.new("RGBA", (40, 30), (10, 20, 30, 255))
+    draw = ImageDraw.Draw(im)
+    draw.rectangle((3, 4, 12, 20), fill=(200, 100, 50, 255))
+    return im
+
+
+def invert_image(im):
+    r, g, b, a = im.split()
+    return Image.merge("RGBA", ImageOps.invert(Image.merge("RGB", (r, g, b))).split() + (a,))
+
+
+def make_manager():
+    manager = CommandManager(("/",))
+
+    @manager.create("invert")
+    @image_filter
+    def invert(message, im):
+        return invert_image(im)
+
+    @manager.create("flip")
+    @image_filter
+    def flip(message, im):
+        return im.transpose(Image.FLIP_LEFT_RIGHT)
+
+    @manager.create("half")
+    @image_filter
+    def half(message, im):
+        return im.crop((0, 0, im.width // 2, im.height))
+
+    @manager.create("broken")
+    @image_filter
+    def broken(message, im):
+        raise CommandError("broken on purpose")
+
+    @manager.create("crash")
+    @image_filter
+    def crash(message, im):
+        raise ValueError("crashed on purpose")
+
+    @manager.create("size")
+    async def size(message):
+        attachment = await read_image(message)
+        return Response("{}x{}".format(*attachment.image.size))
+
+    for command in (invert, flip, half, broken, crash, size):
+        manager.add(command)
+    return manager
+
+
+async def run(manager, content, attachments):
+    message = FakeMessage(content, attachments)
+    response = await manager.execute(message, Context())
+    return response, message.responses
+
+
+@pytest.mark.asyncio
+async def test_piped_filters_match_separate_filters(monkeypatch):
+    manager = make_manager()
+    im = make_image()
+
+    jobs = []
+    original_run = executors.run
+
+    async def counting_run(name, func, *args):
+        jobs.append(name)
+        return await original_run(name, func, *args)
+
+    monkeypatch.setattr(executors, "run", counting_run)
+    piped, errors = await run(manager, "/invert | flip | half", [ImageAttachment(im.copy(), "test")])
+    assert errors == []
+    assert jobs == ["cpu"]  # the whole chain is rendered in one job
+
+    attachments = [ImageAttachment(im.copy(), "test")]
+    for command in ("/invert", "/flip", "/half"):
+        response, errors = await run(manager, command, attachments)
+        assert errors == []
+        attachments = response.attachments
+
+    expected = invert_image(im).transpose(Image.FLIP_LEFT_RIGHT).crop((0, 0, 20, 30))
+    assert piped.attachments[0].image.tobytes() == attachments[0].image.tobytes() == expected.tobytes()
+    assert piped.attachments[0].operations == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("command, error", [
+    ("/flip | broken | invert", "\N{WARNING SIGN} broken on purpose"),
+    ("/flip | crash | invert", "\N{WARNING SIGN} An unexpected error occurred."),
+])
+async def test_error_in_queued_filter_is_reported(command, error):
+    response, errors = await run(make_manager(), command, [ImageAttachment(make_image(), "test")])
+    assert response is None
+    assert errors == [error]
+
+
+@pytest.mark.asyncio
+async def test_read_image_renders_queued_filters():
+    response, errors = await run(make_manager(), "/half | half | size", [ImageAttachment(make_image(), "test")])
+    assert errors == []
+    assert response.content == "10x30"
+
+
+@pytest.mark.asyncio
+async def test_copy_keeps_queued_operations():
+    im = make_image()
+    attachment = ImageAttachment(im, "test")
+    attachment.apply(invert_image)
+
+    copy = attachment.copy()
+    assert copy.operations == [invert_image]
+    assert copy.operations is not attachment.operations
+
+    copy.apply(lambda im: im.transpose(Image.FLIP_LEFT_RIGHT))
+    assert attachment.operations == [invert_image]
+
+    await copy.render()
+    assert copy.image.tobytes() == invert_image(im).transpose(Image.FLIP_LEFT_RIGHT).tobytes()
+    assert attachment.operations == [invert_image]
+    assert attachment.image.tobytes() == im.tobytes()
+
+    await attachment.render()
+    assert attachment.image.tobytes() == invert_image(im).tobytes()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,88 @@
+import pkg_resources
+import pytest
+
+from ..util import markup
+from ..util.http import APIError
+from ..util.markup import strip_html, iter_elements, extract
+
+
+def read_data(name):
+    with pkg_resources.resource_stream(__name__, "data/" + name) as f:
+        return f.read().decode("utf-8")
+
+
+def test_strip_html():
+    assert strip_html("plain text") == "plain text"
+    assert strip_html("<b>bold</b> and <i>italic</i>") == "bold and italic"
+    assert strip_html("x &amp; y &lt;z&gt;") == "x & y <z>"
+    assert strip_html(" <i>spaced</i> ") == " spaced "
+
+
+def test_strip_html_nbsp_only():
+    assert strip_html("&nbsp;") == "\xa0"
+    assert strip_html(" &nbsp; ") == " \xa0 "
+
+
+def test_strip_html_unbalanced():
+    assert strip_html("a</div>b") == "ab"
+
+
+def test_iter_elements():
+    data = "<root><item id='1'><item id='nested'/></item><other/><item id='2'>text</item></root>"
+    ids = [element.get("id") for element in iter_elements(data, "item")]
+    assert ids == ["nested", "1", "2"]
+
+
+def test_iter_elements_declared_encoding():
+    data = "<?xml version='1.0' encoding='ISO-8859-1'?><root><item>caf\xe9</item></root>"
+    assert [element.text for element in iter_elements(data, "item")] == ["caf\xe9"]
+
+
+@pytest.mark.asyncio
+async def test_extract_cache_key():
+    calls = []
+
+    def count_items(data, tag):
+        calls.append((data, tag))
+        return data.count("<" + tag)
+
+    markup._cache.clear()
+    assert await extract(count_items, "<a/><a/><b/>", "a") == 2
+    assert await extract(count_items, "<a/><a/><b/>", "a") == 2
+    assert len(calls) == 1
+    # the same document as bytes is the same entry, but other arguments and documents aren't
+    assert await extract(count_items, b"<a/><a/><b/>", "a") == 2
+    assert len(calls) == 1
+    assert await extract(count_items, "<a/><a/><b/>", "b") == 1
+    assert await extract(count_items, "<a/><b/>", "a") == 1
+    assert len(calls) == 3
+    assert await extract(count_items, "<a/><b/>", "a", cache=False) == 1
+    assert len(calls) == 4
+
+
+def test_read_pods():
+    wolfram = pytest.importorskip("orchard.wolfram")
+    assert wolfram.read_pods(read_data("wolfram_pi.xml")) == [
+        ("Input", "Input", ["pi"]),
+        ("DecimalApproximation", "Decimal approximation",
+         ["3.1415926535897932384626433832795028841971693993751058209749445923..."]),
+        ("Property", "Property", ["pi is a transcendental number"]),
+    ]
+
+
+def test_read_profile():
+    utils = pytest.importorskip("orchard.steamid.utils")
+    profile = utils.read_profile(read_data("steam_profile.xml"))
+    assert profile.id.to_64() == 76561197960287930
+    assert profile.name == "Rabscuttle"
+    assert profile.state == "offline"
+    assert profile.privacy == "public"
+    assert profile.avatar.endswith("_full.jpg")
+    assert profile.vac_banned is False
+
+
+def test_read_profile_error():
+    utils = pytest.importorskip("orchard.steamid.utils")
+    with pytest.raises(APIError) as e:
+        utils.read_profile(read_data("steam_profile_error.xml"))
+    assert str(e.value) == "The specified profile could not be found."
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("discord")
+
+from ..core.discord_transport import MemberIndex, DiscordTransport
+
+
+def make_server(id, *members):
+    server = SimpleNamespace(id=id, members=[])
+    for user_id, name, discriminator in members:
+        server.members.append(make_member(server, user_id, name, discriminator))
+    return server
+
+
+def make_member(server, user_id, name, discriminator="0001"):
+    return SimpleNamespace(id=user_id, name=name, discriminator=discriminator, server=server)
+
+
+def ids(members):
+    return sorted((member.server.id, member.id) for member in members)
+
+
+def test_add_and_remove():
+    index = MemberIndex()
+    server = make_server("s1", ("1", "Alice", "0001"))
+    index.add_server(server)
+    assert ids(index.find("alice")) == [("s1", "1")]
+    assert ids(index.find("1")) == [("s1", "1")]
+
+    bob = make_member(server, "2", "Bob")
+    index.add(bob)
+    assert ids(index.find("BOB")) == [("s1", "2")]
+
+    index.remove(bob)
+    assert ids(index.find("bob")) == []
+    assert ids(index.find("2")) == []
+    assert "bob" not in index.names and "2" not in index.ids
+
+    index.remove_server(server)
+    assert not index.is_indexed("s1")
+    assert not index.names and not index.ids
+
+
+def test_members_of_servers_that_are_not_indexed_are_ignored():
+    index = MemberIndex()
+    index.add(make_member(make_server("s1"), "1", "Alice"))
+    assert ids(index.find("alice")) == []
+
+
+def test_rename_unindexes_old_name():
+    index = MemberIndex()
+    server = make_server("s1", ("1", "Alice", "0001"))
+    index.add_server(server)
+
+    # on_member_update adds the member object after the change, which replaces the old entry
+    after = make_member(server, "1", "Alicia")
+    index.add(after)
+    assert ids(index.find("alice")) == []
+    assert list(index.find("alicia")) == [after]
+    assert list(index.find("1")) == [after]
+    assert "alice" not in index.names
+
+
+def test_same_user_in_two_servers():
+    index = MemberIndex()
+    index.add_server(make_server("s1", ("1", "Alice", "0001")))
+    s2 = make_server("s2", ("1", "Alice", "0001"))
+    index.add_server(s2)
+    assert ids(index.find("alice")) == [("s1", "1"), ("s2", "1")]
+    assert ids(index.find("1")) == [("s1", "1"), ("s2", "1")]
+    assert ids(index.find("alice", server_id="s2")) == [("s2", "1")]
+
+    index.remove(s2.members[0])
+    assert ids(index.find("alice")) == [("s1", "1")]
+    assert ids(index.find("1")) == [("s1", "1")]
+
+
+def test_discriminator_filter():
+    index = MemberIndex()
+    index.add_server(make_server("s1", ("1", "Alice", "0001"), ("2", "Alice", "1234")))
+    assert ids(index.find("alice")) == [("s1", "1"), ("s1", "2")]
+    assert ids(index.find("alice", "1234")) == [("s1", "2")]
+    assert ids(index.find("alice", "9999")) == []
+
+
+class FakeClient:
+    def __init__(self, *servers):
+        self.servers = servers
+
+    def get_all_members(self):
+        for server in self.servers:
+            yield from server.members
+
+
+def test_resolve_user_scans_servers_that_are_not_indexed():
+    indexed = make_server("s1", ("1", "Alice", "0001"))
+    unindexed = make_server("s2", ("2", "Bob", "0002"))
+    transport = DiscordTransport(FakeClient(indexed, unindexed))
+    transport.member_index.add_server(indexed)
+    assert transport.member_index.is_indexed("s1")
+    assert not transport.member_index.is_indexed("s2")
+
+    # not every server is indexed, so every member is scanned
+    assert transport.resolve_user("Bob#0002") is unindexed.members[0]
+    assert transport.resolve_user("alice") is indexed.members[0]
+
+    # once every server is indexed, only the index is used
+    transport.member_index.add_server(unindexed)
+    unindexed.members.append(make_member(unindexed, "3", "Carol"))
+    assert transport.resolve_user("bob") is unindexed.members[0]
+    assert transport.resolve_user("carol") is None
+
+
+if __name__ == "__main__":
+    pytest.main()
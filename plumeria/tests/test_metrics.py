@@ -0,0 +1,29 @@
+from ..metrics import MetricRegistry
+
+
+def test_histogram_percentiles():
+    registry = MetricRegistry()
+    histogram = registry.histogram("test_seconds", "Test")
+    for i in range(1, 1001):
+        histogram.observe(i / 1000)
+    assert histogram.count == 1000
+    assert abs(histogram.percentile(0.5) - 0.5) < 0.5 * 0.07
+    assert abs(histogram.percentile(0.99) - 0.99) < 0.99 * 0.07
+    assert histogram.percentile(1) == 1
+
+
+def test_histogram_zero():
+    registry = MetricRegistry()
+    histogram = registry.histogram("test_seconds", "Test")
+    histogram.observe(0)
+    assert histogram.percentile(0.5) == 0
+
+
+def test_prometheus():
+    registry = MetricRegistry()
+    registry.counter("things", "Things").inc(3)
+    registry.histogram("test_seconds", "Test", labels=("command",)).labels('say "hi"').observe(2)
+    text = registry.to_prometheus()
+    assert "# TYPE things counter\nthings 3\n" in text
+    assert 'test_seconds{command="say \\"hi\\"",quantile="0.5"} 2' in text
+    assert 'test_seconds_count{command="say \\"hi\\""} 1' in text
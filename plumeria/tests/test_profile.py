@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import threading
+import time
+
+from ..util.profile import StartupProfiler, SamplingProfiler, LoopWatchdog
+
+
+def test_report_sorted():
+    profiler = StartupProfiler()
+    with profiler.measure("fast", "import"):
+        pass
+    with profiler.measure("slow", "import"):
+        time.sleep(0.01)
+    with profiler.measure("slow", "setup"):
+        pass
+    lines = profiler.report().splitlines()
+    assert lines[1].endswith("slow")
+    assert lines[2].endswith("fast")
+    assert lines[3].endswith("(total)")
+
+
+def test_trace():
+    profiler = StartupProfiler()
+    with profiler.measure("plugin", "import"):
+        pass
+    with profiler.measure("plugin", "setup"):
+        pass
+    events = profiler.to_trace()["traceEvents"]
+    assert [event["cat"] for event in events] == ["import", "setup"]
+    assert all(event["ph"] == "X" and event["name"] == "plugin" for event in events)
+
+
+def wait_in_known_function(event):
+    event.wait()
+
+
+def test_sampling_profiler_collapsed():
+    done = threading.Event()
+    thread = threading.Thread(target=wait_in_known_function, args=(done,), name="worker")
+    thread.start()
+    profiler = SamplingProfiler(interval=0.005)
+    profiler.start()
+    time.sleep(0.1)
+    profiler.stop()
+    done.set()
+    thread.join()
+
+    assert profiler.samples > 0
+    lines = profiler.collapsed().splitlines()
+    worker = [line for line in lines if line.startswith("worker;")]
+    assert worker
+    stack, count = worker[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert "wait_in_known_function (test_profile.py:" in stack
+    assert not any("sampling-profiler" in line for line in lines)
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+def test_watchdog_logs_blocked_loop(caplog):
+    loop = asyncio.new_event_loop()
+    watchdog = LoopWatchdog(loop, threshold=0.05)
+
+    async def run():
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        block_the_loop()
+        await asyncio.sleep(0.2)
+
+    with caplog.at_level(logging.WARNING, logger="plumeria.util.profile"):
+        try:
+            loop.run_until_complete(run())
+        finally:
+            watchdog.stop()
+            loop.close()
+
+    messages = [record.getMessage() for record in caplog.records]
+    blocked = [message for message in messages if message.startswith("The event loop has been blocked")]
+    assert len(blocked) == 1
+    assert "block_the_loop" in blocked[0]
+    assert any(message.startswith("The event loop was blocked for") for message in messages)
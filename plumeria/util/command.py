@@ -1,24 +1,33 @@
-import asyncio
+import functools
 
 from functools import wraps
 from plumeria.command import CommandError
 from plumeria.message import Response
 from plumeria.message.image import read_image
+from plumeria.util.executor import executors
 from plumeria.util.ratelimit import rate_limit
 
 
-def image_filter(f):
+def image_filter(f=None, *, size=None, alpha=True):
+    """
+    Turn a function that takes a message and a PIL image and returns a new image into a command.
+
+    Can be used with arguments to pass ``size`` and ``alpha`` on to :func:`read_image` when the filter
+    doesn't need a full size image or an alpha channel.
+
+    """
+    if f is None:
+        return functools.partial(image_filter, size=size, alpha=alpha)
+
     @wraps(f)
     @rate_limit(burst_size=2)
     async def wrapper(message):
-        attachment = await read_image(message)
+        attachment = await read_image(message, render=False, size=size, alpha=alpha)
         if not attachment:
             raise CommandError("No image is available to process.")
 
-        def execute():
-            attachment.image = f(message, attachment.image)
-
-        await asyncio.get_event_loop().run_in_executor(None, execute)
+        # the filter runs later so that a chain of filters can be run together in one job
+        attachment.apply(functools.partial(f, message))
         return Response("", [attachment])
 
     return wrapper
@@ -30,7 +39,7 @@ def string_filter(f):
         def execute():
             return f(message.content)
 
-        return Response(await asyncio.get_event_loop().run_in_executor(None, execute))
+        return Response(await executors.run("cpu", execute))
 
     return wrapper
 
@@ -0,0 +1,193 @@
+"""Thread pools for running blocking code, split up by the kind of work so that one kind can't starve another."""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from plumeria import config
+from plumeria.metrics import metrics
+
+__all__ = ('InstrumentedExecutor', 'ExecutorFullError', 'ExecutorRegistry', 'executors')
+
+queue_seconds = metrics.histogram("executor_queue_seconds", "Time that jobs waited for a free executor thread",
+                                  labels=("executor",))
+run_seconds = metrics.histogram("executor_run_seconds", "Time that jobs took to run on an executor thread",
+                                labels=("executor",))
+
+
+class ExecutorFullError(Exception):
+    """Raised when too many jobs are already waiting for an executor."""
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """
+    A thread pool that records how long jobs wait in the queue and how long they take to run,
+    which tells apart a pool that is too small from jobs that are slow.
+
+    If ``queue_size`` is set, jobs are rejected with :class:`ExecutorFullError` once that many
+    are waiting or running.
+
+    """
+
+    def __init__(self, name: str, max_workers=None, queue_size=0):
+        super().__init__(max_workers)
+        self.name = name
+        self.queue_size = queue_size
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+        self.queue_seconds = queue_seconds.labels(name)
+        self.run_seconds = run_seconds.labels(name)
+
+    def submit(self, fn, *args, **kwargs):
+        with self.pending_lock:
+            if self.queue_size and self.pending >= self.queue_size:
+                raise ExecutorFullError("The {} executor has too many jobs queued".format(self.name))
+            self.pending += 1
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            self.queue_seconds.observe(started - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.run_seconds.observe(time.perf_counter() - started)
+
+        def release(future):
+            with self.pending_lock:
+                self.pending -= 1
+
+        try:
+            future = super().submit(run)
+        except Exception:
+            release(None)
+            raise
+        # also called when a queued job is cancelled without ever running
+        future.add_done_callback(release)
+        return future
+
+
+class ExecutorRegistry:
+    """
+    Keeps named thread pools, which are created the first time that they are used so that their
+    settings have been loaded by then.
+
+    These pools are registered already:
+
+    * ``cpu`` for work that keeps the CPU busy, like image processing and parsing
+    * ``blocking_io`` for libraries that wait on the network or disk without asyncio support
+    * ``subprocess`` for waiting on other programs
+    * ``default``, which is also the event loop's default executor
+
+    """
+
+    def __init__(self):
+        self.specs = {}
+        self.executors = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, max_workers, queue_size=None):
+        """
+        Register a pool.
+
+        Parameters
+        ----------
+        name : str
+            The name of the pool
+        max_workers : Callable[[], int]
+            A function that returns the number of threads
+        queue_size : Optional[Callable[[], int]]
+            A function that returns how many jobs can be waiting or running before more are rejected,
+            where 0 means no limit
+
+        """
+        self.specs[name] = (max_workers, queue_size)
+        metrics.gauge("executor_{}_pending".format(name), "Jobs waiting or running on the {} executor".format(name),
+                      lambda: self.executors[name].pending if name in self.executors else 0)
+
+    def get(self, name: str) -> InstrumentedExecutor:
+        """
+        Get a pool by name.
+
+        Parameters
+        ----------
+        name : str
+            The name of the pool
+
+        Returns
+        -------
+        :class:`InstrumentedExecutor`
+            The pool
+
+        """
+        executor = self.executors.get(name)
+        if executor is None:
+            with self.lock:
+                executor = self.executors.get(name)
+                if executor is None:
+                    max_workers, queue_size = self.specs[name]
+                    executor = InstrumentedExecutor(name, max_workers(), queue_size() if queue_size else 0)
+                    self.executors[name] = executor
+        return executor
+
+    async def run(self, name: str, func, *args):
+        """
+        Run a function on a pool.
+
+        Parameters
+        ----------
+        name : str
+            The name of the pool
+        func : Callable
+            The function
+        *args
+            Arguments to call the function with
+
+        Returns
+        -------
+        Any
+            What the function returns
+
+        Raises
+        ------
+        ExecutorFullError
+            Raised if the pool has too many jobs already
+
+        """
+        return await asyncio.get_event_loop().run_in_executor(self.get(name), func, *args)
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+
+
+default_workers = config.create("executors", "default_workers", type=int, fallback=(os.cpu_count() or 1) * 5,
+                                comment="The number of threads for blocking work that doesn't use a specific pool")
+cpu_workers = config.create("executors", "cpu_workers", type=int, fallback=os.cpu_count() or 1,
+                            comment="The number of threads for CPU heavy work like image processing")
+cpu_queue = config.create("executors", "cpu_queue", type=int, fallback=64,
+                          comment="How many CPU heavy jobs can be waiting before more are turned away, or 0 for "
+                                  "no limit")
+blocking_io_workers = config.create("executors", "blocking_io_workers", type=int, fallback=16,
+                                    comment="The number of threads for network and disk work done with blocking "
+                                            "libraries, like game server queries")
+blocking_io_queue = config.create("executors", "blocking_io_queue", type=int, fallback=128,
+                                  comment="How many blocking IO jobs can be waiting before more are turned away, or "
+                                          "0 for no limit")
+subprocess_workers = config.create("executors", "subprocess_workers", type=int, fallback=4,
+                                   comment="The number of other programs that can be run at once")
+subprocess_queue = config.create("executors", "subprocess_queue", type=int, fallback=16,
+                                 comment="How many programs can be waiting to run before more are turned away, or 0 "
+                                         "for no limit")
+
+for setting in (default_workers, cpu_workers, cpu_queue, blocking_io_workers, blocking_io_queue, subprocess_workers,
+                subprocess_queue):
+    config.add(setting)
+
+executors = ExecutorRegistry()
+executors.register("default", default_workers)
+executors.register("cpu", cpu_workers, cpu_queue)
+executors.register("blocking_io", blocking_io_workers, blocking_io_queue)
+executors.register("subprocess", subprocess_workers, subprocess_queue)
@@ -1,11 +1,17 @@
 import json
+import time
 
 import aiohttp
 from aiohttp import TCPConnector
 from aiohttp.errors import ClientConnectionError
 
+from plumeria.metrics import metrics
 from plumeria.util.network import NameResolver
 
+request_seconds = metrics.histogram("http_request_seconds", "Time that HTTP requests to other servers took",
+                                    labels=("method",))
+bytes_downloaded = metrics.counter("http_bytes_downloaded", "Bytes of HTTP response bodies downloaded")
+
 
 class SelectiveConnector(TCPConnector):
     def __init__(self, *args, port_validator=None, **kwargs):
@@ -50,11 +56,16 @@ async def request(*args, require_success=True, **kwargs):
     if 'data' in kwargs:
         if isinstance(kwargs['data'], dict) or isinstance(kwargs['data'], list):
             kwargs['data'] = json.dumps(kwargs['data'])
-    with DefaultClientSession() as session:
-        async with session.request(*args, **kwargs) as resp:
-            if require_success and resp.status != 200:
-                raise BadStatusCodeError(resp.status, "HTTP code is not 200; got {}\n\nCONTENT: {}".format(resp.status, await resp.text()))
-            return Response(resp.status, await resp.text())
+    started = time.perf_counter()
+    try:
+        with DefaultClientSession() as session:
+            async with session.request(*args, **kwargs) as resp:
+                bytes_downloaded.inc(len(await resp.read()))  # text() reuses what has been read
+                if require_success and resp.status != 200:
+                    raise BadStatusCodeError(resp.status, "HTTP code is not 200; got {}\n\nCONTENT: {}".format(resp.status, await resp.text()))
+                return Response(resp.status, await resp.text())
+    finally:
+        request_seconds.labels(args[0].upper() if args else "?").observe(time.perf_counter() - started)
 
 
 async def get(*args, **kwargs):
@@ -77,11 +88,16 @@ class BaseRestClient:
         return json
 
     async def request(self, *args, **kwargs):
-        with self.session_cls() as session:
-            async with session.request(*args, **kwargs) as resp:
-                if resp.status != 200:
-                    raise APIError("HTTP code is not 200; got {}".format(resp.status))
-                return self.preprocess(await resp.json())
+        started = time.perf_counter()
+        try:
+            with self.session_cls() as session:
+                async with session.request(*args, **kwargs) as resp:
+                    if resp.status != 200:
+                        raise APIError("HTTP code is not 200; got {}".format(resp.status))
+                    bytes_downloaded.inc(len(await resp.read()))
+                    return self.preprocess(await resp.json())
+        finally:
+            request_seconds.labels(args[0].upper() if args else "?").observe(time.perf_counter() - started)
 
 
 class APIError(Exception):
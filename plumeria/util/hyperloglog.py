@@ -0,0 +1,51 @@
+import hashlib
+import math
+
+__all__ = ('HyperLogLog',)
+
+
+class HyperLogLog:
+    """
+    Estimates the number of unique values added to it using a small, fixed amount of memory.
+
+    With the default precision of 12, it uses 4 KB and the estimate is usually within a few
+    percent of the real count. Values can't be removed.
+
+    """
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self.alpha = 0.7213 / (1 + 1.079 / self.size)
+        self._estimate = 0
+
+    def add(self, value):
+        """
+        Add a value, which is converted to a string first.
+
+        Parameters
+        ----------
+        value
+            The value to add
+
+        """
+        digest = hashlib.sha1(str(value).encode('utf-8')).digest()
+        x = int.from_bytes(digest[:8], 'big')
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._estimate = None
+
+    def __len__(self):
+        if self._estimate is None:
+            estimate = self.alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+            zeros = self.registers.count(0)
+            if estimate <= 2.5 * self.size and zeros:
+                estimate = self.size * math.log(self.size / zeros)
+            self._estimate = int(round(estimate))
+        return self._estimate
@@ -0,0 +1,125 @@
+"""
+Image effects that avoid building full-size intermediate images.
+
+Finding the content box for trimming is done with NumPy, a strip of rows at a time, so the
+temporary arrays stay small. The other effects are lookup tables or a single paste, which PIL
+already does in one pass over the pixels. If NumPy isn't installed, trimming falls back to
+plain PIL operations that give the same result.
+
+"""
+
+from typing import Sequence, Tuple
+
+from PIL import Image
+from PIL import ImageChops
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STRIP_ROWS = 256
+
+
+def _find_content_box_pil(im: Image.Image, fuzz):
+    bg = Image.new(im.mode, im.size, im.getpixel((0, 0)))
+    diff = ImageChops.difference(im, bg)
+    diff = ImageChops.add(diff, diff, 2.0, -fuzz)
+    return diff.getbbox()
+
+
+def find_content_box(im: Image.Image, fuzz=100):
+    """
+    Find the bounding box of the pixels that differ from the top left pixel by more than
+    ``fuzz`` in any channel. Like :meth:`PIL.Image.Image.getbbox`, only the alpha channel is
+    compared for RGBA images.
+
+    Returns
+    -------
+    Optional[Tuple[int, int, int, int]]
+        The box, or None if the whole image is the same color
+
+    """
+    if np is None or im.mode not in ("L", "RGB", "RGBA"):
+        return _find_content_box_pil(im, fuzz)
+
+    width, height = im.size
+    reference = np.array(im.getpixel((0, 0)), dtype=np.int16).reshape(-1)
+    if im.mode == "RGBA":
+        reference = reference[3:]
+    bands = len(reference)
+    # compare whole rows at once against the reference color repeated for every pixel, which
+    # is much faster than broadcasting over the short channel axis
+    low = np.tile(np.clip(reference - fuzz, 0, 255).astype(np.uint8), width)
+    high = np.tile(np.clip(reference + fuzz, 0, 255).astype(np.uint8), width)
+    rows = np.zeros(height, dtype=bool)
+    columns = np.zeros(width * bands, dtype=bool)
+
+    for top in range(0, height, STRIP_ROWS):
+        bottom = min(top + STRIP_ROWS, height)
+        pixels = np.asarray(im.crop((0, top, width, bottom)))
+        if im.mode == "RGBA":
+            pixels = pixels[:, :, 3]
+        strip = pixels.reshape(bottom - top, width * bands)
+        differs = strip < low
+        differs |= strip > high
+        rows[top:bottom] = differs.any(axis=1)
+        columns |= differs.any(axis=0)
+
+    ys = np.flatnonzero(rows)
+    if not len(ys):
+        return None
+    xs = np.flatnonzero(columns.reshape(width, bands).any(axis=1))
+    return int(xs[0]), int(ys[0]), int(xs[-1]) + 1, int(ys[-1]) + 1
+
+
+def trim(im: Image.Image, fuzz=100) -> Image.Image:
+    """Crop away the border around the image that is the same color as the top left pixel."""
+    box = find_content_box(im, fuzz)
+    if box:
+        return im.crop(box)
+    else:
+        return im
+
+
+def replace_background(im: Image.Image, color: Tuple[int, int, int]) -> Image.Image:
+    """Put the image on top of a solid color, using its alpha channel as the mask."""
+    if im.mode != "RGBA":
+        im = im.convert("RGBA")
+    background = Image.new("RGBA", im.size, tuple(color) + (255,))
+    background.paste(im, (0, 0), im)
+    return background
+
+
+def threshold(im: Image.Image, level=128) -> Image.Image:
+    """Turn every pixel black or white depending on whether its brightness is below ``level``, without dithering."""
+    return im.convert("L").point([255 if v >= level else 0 for v in range(256)]).convert("RGB")
+
+
+def tint(im: Image.Image, color: Tuple[int, int, int], amount=0.5) -> Image.Image:
+    """Blend the color channels towards ``color`` by ``amount`` (between 0 and 1), keeping any alpha."""
+    if im.mode not in ("RGB", "RGBA"):
+        im = im.convert("RGBA")
+    table = []
+    for target in color:
+        table.extend(int(v + (target - v) * amount + 0.5) for v in range(256))
+    if im.mode == "RGBA":
+        table.extend(range(256))
+    return im.point(table)
+
+
+def reorder_channels(im: Image.Image, order: Sequence[str]) -> Image.Image:
+    """
+    Rearrange the color channels of the image, where ``order`` names the source channel for
+    each output channel (i.e. "BGR" swaps red and blue). Any alpha channel is kept as it is.
+
+    """
+    if im.mode not in ("RGB", "RGBA"):
+        im = im.convert("RGBA")
+    indexes = ["RGB".index(c) for c in order.upper()]
+    if len(indexes) != 3:
+        raise ValueError("expected three channels")
+    if im.mode == "RGBA":
+        indexes.append(3)
+    bands = im.split()
+    return Image.merge(im.mode, [bands[i] for i in indexes])
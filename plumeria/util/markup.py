@@ -0,0 +1,171 @@
+"""Parse HTML and XML responses away from the event loop."""
+
+import hashlib
+import io
+
+import cachetools
+import lxml.html
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from plumeria.util.executor import executors
+
+__all__ = ('parse_xml', 'parse_html', 'iter_elements', 'has_class', 'strip_html', 'extract')
+
+_cache = cachetools.LRUCache(maxsize=256)
+
+
+def _xml_parser(encoding):
+    # entities and DTDs are never needed from the APIs that are used and only make parsing slower
+    return etree.XMLParser(encoding=encoding, recover=True, resolve_entities=False, no_network=True)
+
+
+def _to_bytes(data):
+    if isinstance(data, str):
+        # the text was already decoded, so any encoding in the XML declaration is wrong now
+        return data.encode('utf-8'), 'utf-8'
+    return data, None
+
+
+def parse_xml(data):
+    """
+    Parse an XML document with lxml.
+
+    Parameters
+    ----------
+    data : Union[str, bytes]
+        The document
+
+    Returns
+    -------
+    :class:`lxml.etree._Element`
+        The root element, or None if the document is empty
+
+    """
+    data, encoding = _to_bytes(data)
+    return etree.fromstring(data, parser=_xml_parser(encoding))
+
+
+def parse_html(data):
+    """
+    Parse an HTML document with lxml, which is many times faster than BeautifulSoup with
+    ``html.parser``.
+
+    Parameters
+    ----------
+    data : Union[str, bytes]
+        The document
+
+    Returns
+    -------
+    :class:`lxml.html.HtmlElement`
+        The root element
+
+    """
+    return lxml.html.document_fromstring(data)
+
+
+def iter_elements(data, tag):
+    """
+    Parse an XML document incrementally, yielding each element with the given tag once it has
+    been read completely. Elements are cleared after they are yielded so that large documents
+    don't have to be kept in memory.
+
+    Parameters
+    ----------
+    data : Union[str, bytes]
+        The document
+    tag : str
+        The tag to find
+
+    """
+    data, encoding = _to_bytes(data)
+    for event, element in etree.iterparse(io.BytesIO(data), events=('end',), tag=tag, encoding=encoding,
+                                          recover=True, resolve_entities=False, no_network=True):
+        yield element
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def has_class(name):
+    """
+    Get an XPath predicate that matches elements with the given CSS class.
+
+    Parameters
+    ----------
+    name : str
+        The class name
+
+    Returns
+    -------
+    str
+        The predicate, such as ``[contains(...)]``
+
+    """
+    return "[contains(concat(' ', normalize-space(@class), ' '), ' {} ')]".format(name)
+
+
+def strip_html(s):
+    """
+    Get the text from a fragment of HTML.
+
+    Parameters
+    ----------
+    s : str
+        The HTML
+
+    Returns
+    -------
+    str
+        The text
+
+    """
+    if '<' not in s and '&' not in s:
+        return s
+    try:
+        # wrapped here rather than with create_parent, which drops leading whitespace and &nbsp;
+        return lxml.html.fragment_fromstring('<div>' + s + '</div>').text_content()
+    except (etree.ParserError, ValueError):
+        return BeautifulSoup(s, "html.parser").get_text()
+
+
+async def extract(f, data, *args, cache=True):
+    """
+    Run a function that parses a document and pulls out what is needed from it in a thread
+    so that the event loop isn't blocked while large documents are parsed.
+
+    The function should return plain values rather than elements so that the parsed tree can
+    be thrown away. Results are cached by the function and the contents of the document, so
+    they must not be modified by the caller.
+
+    Parameters
+    ----------
+    f : Callable
+        The function, which is called with the document and ``args``
+    data : Union[str, bytes]
+        The document
+    *args
+        Extra arguments to pass to the function
+    cache : bool
+        Whether to use and store a cached result
+
+    Returns
+    -------
+    Any
+        The result of the function
+
+    """
+    if cache:
+        digest = hashlib.sha1(data.encode('utf-8') if isinstance(data, str) else data).digest()
+        key = (f, digest, args)
+        try:
+            return _cache[key]
+        except KeyError:
+            pass
+
+    result = await executors.run("cpu", f, data, *args)
+
+    if cache:
+        _cache[key] = result
+    return result
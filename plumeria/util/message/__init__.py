@@ -1,6 +1,6 @@
 import re
 
-from bs4 import BeautifulSoup
+from plumeria.util.markup import strip_html
 
 MARKDOWN_CODE_BLOCK = re.compile("```(.*?)```", re.S)
 
@@ -10,7 +10,3 @@ def strip_markdown_code(s):
     if m:
         return m.group(1)
     return s
-
-
-def strip_html(s):
-    return BeautifulSoup(s, "html.parser").get_text()
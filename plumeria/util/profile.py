@@ -0,0 +1,251 @@
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import psutil
+
+__all__ = ('StartupProfiler', 'SamplingProfiler', 'LoopWatchdog')
+
+logger = logging.getLogger(__name__)
+
+
+class PluginProfile:
+    __slots__ = ('path', 'import_time', 'setup_time', 'rss_delta')
+
+    def __init__(self, path):
+        self.path = path
+        self.import_time = 0.0
+        self.setup_time = 0.0
+        self.rss_delta = 0
+
+    @property
+    def total_time(self):
+        return self.import_time + self.setup_time
+
+
+class StartupProfiler:
+    """
+    Records how long each plugin takes to import and set up and how much the resident memory
+    of the process grows while it does.
+
+    Imports are only charged to the first plugin that imports a module, so a plugin that
+    imports a large library that another plugin already imported will look cheap.
+
+    """
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.origin = time.perf_counter()
+        self.plugins = OrderedDict()
+        self.spans = []
+
+    def _rss(self):
+        try:
+            return self.process.memory_info().rss
+        except psutil.Error:
+            return 0
+
+    @contextmanager
+    def measure(self, path: str, phase: str):
+        """
+        Measure a phase of loading a plugin.
+
+        Parameters
+        ----------
+        path : str
+            The module path of the plugin
+        phase : str
+            Either 'import' or 'setup'
+
+        """
+        started = time.perf_counter()
+        rss = self._rss()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            rss_delta = self._rss() - rss
+            profile = self.plugins.get(path)
+            if profile is None:
+                profile = self.plugins[path] = PluginProfile(path)
+            if phase == 'import':
+                profile.import_time += duration
+            else:
+                profile.setup_time += duration
+            profile.rss_delta += rss_delta
+            self.spans.append((path, phase, started - self.origin, duration, rss_delta))
+
+    def report(self, threshold: float = None) -> str:
+        """
+        Build a table of the plugins sorted from slowest to fastest.
+
+        Parameters
+        ----------
+        threshold : Optional[float]
+            Log a warning for every plugin that took longer than this many seconds
+
+        Returns
+        -------
+        str
+            The report
+
+        """
+        profiles = sorted(self.plugins.values(), key=lambda profile: -profile.total_time)
+        lines = ["{:>10} {:>10} {:>10} {:>10}  {}".format("import", "setup", "total", "rss", "plugin")]
+        for profile in profiles:
+            lines.append("{:>9.1f}ms {:>8.1f}ms {:>8.1f}ms {:>8.1f}MB  {}".format(
+                profile.import_time * 1000, profile.setup_time * 1000, profile.total_time * 1000,
+                profile.rss_delta / 1024 / 1024, profile.path))
+            if threshold is not None and profile.total_time > threshold:
+                logger.warning("Plugin '{}' took {:.3f}s to load, which is more than {:.3f}s"
+                               .format(profile.path, profile.total_time, threshold))
+        lines.append("{:>9.1f}ms {:>8.1f}ms {:>8.1f}ms {:>8.1f}MB  (total)".format(
+            sum(p.import_time for p in profiles) * 1000, sum(p.setup_time for p in profiles) * 1000,
+            sum(p.total_time for p in profiles) * 1000, sum(p.rss_delta for p in profiles) / 1024 / 1024))
+        return "\n".join(lines)
+
+    def to_trace(self):
+        """
+        Build a trace in the Chrome trace event format, which can be opened in chrome://tracing
+        or Perfetto.
+
+        Returns
+        -------
+        Dict
+            The trace
+
+        """
+        pid = os.getpid()
+        events = []
+        for path, phase, start, duration, rss_delta in self.spans:
+            events.append({
+                "name": path,
+                "cat": phase,
+                "ph": "X",
+                "ts": int(start * 1e6),
+                "dur": int(duration * 1e6),
+                "pid": pid,
+                "tid": 0,
+                "args": {"rss_delta": rss_delta},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_trace(), f)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler that looks at the stack of every thread, including the event loop and
+    executor threads, at a regular interval from a background thread. Unlike cProfile, nothing is
+    done when functions are called, so it can be left running on a busy bot.
+
+    The result is in the collapsed stack format that flamegraph.pl and speedscope read, with the
+    name of the thread at the root of each stack.
+
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                self.stacks[";".join(label.replace(";", ":") for label in reversed(labels))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """
+        Get the sampled stacks in the collapsed stack format.
+
+        Returns
+        -------
+        str
+            One line per unique stack, with the number of times that it was seen
+
+        """
+        return "".join("{} {}\n".format(stack, count) for stack, count in self.stacks.most_common())
+
+
+class LoopWatchdog:
+    """
+    Logs the stack of the event loop thread whenever the loop stops running callbacks for longer
+    than a threshold, which is when some code is blocking it.
+
+    The loop updates a timestamp on a timer and a background thread checks it, so the stack is
+    taken while the loop is still blocked rather than after the callback returns.
+
+    """
+
+    def __init__(self, loop, threshold: float):
+        self.loop = loop
+        self.threshold = threshold
+        self.last_beat = time.monotonic()
+        self.loop_ident = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.loop.call_soon(self._beat)
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _beat(self):
+        self.loop_ident = threading.get_ident()
+        self.last_beat = time.monotonic()
+        if not self._stop.is_set():
+            self.loop.call_later(self.threshold / 4, self._beat)
+
+    def _run(self):
+        stalled_since = None
+        while not self._stop.wait(self.threshold / 4):
+            last_beat = self.last_beat
+            blocked = time.monotonic() - last_beat
+            if blocked > self.threshold:
+                if stalled_since != last_beat:  # only log each stall once
+                    stalled_since = last_beat
+                    frame = sys._current_frames().get(self.loop_ident)
+                    stack = "".join(traceback.format_stack(frame)) if frame else "(unknown)\n"
+                    logger.warning("The event loop has been blocked for {:.3f}s, currently at:\n{}"
+                                   .format(blocked, stack))
+            elif stalled_since is not None:
+                logger.warning("The event loop was blocked for {:.3f}s in total".format(last_beat - stalled_since))
+                stalled_since = None
+